@@ -0,0 +1,711 @@
+# Author: Brandon Wang
+#
+# Benchmarks for the SMPL compiler on large generated programs
+#   python benchmark.py [section ...]
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from instructions import CompactInstructionList, InstructionList
+from op_codes import OP
+from blocks import BlockNode
+from copy_propagation import CopyPropagation
+from dce import DeadCodeElimination
+from gvn import GlobalValueNumbering
+from induction import StrengthReduction
+from licm import LoopInvariantCodeMotion
+from pre import LazyCodeMotion
+from sccp import ConstantPropagation
+from smpl_parser import Parser
+from tokenizer import Tokenizer
+
+
+# Generate a random (but valid) SMPL program with roughly { statements } statements
+def GenerateProgram(statements, num_vars=26, seed=0) -> str:
+    rng = random.Random(seed)
+    names = ["v" + str(i) for i in range(num_vars)]
+    lines = ["main", "var " + ", ".join(names) + ";", "{"]
+    for name in names:
+        lines.append("    let " + name + " <- call InputNum();")
+    for _ in range(statements):
+        a, b, c = rng.choice(names), rng.choice(names), rng.choice(names)
+        kind = rng.random()
+        if kind < 0.7:
+            lines.append("    let %s <- %s + %s * %d;" % (a, b, c, rng.randint(1, 99)))
+        elif kind < 0.9:
+            lines.append("    if %s < %s then let %s <- %s - 1 else let %s <- %s + 1 fi;" % (a, b, c, c, c, b))
+        else:
+            lines.append("    while %s < %d do let %s <- %s + 1 od;" % (a, rng.randint(1, 99), a, a))
+    lines.append("    call OutputNum(" + names[0] + ")")
+    lines.append("}.")
+    return "\n".join(lines) + "\n"
+
+
+# Generate { count } blocks of if statements nested { depth } deep over { num_vars } variables
+def GenerateNested(num_vars, depth, count) -> str:
+    names = ["v" + str(i) for i in range(num_vars)]
+    lines = ["main", "var " + ", ".join(names) + ";", "{"]
+    for name in names:
+        lines.append("    let " + name + " <- call InputNum();")
+    for i in range(count):
+        for level in range(depth):
+            a, b = names[(i + level) % num_vars], names[(i + 2 * level + 1) % num_vars]
+            lines.append("    " * (level + 1) + "if %s < %s then let %s <- %s + 1;" % (a, b, a, b))
+        lines.append("    " * (depth + 1) + "let %s <- 0" % names[i % num_vars])
+        for level in reversed(range(depth)):
+            lines.append("    " * (level + 1) + "fi;")
+    lines.append("    call OutputNum(" + names[0] + ")")
+    lines.append("}.")
+    return "\n".join(lines) + "\n"
+
+
+# Generate if / else statements nested { depth } deep in both branches (8_NESTED_if_else scaled up)
+def GenerateIfElse(depth) -> str:
+    def Nest(level, indent):
+        pad = "    " * indent
+        if level == depth:
+            return [pad + "let d <- d + e"]
+        return (
+            [pad + "if a < %d then" % level]
+            + Nest(level + 1, indent + 1)
+            + [pad + "else"]
+            + Nest(level + 1, indent + 1)
+            + [pad + "fi;", pad + "let e <- e + d"]
+        )
+
+    lines = ["main", "var a, d, e;", "{", "    let a <- call InputNum();", "    let d <- a;", "    let e <- a + d;"]
+    lines += Nest(0, 1)
+    lines += ["    call OutputNum(d)", "}."]
+    return "\n".join(lines) + "\n"
+
+
+# Generate while loops nested { depth } deep, each with { statements } assignments over { num_vars } variables
+def GenerateLoops(depth, statements, num_vars=10) -> str:
+    names = ["v" + str(i) for i in range(num_vars)]
+    counters = ["i" + str(level) for level in range(depth)]
+    lines = ["main", "var " + ", ".join(names + counters) + ";", "{"]
+    for name in names:
+        lines.append("    let " + name + " <- call InputNum();")
+    for level in range(depth):
+        pad = "    " * (level + 1)
+        lines.append(pad + "let %s <- 0;" % counters[level])
+        lines.append(pad + "while %s < 10 do" % counters[level])
+        for i in range(statements):
+            a, b = names[(level + i) % num_vars], names[(level + 3 * i + 1) % num_vars]
+            lines.append(pad + "    let %s <- %s + %s;" % (a, b, counters[level]))
+    for level in reversed(range(depth)):
+        pad = "    " * (level + 1)
+        lines.append(pad + "    let %s <- %s + 1" % (counters[level], counters[level]))
+        lines.append(pad + "od;")
+    lines.append("    call OutputNum(" + names[0] + ")")
+    lines.append("}.")
+    return "\n".join(lines) + "\n"
+
+
+# Generate a program of { statements } statements over constant-initialized variables
+#   Half of the variables are set to constants once, so their expressions fold and the ifs / whiles on them are decided
+def GenerateConstants(statements, num_vars=20, seed=0) -> str:
+    rng = random.Random(seed)
+    names = ["v" + str(i) for i in range(num_vars)]
+    constants, inputs = names[: num_vars // 2], names[num_vars // 2 :]
+    lines = ["main", "var " + ", ".join(names) + ";", "{"]
+    for name in constants:
+        lines.append("    let %s <- %d;" % (name, rng.randint(1, 99)))
+    for name in inputs:
+        lines.append("    let " + name + " <- call InputNum();")
+    for _ in range(statements):
+        a, b, c = rng.choice(constants), rng.choice(constants), rng.choice(inputs)
+        kind = rng.random()
+        if kind < 0.5:
+            lines.append("    let %s <- %s + %s * %d;" % (c, a, b, rng.randint(1, 9)))
+        elif kind < 0.8:
+            lines.append("    if %s < %s then let %s <- %s - 1 else let %s <- %s + 1 fi;" % (a, b, c, c, c, a))
+        else:
+            lines.append("    while %s > %d do let %s <- %s + 1 od;" % (a, rng.randint(100, 199), c, c))
+    lines.append("    call OutputNum(" + inputs[0] + ")")
+    lines.append("}.")
+    return "\n".join(lines) + "\n"
+
+
+# Generate while loops nested { depth } deep whose { statements } statements compute invariant products
+#   and array addresses (the inputs are never assigned in the loops, only the sums and the counters are)
+def GenerateInvariantLoops(depth, statements, num_vars=10) -> str:
+    inputs = ["v" + str(i) for i in range(num_vars)]
+    sums = ["s" + str(level) for level in range(depth)]
+    counters = ["i" + str(level) for level in range(depth)]
+    lines = ["main", "var " + ", ".join(inputs + sums + counters) + ";", "array[100] a;", "{"]
+    for name in inputs:
+        lines.append("    let " + name + " <- call InputNum();")
+    for level in range(depth):
+        pad = "    " * (level + 1)
+        lines.append(pad + "let %s <- 0;" % sums[level])
+        lines.append(pad + "let %s <- 0;" % counters[level])
+        lines.append(pad + "while %s < 10 do" % counters[level])
+        for i in range(statements):
+            a, b = inputs[(level + i) % num_vars], inputs[(level + 3 * i + 1) % num_vars]
+            lines.append(pad + "    let %s <- %s + %s * %s + a[%s];" % (sums[level], sums[level], a, b, a))
+    for level in reversed(range(depth)):
+        pad = "    " * (level + 1)
+        lines.append(pad + "    let %s <- %s + 1" % (counters[level], counters[level]))
+        lines.append(pad + "od;")
+    lines.append("    call OutputNum(" + sums[0] + ")")
+    lines.append("}.")
+    return "\n".join(lines) + "\n"
+
+
+# Generate { count } while loops walking an array with their counters (array_in_while_with_changing_index scaled up)
+def GenerateArrayLoops(count) -> str:
+    lines = ["main", "var i, j, k, s;", "array[1000] a;", "{", "    let s <- call InputNum();"]
+    for _ in range(count):
+        lines += ["    let i <- 0;", "    let j <- s;", "    while i < 100 do"]
+        lines += ["        let k <- i + 500;", "        let a[i] <- a[k] + a[j] * 2;", "        let a[k] <- a[i] * 3;"]
+        lines += ["        let j <- j + 2;", "        let i <- i + 1", "    od;"]
+    lines += ["    call OutputNum(a[s])", "}."]
+    return "\n".join(lines) + "\n"
+
+
+# Generate { statements } statements of identities (+ 0, * 1) and loops whose phis only merge copies
+def GenerateCopies(statements, num_vars=20, seed=0) -> str:
+    rng = random.Random(seed)
+    names = ["v" + str(i) for i in range(num_vars)]
+    lines = ["main", "var i, " + ", ".join(names) + ";", "{"]
+    for name in names:
+        lines.append("    let " + name + " <- call InputNum();")
+    for _ in range(statements):
+        a, b = rng.choice(names), rng.choice(names)
+        kind = rng.random()
+        if kind < 0.4:
+            lines.append("    let %s <- %s + 0;" % (a, b))
+        elif kind < 0.7:
+            lines.append("    let %s <- 1 * %s;" % (a, b))
+        else:
+            lines += ["    let i <- 0;", "    while i < 10 do let %s <- %s * 1; let i <- i + 1 od;" % (a, a)]
+    lines.append("    call OutputNum(" + names[0] + ")")
+    lines.append("}.")
+    return "\n".join(lines) + "\n"
+
+
+# Generate { count } if / else statements computing the same values in both arms (x) and merging the
+#   same inputs in two variables (y, z), which construction-time CSE cannot unify
+def GenerateRedundantArms(count) -> str:
+    lines = ["main", "var a, b, c, x, y, z;", "{"]
+    lines += ["    let a <- call InputNum();", "    let b <- call InputNum();", "    let c <- call InputNum();"]
+    for _ in range(count):
+        lines += ["    if a < c then let x <- c * b + a; let y <- c; let z <- c"]
+        lines += ["    else let x <- c * b - a; let y <- a; let z <- a fi;", "    let c <- x + y - z;"]
+    lines += ["    call OutputNum(c)", "}."]
+    return "\n".join(lines) + "\n"
+
+
+# Generate { count } if statements computing a value in one arm that is computed again after the join
+def GeneratePartialRedundancy(count) -> str:
+    lines = ["main", "var a, b, c, x;", "{"]
+    lines += ["    let a <- call InputNum();", "    let b <- call InputNum();", "    let c <- call InputNum();"]
+    for _ in range(count):
+        lines += ["    if a < c then let x <- c * b else let x <- a fi;", "    let c <- c * b + x;"]
+    lines += ["    call OutputNum(c)", "}."]
+    return "\n".join(lines) + "\n"
+
+
+# Run { func } { repeat } times and return the best wall-clock time in seconds
+def BestOf(func, repeat=3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def Lex(tokenizer) -> int:
+    count = 0
+    for token in tokenizer.Tokens():
+        if token[0] == Tokenizer.TOKEN_EOF:
+            return count
+        count += 1
+
+
+# Lexing throughput in MB/s, from a file on disk and from an in-memory string
+def BenchLexer(sizes=(10000, 50000)) -> None:
+    print("Lexer throughput")
+    for statements in sizes:
+        source = GenerateProgram(statements)
+        megabytes = len(source) / 1e6
+        with tempfile.NamedTemporaryFile("w", suffix=".smpl", delete=False) as file:
+            file.write(source)
+        try:
+            file_time = BestOf(lambda: Lex(Tokenizer(file.name)))
+        finally:
+            os.remove(file.name)
+        str_time = BestOf(lambda: Lex(Tokenizer(source=source)))
+        print(
+            "  %6.2f MB | file: %7.2f MB/s | str: %7.2f MB/s"
+            % (megabytes, megabytes / file_time, megabytes / str_time)
+        )
+
+
+# Lex straight-line programs declaring { count } distinct identifiers
+def BenchIdentifiers(counts=(1000, 10000, 30000)) -> None:
+    print("Identifier interning")
+    for count in counts:
+        names = ["x" + str(i) for i in range(count)]
+        lines = ["main", "var " + ", ".join(names) + ";", "{"]
+        lines += ["    let %s <- %d;" % (name, i) for i, name in enumerate(names)]
+        lines += ["    call OutputNum(" + names[-1] + ")", "}."]
+        source = "\n".join(lines)
+        elapsed = BestOf(lambda: Lex(Tokenizer(source=source)))
+        print("  %6d identifiers | lex: %7.3f s" % (count, elapsed))
+
+
+# Walk back from the tail until { id } is found (how FindInstruction used to work)
+def FindByWalking(instr_list, id):
+    curr_node = instr_list.tail
+    while curr_node is not None:
+        if curr_node.instr_id == id:
+            return curr_node
+        curr_node = curr_node.prev_instr
+    return None
+
+
+# Recursive search of both children (how FindBlock used to work, revisits join blocks)
+def FindBlockRecursive(root, x):
+    if root is None or root.idx == x:
+        return root
+    for succ in root.succs:
+        found = FindBlockRecursive(succ, x)
+        if found:
+            return found
+    return None
+
+
+# Walk the CFG from the root until a block holding { id } is found (how FindInstructionBlock used to work)
+def FindInstructionBlockByWalking(blocks, id):
+    stack = [blocks.root]
+    seen_join = []
+    seen_while_join = []
+    while stack:
+        curr_block = stack.pop(0)
+        if id in curr_block.instructions:
+            return curr_block
+        for succ in reversed(curr_block.succs):
+            if succ.type == BlockNode.JOIN:
+                if succ.idx in seen_join:
+                    stack.insert(0, succ)
+                else:
+                    seen_join.append(succ.idx)
+            elif succ.type == BlockNode.WHILE_JOIN:
+                if succ.idx not in seen_while_join:
+                    stack.insert(0, succ)
+                    seen_while_join.append(succ.idx)
+            else:
+                stack.insert(0, succ)
+    return None
+
+
+# Walk in the same order as BlockTree.Preorder using list stacks and seen lists (how the walks used to be written)
+def PreorderWithLists(blocks):
+    order = []
+    stack = [blocks.root]
+    seen_join = []
+    seen_while_join = []
+    while stack:
+        curr_block = stack.pop(0)
+        order.append(curr_block)
+        for succ in reversed(curr_block.succs):
+            if succ.type == BlockNode.JOIN:
+                if succ.idx in seen_join:
+                    stack.insert(0, succ)
+                else:
+                    seen_join.append(succ.idx)
+            elif succ.type == BlockNode.WHILE_JOIN:
+                if succ.idx not in seen_while_join:
+                    stack.insert(0, succ)
+                    seen_while_join.append(succ.idx)
+            else:
+                stack.insert(0, succ)
+    return order
+
+
+# Average FindInstruction time per lookup of random ids in lists of { sizes } instructions
+def BenchLookup(sizes=(1000, 10000, 100000), lookups=100000) -> None:
+    print("Instruction lookup by id")
+    rng = random.Random(0)
+    for size in sizes:
+        instr_list = InstructionList()
+        for i in range(size):
+            instr_list.AddNode(OP.ADD, i, i + 1)
+        ids = [rng.randint(1, size) for _ in range(lookups)]
+        find = instr_list.FindInstruction
+        indexed = BestOf(lambda: [find(id) for id in ids]) / lookups
+        walk_ids = ids[: max(10, lookups * 1000 // (size * 10))]
+        walked = BestOf(lambda: [FindByWalking(instr_list, id) for id in walk_ids], repeat=1) / len(walk_ids)
+        print(
+            "  %6d instructions | indexed: %8.3f us | tail walk: %10.3f us"
+            % (size, indexed * 1e6, walked * 1e6)
+        )
+
+
+# Bytes allocated per instruction for { size } instructions, per instruction list backing
+def BenchMemory(size=100000) -> None:
+    print("Instruction storage")
+    for backing in (InstructionList, CompactInstructionList):
+        tracemalloc.start()
+        instr_list = backing()
+        for i in range(size):
+            instr_list.AddNode(OP.ADD, i, i + 1)
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        scan = BestOf(lambda: [node.a for node in instr_list])
+        print(
+            "  %-22s | %6.1f bytes/instruction | scan: %6.3f s"
+            % (backing.__name__, allocated / size, scan)
+        )
+
+
+# Parse time and peak traced memory for generated programs of { sizes } statements
+def BenchParse(sizes=(1000, 3000)) -> None:
+    print("Parse")
+    for statements in sizes:
+        source = GenerateProgram(statements)
+        elapsed = BestOf(lambda: Parser(source=source).Parse())
+        tracemalloc.start()
+        Parser(source=source).Parse()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("  %6d statements | %7.3f s | peak: %7.1f MB" % (statements, elapsed, peak / 1e6))
+
+
+# Parse time and peak traced memory for programs with many variables and deeply nested blocks
+def BenchSymbols(num_vars=(300, 3000), depth=8, count=40) -> None:
+    print("Symbol tables (ifs nested %d deep)" % depth)
+    for variables in num_vars:
+        source = GenerateNested(variables, depth, count)
+        elapsed = BestOf(lambda: Parser(source=source).Parse())
+        tracemalloc.start()
+        blocks = Parser(source=source).Parse()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            "  %5d variables, %6d blocks | parse: %7.3f s | peak: %7.1f MB"
+            % (variables, blocks.index, elapsed, peak / 1e6)
+        )
+
+
+# Parse straight-line programs using { counts } distinct constants
+def BenchConsts(counts=(1000, 5000)) -> None:
+    print("Const pool")
+    for count in counts:
+        lines = ["main", "var x;", "{"]
+        lines += ["    let x <- %d;" % i for i in range(count)]
+        lines += ["    call OutputNum(x)", "}."]
+        source = "\n".join(lines)
+        elapsed = BestOf(lambda: Parser(source=source).Parse(), repeat=1)
+        print("  %6d constants | parse: %7.3f s" % (count, elapsed))
+
+
+# Parse one expression summing { terms } variables, inside a while loop (the loop variant check reads its uses)
+def BenchExpressions(terms=(2000, 20000), num_vars=200) -> None:
+    print("Long expressions")
+    names = ["v" + str(i) for i in range(num_vars)]
+    for count in terms:
+        lines = ["main", "var i, " + ", ".join(names) + ";", "{", "    let i <- 0;"]
+        lines += ["    let " + name + " <- call InputNum();" for name in names]
+        lines.append("    while i < 10 do")
+        lines.append("        let i <- i + " + " + ".join(names[k % num_vars] for k in range(count)) + " * 2")
+        lines += ["    od;", "    call OutputNum(i)", "}."]
+        source = "\n".join(lines)
+        elapsed = BestOf(lambda: Parser(source=source).Parse())
+        print("  %6d terms | parse: %7.3f s" % (count, elapsed))
+
+
+# Memory released by BlockTree.Finalize after parsing generated programs of { sizes } statements
+def BenchFinalize(sizes=(3000, 10000)) -> None:
+    print("Finalize")
+    for statements in sizes:
+        source = GenerateProgram(statements)
+        tracemalloc.start()
+        blocks = Parser(source=source).Parse()
+        before, _ = tracemalloc.get_traced_memory()
+        count = len(blocks.instrList)
+        start = time.perf_counter()
+        resident_before, resident_after = blocks.Finalize()
+        elapsed = time.perf_counter() - start
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            "  %6d statements | %6d -> %6d instructions | %7.3f s | traced: %6.1f -> %6.1f MB | resident: %6.1f -> %6.1f MB"
+            % (statements, count, len(blocks.instrList), elapsed, before / 1e6, after / 1e6, resident_before / 1e6, resident_after / 1e6)
+        )
+
+
+# Sparse conditional constant propagation on programs of { sizes } statements with decided branches
+def BenchConstantPropagation(sizes=(3000, 10000)) -> None:
+    print("Constant propagation")
+    for statements in sizes:
+        source = GenerateConstants(statements)
+        parse = BestOf(lambda: Parser(source=source).Parse(), repeat=1)
+        blocks = Parser(source=source).Parse()
+        count, block_count = len(blocks.instrList), len(blocks.Blocks())
+        start = time.perf_counter()
+        removed_instructions, removed_blocks = ConstantPropagation(blocks).Run()
+        elapsed = time.perf_counter() - start
+        print(
+            "  %6d statements | parse: %7.3f s | sccp: %7.3f s | instructions: %6d - %6d | blocks: %6d - %6d"
+            % (statements, parse, elapsed, count, removed_instructions, block_count, removed_blocks)
+        )
+
+
+# Strength reduction of the array addressing in { counts } loops over arrays
+def BenchStrengthReduction(counts=(100, 1000)) -> None:
+    print("Strength reduction")
+    for count in counts:
+        blocks = Parser(source=GenerateArrayLoops(count)).Parse()
+        multiplies = sum(
+            blocks.FindInstruction(instr).op == OP.MUL for block in blocks.Blocks() for instr in block.instructions
+        )
+        reduction = StrengthReduction(blocks)
+        start = time.perf_counter()
+        reduced, shifts = reduction.Run()
+        elapsed = time.perf_counter() - start
+        print(
+            "  %5d loops | iv: %7.3f s | %6d muls: %6d reduced to adds, %6d to shifts | %d induction variables"
+            % (count, elapsed, multiplies, reduced, shifts, reduction.induction_variables)
+        )
+
+
+# Copy propagation on generated programs of { sizes } statements
+def BenchCopyPropagation(sizes=(3000, 10000)) -> None:
+    print("Copy propagation")
+    for statements in sizes:
+        blocks = Parser(source=GenerateCopies(statements)).Parse()
+        count = sum(len(block.instructions) for block in blocks.Blocks())
+        start = time.perf_counter()
+        phis, copies = CopyPropagation(blocks).Run()
+        elapsed = time.perf_counter() - start
+        print(
+            "  %6d statements | copy: %7.3f s | %6d instructions | %6d trivial phis, %6d identities removed"
+            % (statements, elapsed, count, phis, copies)
+        )
+
+
+# Global value numbering of { counts } if / else statements with redundant arms
+def BenchValueNumbering(counts=(1000, 10000)) -> None:
+    print("Global value numbering")
+    for count in counts:
+        blocks = Parser(source=GenerateRedundantArms(count)).Parse()
+        instructions = sum(len(block.instructions) for block in blocks.Blocks())
+        gvn = GlobalValueNumbering(blocks)
+        start = time.perf_counter()
+        removed = gvn.Run()
+        elapsed = time.perf_counter() - start
+        print(
+            "  %6d ifs | gvn: %7.3f s | %6d instructions: %6d removed (%6d phis), %6d hoisted | CSE reused %d"
+            % (count, elapsed, instructions, removed, gvn.removed_phis, gvn.hoisted, blocks.cse_hits)
+        )
+
+
+# The search_ds_test.smpl pattern without the a + 1 ahead of the branch: a + 1 is computed in one arm and
+#   again after the join, which CSE cannot remove (the arm does not dominate the join)
+PARTIAL_REDUNDANCY_EXAMPLE = """main
+var a, x, y;
+{
+    let a <- call InputNum();
+    if a < 0 then let x <- a + 1 else let x <- a + 2 fi;
+    let y <- a + 1;
+    call OutputNum(x);
+    call OutputNum(y)
+}.
+"""
+
+
+# Return: Computations (add / sub / mul / cmp / adda / lsh) on each path through the loop-free { blocks }
+def ComputationsPerPath(blocks) -> list:
+    counts = []
+    stack = [(blocks.root, 0)]
+    while stack:
+        block, count = stack.pop()
+        count += sum(LazyCodeMotion.EXPRESSION[blocks.FindInstruction(instr).op] for instr in block.instructions)
+        if not block.succs:
+            counts.append(count)
+        for succ in block.succs:
+            stack.append((succ, count))
+    return sorted(counts)
+
+
+# Partial redundancy elimination of { counts } if statements with a value computed again after the join
+def BenchPartialRedundancy(counts=(1000, 10000)) -> None:
+    print("Partial redundancy elimination")
+    blocks = Parser(source=PARTIAL_REDUNDANCY_EXAMPLE).Parse()
+    before = ComputationsPerPath(blocks)
+    pre = LazyCodeMotion(blocks)
+    removed, inserted = pre.Run()
+    print(
+        "  example    | %d removed, %d inserted, %d phis | computations per path: %s -> %s"
+        % (removed, inserted, pre.phis, before, ComputationsPerPath(blocks))
+    )
+    for count in counts:
+        blocks = Parser(source=GeneratePartialRedundancy(count)).Parse()
+        instructions = sum(len(block.instructions) for block in blocks.Blocks())
+        pre = LazyCodeMotion(blocks)
+        start = time.perf_counter()
+        removed, inserted = pre.Run()
+        elapsed = time.perf_counter() - start
+        print(
+            "  %6d ifs | pre: %7.3f s | %6d instructions: %6d removed, %6d inserted, %6d phis | %d expressions"
+            % (count, elapsed, instructions, removed, inserted, pre.phis, len(pre.keys))
+        )
+
+
+# Dead code elimination on generated programs of { sizes } statements, as parsed and after constant propagation
+def BenchDeadCode(sizes=(3000, 10000)) -> None:
+    print("Dead code elimination")
+    for statements in sizes:
+        for name, source, sccp in (
+            ("parsed", GenerateProgram(statements), False),
+            ("sccp", GenerateConstants(statements), True),
+        ):
+            blocks = Parser(source=source).Parse()
+            if sccp:
+                ConstantPropagation(blocks).Run()
+            count, block_count = sum(len(block.instructions) for block in blocks.Blocks()), len(blocks.Blocks())
+            start = time.perf_counter()
+            removed_instructions, removed_blocks = DeadCodeElimination(blocks).Run()
+            elapsed = time.perf_counter() - start
+            print(
+                "  %6d statements %-6s | dce: %7.3f s | instructions: %6d - %6d | blocks: %6d - %6d"
+                % (statements, name, elapsed, count, removed_instructions, block_count, removed_blocks)
+            )
+
+
+# Loop-invariant code motion on while loops nested { depths } deep
+def BenchLoopInvariants(depths=(4, 8), statements=200) -> None:
+    print("Loop-invariant code motion")
+    for depth in depths:
+        blocks = Parser(source=GenerateInvariantLoops(depth, statements)).Parse()
+        count = sum(len(block.instructions) for block in blocks.Blocks())
+        licm = LoopInvariantCodeMotion(blocks)
+        start = time.perf_counter()
+        hoisted = licm.Run()
+        elapsed = time.perf_counter() - start
+        print(
+            "  depth %2d | licm: %7.3f s | %6d instructions | %6d hoisted out of %d loops"
+            % (depth, elapsed, count, hoisted, len(licm.hoisted))
+        )
+
+
+# Dominance by walking up the immediate dominators of { b } in { dominators }
+def DominatesByWalking(dominators, a, b) -> bool:
+    while b is not None:
+        if b is a:
+            return True
+        b = dominators.IDom(b)
+    return False
+
+
+# Block / instruction-to-block lookups on if / else diamonds nested { depths } deep
+def BenchRegistry(depths=(6, 10, 14), lookups=200) -> None:
+    print("Block registry (nested if / else)")
+    rng = random.Random(0)
+    for depth in depths:
+        blocks = Parser(source=GenerateIfElse(depth)).Parse()
+        block_ids = [rng.randrange(blocks.index) for _ in range(lookups)]
+        instr_ids = [rng.randint(1, len(blocks.instrList)) for _ in range(lookups)]
+        registry = BestOf(
+            lambda: ([blocks.FindBlock(x) for x in block_ids], [blocks.FindInstructionBlock(id) for id in instr_ids])
+        )
+        walked = BestOf(
+            lambda: (
+                [FindBlockRecursive(blocks.root, x) for x in block_ids[:10]],
+                [FindInstructionBlockByWalking(blocks, id) for id in instr_ids[:10]],
+            ),
+            repeat=1,
+        )
+        print(
+            "  depth %2d, %5d blocks | registry: %8.3f us | walk: %10.1f us"
+            % (depth, blocks.index, registry / (2 * lookups) * 1e6, walked / 20 * 1e6)
+        )
+
+
+# Full CFG walks on if / else diamonds nested { depths } deep
+def BenchTraversal(depths=(10, 13)) -> None:
+    print("CFG traversal (nested if / else)")
+    for depth in depths:
+        blocks = Parser(source=GenerateIfElse(depth)).Parse()
+        lists = BestOf(lambda: PreorderWithLists(blocks), repeat=1)
+        walk = BestOf(lambda: list(blocks.Walk([blocks.root])))
+        cached = BestOf(blocks.Preorder)
+        print(
+            "  %5d blocks | lists: %8.3f s | Walk: %8.4f s | cached Preorder: %8.6f s"
+            % (blocks.index, lists, walk, cached)
+        )
+
+
+# Parse time of while loops nested { depths } deep, { statements } assignments per loop
+def BenchLoops(depths=(4, 8), statements=200) -> None:
+    print("Loops (%d assignments per loop)" % statements)
+    for depth in depths:
+        source = GenerateLoops(depth, statements)
+        elapsed = BestOf(lambda: Parser(source=source).Parse(), repeat=1)
+        print("  depth %2d | parse: %7.3f s" % (depth, elapsed))
+
+
+# Dominator tree construction and dominance queries on if / else diamonds nested { depths } deep
+def BenchDominators(depths=(10, 13), queries=100000) -> None:
+    print("Dominators (nested if / else)")
+    rng = random.Random(0)
+    for depth in depths:
+        blocks = Parser(source=GenerateIfElse(depth)).Parse()
+        build = BestOf(lambda: blocks.orders.clear() or blocks.Dominators())
+        dominators = blocks.Dominators()
+        pairs = [(rng.choice(blocks.block_list), rng.choice(blocks.block_list)) for _ in range(queries)]
+        query = BestOf(lambda: [dominators.Dominates(a, b) for a, b in pairs])
+        walked = BestOf(lambda: [DominatesByWalking(dominators, a, b) for a, b in pairs], repeat=1)
+        print(
+            "  %5d blocks | build: %7.3f s | Dominates: %6.3f us | idom walk: %6.3f us"
+            % (blocks.index, build, query / queries * 1e6, walked / queries * 1e6)
+        )
+
+
+SECTIONS = {
+    "lexer": BenchLexer,
+    "identifiers": BenchIdentifiers,
+    "lookup": BenchLookup,
+    "memory": BenchMemory,
+    "parse": BenchParse,
+    "symbols": BenchSymbols,
+    "consts": BenchConsts,
+    "expressions": BenchExpressions,
+    "registry": BenchRegistry,
+    "traversal": BenchTraversal,
+    "loops": BenchLoops,
+    "dominators": BenchDominators,
+    "finalize": BenchFinalize,
+    "sccp": BenchConstantPropagation,
+    "licm": BenchLoopInvariants,
+    "iv": BenchStrengthReduction,
+    "gvn": BenchValueNumbering,
+    "pre": BenchPartialRedundancy,
+    "copy": BenchCopyPropagation,
+    "dce": BenchDeadCode,
+}
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("sections", nargs="*", help=", ".join(SECTIONS))
+    args = argparser.parse_args()
+    for name in args.sections:
+        if name not in SECTIONS:
+            argparser.error("unknown section: " + name)
+    for name in args.sections or SECTIONS:
+        SECTIONS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,28 @@
 #
 # Blocks class is a dynamic Tree structure that holds instruction ids
 
-from instructions import InstructionList, InstructionNode
+from dominators import DominatorTree
+from instructions import InstructionList, InstructionNode, CompactInstructionList
 from op_codes import OP
-import copy
+from symbol_table import SymbolTable
+from value_table import ValueTable
+import gc
+import logging
+import os
 
-# BlockTree is a tree with max of 2 children each BlockNode
-# Each BlockNode holds instruction IDs and its own symtable. PTRS to PARENT, CHILDREN, and PREV DOM BLCK
+log = logging.getLogger("smpl.blocks")
+
+
+# Return: Resident set size of the process in bytes (0 where /proc/self/statm is not available)
+def ResidentMemory() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+# BlockTree is a CFG of BlockNodes linked by kinded edges (succs / preds), max of 2 successors each BlockNode
+# Each BlockNode holds instruction IDs and its own symtable. PTRS to PREDECESSORS, SUCCESSORS, and PREV DOM BLCK
 
 
 class BlockNode:
@@ -18,22 +34,40 @@ class BlockNode:
     WHILE_JOIN = 4
     FOLLOW = 5
 
+    # Edge kinds, stored next to each successor / predecessor
+    EDGE_BASIC = 0  # Straight-line edge (also into a while join block from before the loop)
+    EDGE_FALL = 1  # Fall-through (into a then / loop body block, out of an else block)
+    EDGE_BRANCH = 2  # Taken branch (conditional branch or bra)
+    EDGE_FOLLOW = 3  # Loop exit, while join block -> follow block
+    EDGE_BACK = 4  # Loop back edge, end of the loop body -> while join block
+    EDGE_NAMES = ["basic", "fall-through", "branch", "follow", "back-edge"]
+
+    __slots__ = (
+        "idx",
+        "instructions",
+        "succs",
+        "succ_kinds",
+        "preds",
+        "pred_kinds",
+        "symtable",
+        "waiting_on",
+        "while_phi_idx",
+        "type",
+    )
+
     # Create a new block
     #   - Empty blocks should still have an "Empty" instruction, unless there is an instruction that overwrites
     def __init__(self, idx):
         self.idx = idx  # Index of block
         self.instructions = []  # List to hold instruction ids
-        self.dom_instructions = (
-            {}
-        )  # LinkedList of prev dom instructions for each operator
-        self.parents = [None] * 2  # Parent(s) of node
-        self.children = [None] * 2  # List to hold children (if branching, max 2)
+        # Edge arrays are tuples (edges rarely change once made, and an empty tuple is shared)
+        self.succs = ()  # Successors (if branching, (fall-through, branch / follow))
+        self.succ_kinds = ()  # Edge kind of each successor
+        self.preds = ()  # Predecessors (join blocks: (then / before the loop, else / back edge))
+        self.pred_kinds = ()  # Edge kind of each predecessor
         self.symtable = (
-            {}
-        )  # Symbol table "dict" for the block (used to check dominance)
-        self.vartable = {}  # Variant table to keep track of "invariants" in while loops (1 = variant, 0 = invariant)
-        self.usedvartable = {} # Table to keep track of which variables were "used" in each variable's assignment 
-        self.dom_block = None  # The dominating block (used for CSE)
+            SymbolTable()
+        )  # Symbol table for the block (used to check dominance), shares bindings with the block it came from
         self.waiting_on = (
             0,
             0,
@@ -50,30 +84,50 @@ class BlockNode:
     def AddInstructionToFront(self, instr_id):
         self.instructions.insert(0, instr_id)
 
-    def SetChild(self, block):
-        self.children[0] = block
-        self.children[1] = None
-
-    def SetChildren(self, block1, block2):
-        self.children[0] = block1
-        self.children[1] = block2
+    # Add edge self -> { block } of edge kind { kind }
+    def AddEdge(self, block, kind):
+        self.succs += (block,)
+        self.succ_kinds += (kind,)
+        block.preds += (self,)
+        block.pred_kinds += (kind,)
 
-    def SetParent(self, block):
-        self.parents[0] = block
-        self.parents[1] = None
+    # Remove edge self -> { block }
+    def RemoveEdge(self, block):
+        i = self.succs.index(block)
+        self.succs = self.succs[:i] + self.succs[i + 1 :]
+        self.succ_kinds = self.succ_kinds[:i] + self.succ_kinds[i + 1 :]
+        i = block.preds.index(self)
+        block.preds = block.preds[:i] + block.preds[i + 1 :]
+        block.pred_kinds = block.pred_kinds[:i] + block.pred_kinds[i + 1 :]
 
-    def SetParents(self, block1, block2):
-        self.parents[0] = block1
-        self.parents[1] = block2
+    # Move all of self's outgoing edges (and their kinds) to start from { block } instead
+    def MoveEdges(self, block):
+        for succ in self.succs:
+            succ.preds = tuple(block if pred is self else pred for pred in succ.preds)
+        block.succs, self.succs = self.succs, ()
+        block.succ_kinds, self.succ_kinds = self.succ_kinds, ()
 
 
 class BlockTree:
-    def __init__(self):
+    # compact: store instructions in a CompactInstructionList (less memory, slower access)
+    def __init__(self, compact=False):
         self.index = 0
-        self.list_of_vars = []
+        self.list_of_vars = []  # Declared variable / array names, indexed by slot
+        self.slots = {}  # Declared name -> slot (symtables are keyed by slot, bitsets use bit 1 << slot)
         self.instrList = (
-            InstructionList()
+            CompactInstructionList() if compact else InstructionList()
         )  # Init an instruction list to hold instructions in sequential order
+        self.values = ValueTable()  # Scoped (op, a, b) -> instruction table for CSE
+        self.cse_hits = 0  # Instructions reused by CSE while parsing (kept after Finalize)
+        self.consts = {}  # Const pool: const value (number or "<array>_adr") -> const instruction ID in the root
+        # Block registry
+        self.block_list = []  # Block idx -> BlockNode
+        self.instr_blocks = {}  # Instruction ID -> BlockNode holding it
+        self.instr_positions = {}  # Instruction ID -> index in its block's instructions (see FindInstructionPosition)
+        self.stale_blocks = set()  # Idx of blocks whose positions moved (rebuilt on the next lookup)
+        self.orders = {}  # Cached block orders and dominator tree (see Preorder / Dominators), cleared on CFG edits
+        self.open_loops = {}  # Unsealed while join block idx -> (loop layer, {var: incomplete phi ID}), innermost last
+        self.loop_variants = {}  # While join block idx -> bitset of the variables assigned in the loop
         self.root = None  #   Initial block 0 to hold constants
         self.current_block = None  # Add block 1 to begin program
         self.current_join_blocks = (
@@ -85,47 +139,54 @@ class BlockTree:
         self.current_block = self.AddBlock(self.root)  # Add block 1 to begin program
 
 
+    # Intern a declared variable / array name
+    #   Return: Its slot (dense, in declaration order)
+    def AddVariable(self, name) -> int:
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.list_of_vars)
+            self.list_of_vars.append(name)
+        return slot
+
     # Sets the current block
     def SetCurrent(self, block):
         self.current_block = block
 
     # Lookup variable's instruction ID in current block's symtable
+    #   var: slot of the variable
     #   Return: Instruction ID of variable
     def Lookup(self, var) -> int:
         return self.current_block.symtable[var]
 
     # Add / update to current block's symtable
+    #   var: slot of the variable
     def AddSymbol(self, var, instr_id) -> None:
-        print(
-            "BB" + str(self.current_block.idx) + ":" + str(var) + " = " + str(instr_id)
-        )
+        log.debug("BB%d:%s = %s", self.current_block.idx, self.list_of_vars[var], instr_id)
         self.current_block.symtable[var] = instr_id
 
+    # Return: Bindings of symtable { table } by variable name, in declaration order
+    def SymbolNames(self, table) -> dict:
+        flat = table.Flatten()
+        return {self.list_of_vars[slot]: flat[slot] for slot in sorted(flat)}
+
     # Print the current block's symtable
     def PrintSymTable(self) -> None:
-        print(self.current_block.symtable)
+        log.debug("Symbol Table: %s", self.SymbolNames(self.current_block.symtable))
 
+    # Find a dominating instruction computing (op, a, b) visible from the current block (CSE)
+    #   Return: Instruction ID, or 0 if there is none
     def FindDomInstruction(self, op, a, b) -> int:
-        if op in OP.DOM_CODES:
-            if op == OP.ADDA or op == OP.STORE or op == OP.LOAD:
-                dom_list = self.current_block.dom_instructions[OP.LOAD]
-            else:
-                dom_list = self.current_block.dom_instructions[op]
-        else:
-            return 0
-        if dom_list:
-            print("Searching through dom list for " + str(op) + " " + str(a) + " " + str(b))
-            for id in dom_list:
-                instr = self.FindInstruction(id)
-                print("Checking instruction " + str(id) + " " + str(instr.op))
-                if instr.op == "kill":
-                    print("Found kill")
-                    return 0
-                if instr and instr.op == op and instr.a == a and instr.b == b:
-                    return instr.instr_id
-            return 0
-        else:
+        if self.values is None:  # Finalized
             return 0
+        id = self.values.Find(self.current_block, op, a, b)
+        if id != 0:
+            self.cse_hits += 1
+        return id
+
+    # Open the CSE scope of a new { block }, nested in { parent } (None for the root)
+    def AddScope(self, block, parent=None) -> None:
+        if self.values is not None:
+            self.values.AddScope(block, parent)
 
     # Adda + Load / Store are considered one instruction, so given adda load and store should be right next to it
     def FindLoadOrStoreInstruction(self, adda) -> int:
@@ -133,279 +194,656 @@ class BlockTree:
         return adda_instr.next_instr.instr_id
 
 
-    # While loop, change all instances of a changed variables
-    # 5. Change all following instructions that use { var } to the new { phi_instr } address
-    #       a. Instructions in current_join block that use { var } change
-    #       b. Instructions in fall block(s) that use { var } add a new instruction
-    #           - vars that use i --> updated in sym table to the new instruction
-    #           - vars that do not --> left alone
-    def ChangeAllSymbols_test(self, block: BlockNode, old_value, new_value):
-        orig_block = block
-        # First update all instructions in the join block
-        for id in orig_block.instructions:
-            instruction = self.FindInstruction(id)
-            if instruction and instruction.op != OP.PHI:
-                if instruction.a == old_value:
-                    instruction.a = new_value
-                if instruction.b == old_value:
-                    instruction.b = new_value
-        # Next, update all instructions inside the while loop (following the Fall block)
-        seen = []
-        seen.append(self.current_block.idx)
-        self.SetCurrent(block.children[0])  # Fall block is always child 0
-        while (self.current_block.idx not in seen):  # Loop until it sees the same block twice
-            for id in self.current_block.instructions:
-                instruction = self.FindInstruction(id)
-                if (
-                    instruction.op != OP.PHI
-                    and self.current_block.idx == orig_block.idx
-                ) or self.current_block.idx != orig_block.idx:
-                    # TODO
-                    # If its loop invariant (variable not changed in the loop) want to add the new instruction back
-                    # If its loop variant (variable is changed in the loop) want to only modify the instruction
-                    # How to know if a variable is loop variant / invariant?
-                    # -- In a "while" loop, keep track of all variables that have new assignments. These are loop variants.
-                    #  -- All variables not assigned to in the loop is "loop invariant"
-                    #   List [ ] of variables that are "variant"
-                    #   On a call to Assignment(), if in a while block, append the var being assigned to the list  as necessary
-                    #   When this function is called and phi loops down:
-                    #       - If instruction to be modified is referenced by an "invariant" var in the symtable:
-                    #           - Still modify the original instruction, but then add back the old instruction
-                    #           - assign symtable[the invariant variable] = to the new instruction
-                    if instruction.a == old_value and instruction.b != old_value:
-                        instruction.a = new_value
-                        """
-                        copy = self.AddInstruction(instruction.op, new_value, instruction.b)
-                        for sym in self.current_block.symtable:
-                            if self.current_block.symtable[sym] == instruction.instr_id:
-                                self.current_block.symtable[sym] = copy
-                        """
-                    elif instruction.a != old_value and instruction.b == old_value:
-                        instruction.b = new_value
-                        """
-                        copy = self.AddInstruction(instruction.op, instruction.a, new_value)
-                        for sym in self.current_block.symtable:
-                            if self.current_block.symtable[sym] == instruction.instr_id:
-                                self.current_block.symtable[sym] = copy
-                        """
-                    elif instruction.a == old_value and instruction.b == old_value:
-                        instruction.a = new_value
-                        instruction.b = new_value
-                        """
-                        copy = self.AddInstruction(instruction.op, new_value, new_value)
-                        for sym in self.current_block.symtable:
-                            if self.current_block.symtable[sym] == instruction.instr_id:
-                                self.current_block.symtable[sym] = copy
-                        """
-            seen.append(self.current_block.idx)
-            self.SetCurrent(self.current_block.children[0])
+    # SSA construction ---------------------------------------------------------------------
+    # Phis are built on the fly (Braun et al.): a while join block is "unsealed" until its od, so reads
+    #   of a variable not yet assigned in the loop create an incomplete phi(value before the loop, ?)
+    #   in the join block. Sealing fills in the loop back values, and phis that turn out to be trivial
+    #   (phi(x, x) or phi(x, itself)) are removed again. A variable not initialized before a loop (or in
+    #   one branch of an if) comes in as the language's default, the const 0.
+
+    # Open the loop of while join block { block }: reads in the loop that reach its loop layer create phis
+    #   assigned: names assigned somewhere in the loop (see Tokenizer.LoopAssignments), only these get phis
+    def OpenLoop(self, block, assigned) -> None:
+        variants = 0
+        for var in assigned:
+            slot = self.slots.get(var)
+            if slot is not None:
+                variants |= 1 << slot
+        self.loop_variants[block.idx] = variants
+        block.symtable, layer = block.symtable.Loop(
+            lambda var: self.ReadLoopVariable(block, layer, var)
+        )
+        self.open_loops[block.idx] = (layer, {})
 
+    # Return: Bitset of the variables assigned in the innermost unsealed loop (0 outside of loops)
+    def LoopVariants(self) -> int:
+        if not self.open_loops:
+            return 0
+        return self.loop_variants[next(reversed(self.open_loops))]
+
+    # Return: Names of the variables in bitset { bits }, in declaration order
+    def VariableNames(self, bits) -> list:
+        return [var for slot, var in enumerate(self.list_of_vars) if bits >> slot & 1]
+
+    # Value of slot { var } on entry to the unsealed loop of { block }, creating an incomplete phi
+    def ReadLoopVariable(self, block, layer, var) -> int:
+        if layer.parent is None:
+            raise KeyError(var)
+        value = layer.parent[var]
+        if not self.loop_variants[block.idx] >> var & 1:
+            # Never assigned in the loop, so the value from before the loop is used throughout
+            layer[var] = value
+            return value
+        if value == -2:  # Array, gets a kill instead of a phi
+            return value
+        if value == -1:  # Uninitialized before the loop, enters the loop as the default 0
+            value = self.AddConstInstruction(0)
+        orig_block = self.current_block
+        self.SetCurrent(block)
+        phi_instr = self.InsertPhiAtIndex(value, 0, block.while_phi_idx)
+        block.while_phi_idx += 1
         self.SetCurrent(orig_block)
+        log.debug("WHILE: Incomplete phi %d for %s in BB%d", phi_instr, self.list_of_vars[var], block.idx)
+        layer[var] = phi_instr
+        self.open_loops[block.idx][1][var] = phi_instr
+        return phi_instr
 
-    def ChangeAllSymbols(self, block, old_value, new_value):
-        # Change the symbol for all instructions after the given instruction
-        # First modify the rest of the current join block
-        print("Change All Symbols")
-        curr_block = block
-        print("Changing instructions below phi")
-        for i, instr in enumerate(curr_block.instructions):
-            if (i >= block.while_phi_idx):
-                print("Current: " + str(instr))
-                self.ChangeSymbol(self.FindInstruction(instr), curr_block, old_value, new_value)
-        # Next, modify the rest of the blocks all children
-        stack = []
-        seen_join = []
-        seen_while_join = []
-        curr_block = None
-        stack.append(block.children[0])
-        print("Block child 0 : " + str(block.children[0].idx))
-        stack.append(block.children[1])
-        print("Block child 1 : " + str(block.children[1].idx))
-        seen_while_join.append(block.idx)
-        # Search through the rest of the blocks
-        while len(stack) > 0:
-            curr_block = stack.pop(0)
-
-            print("Block: " + str(curr_block.idx))
-            for i in range(len(curr_block.instructions)):
-                instructions = curr_block.instructions[i]
-                print("For instruction " + str(instructions))
-                instruction = self.FindInstruction(instructions)
-                add = self.ChangeSymbol(instruction, curr_block, old_value, new_value)
-                if (add):
-                    i += 1
-                i += 1
-            for children in reversed(curr_block.children):
-                if children:
-                    if children.type == BlockNode.JOIN:
-                        if children.idx in seen_join:
-                            stack.insert(0, children)
-                        else:
-                            seen_join.append(children.idx)
-                    elif children.type == BlockNode.WHILE_JOIN:
-                        # if children.idx not in seen_while_join:
-                        #     stack.insert(0, children)
-                        #    seen_while_join.append(children.idx)
-                        continue
-                    else:
-                        stack.insert(0, children)
-
-    # Return if an instruction was added
-    def ChangeSymbol(self, curr_instruction, curr_block, old_value, new_value) -> bool:
-        # Change the symbol for all instructions in the block
-        if curr_instruction.a == old_value or curr_instruction.b == old_value:
-            print("Modifying instruction " + str(curr_instruction.instr_id) + " " +
-                    str(curr_instruction.op) + " " + str(curr_instruction.a) + " " + str(curr_instruction.b))
-            # Standard case: Modify instruction
-            # ONLY if uses invariant: Modify instruction + Add back old instruction
-            old_op = curr_instruction.op
-            old_a = curr_instruction.a
-            old_b = curr_instruction.b
-            # 1. Modify instruction
-            if curr_instruction.a == old_value:
-                curr_instruction.a = new_value
-            if curr_instruction.b == old_value:
-                curr_instruction.b = new_value
-            # 2. Check if its an invariant and if so, add a copy of the old instruction
-            # Get a list of variables that are mapped to this instruction
-            vars_to_adjust = []
-            for sym in curr_block.symtable:
-                if curr_block.symtable[sym] == curr_instruction.instr_id:
-                    vars_to_adjust.append(sym)
-            print("Vars to adjust: " + str(vars_to_adjust))
-            # Check through each of the above variables for invariants
-            used_invariant = []
-            # For each var that points to that instruction
-            for vars in vars_to_adjust:
-                if (curr_block.usedvartable[vars] is not None):
-                    # For each variable that var uses
-                    for check_var in curr_block.usedvartable[vars]:
-                        # Check if its an invariant 
-                        if curr_block.vartable[check_var] == 0:   
-                            # Used invariant
-                            used_invariant.append(vars)
-            print("Vars to adjust that used invariant: " + str(used_invariant))
-            # If there were any instructions that used invariants
-            if len(used_invariant) > 0:
-                # Create a copy of the instruction
-                orig_block = self.current_block
-                self.SetCurrent(curr_block)
-                id = self.AddInstruction(old_op, old_a, old_b)
-                for var in used_invariant:
-                    curr_block.symtable[var] = id
-                self.SetCurrent(orig_block)
-                return True
-        return False
+    # Seal the loop of while join block { block } at its od
+    #   back_table: symtable at the end of the loop body (values flowing back to the join block)
+    def SealLoop(self, block, back_table) -> None:
+        layer, incomplete = self.open_loops.pop(block.idx)
+        layer.resolve = None
+        for var, phi_instr in incomplete.items():
+            self.FindInstruction(phi_instr).b = back_table[var]
+        # Variables assigned in the loop but not read before their assignment
+        changed = back_table.Diff(block.symtable)
+        orig_block = self.current_block
+        self.SetCurrent(block)
+        for var in sorted(changed):  # Slot order = declaration order
+            if var in incomplete:
+                continue
+            back_value, value = changed[var]
+            if value == -1:  # Uninitialized before the loop, enters the loop as the default 0
+                value = self.AddConstInstruction(0)
+            phi_instr = self.InsertPhiAtIndex(value, back_value, block.while_phi_idx)
+            block.while_phi_idx += 1
+            log.debug("WHILE: Inserting Phi %d for %s into BB%d", phi_instr, self.list_of_vars[var], block.idx)
+            layer[var] = phi_instr
+        self.SetCurrent(orig_block)
+        self.RemoveTrivialPhis(block, layer)
 
+    # Add the phis of if join block { block }
+    #   then_table / else_table: symtables at the end of both branches
+    def AddJoinPhis(self, block, then_table, else_table) -> None:
+        changed = then_table.Diff(block.symtable)
+        changed.update(else_table.Diff(block.symtable))
+        orig_block = self.current_block
+        self.SetCurrent(block)
+        for var in sorted(changed):  # Slot order = declaration order
+            then_value = then_table[var]
+            else_value = else_table[var]
+            if then_value == else_value:
+                self.AddSymbol(var, then_value)
+            else:
+                # A variable only initialized in one branch is the default 0 on the other side
+                if then_value == -1:
+                    then_value = self.AddConstInstruction(0)
+                if else_value == -1:
+                    else_value = self.AddConstInstruction(0)
+                phi_instr = self.AddPhiInstruction(then_value, else_value)
+                log.debug("IF: Inserting Phi %d for %s into BB%d", phi_instr, self.list_of_vars[var], block.idx)
+                self.AddSymbol(var, phi_instr)
+        self.SetCurrent(orig_block)
 
-    def FindInstructionBlock(self, id) -> BlockNode:
-        stack = []
-        seen_join = []
-        seen_while_join = []
-        curr_block = None
-        stack.append(self.root)
-        # Construct the nodes first
-        while len(stack) > 0:
-            curr_block = stack.pop(0)
+    # Remove trivial phis in the blocks created since while join block { block } (the loop and its follow)
+    #   layer: loop layer of { block }, symtables are patched down to it
+    def RemoveTrivialPhis(self, block, layer) -> None:
+        blocks = self.block_list[block.idx:]
+        phis = []
+        users = {}  # Value -> phis using it
+        for curr_block in blocks:
+            for instr in curr_block.instructions:
+                instruction = self.FindInstruction(instr)
+                if instruction.op == OP.PHI:
+                    phis.append(instr)
+                    users.setdefault(instruction.a, []).append(instr)
+                    users.setdefault(instruction.b, []).append(instr)
+        replaced = {}  # Removed phi -> value replacing it
+
+        def Replacement(value):
+            if value not in replaced:
+                return value
+            root = replaced[value]
+            while root in replaced:
+                root = replaced[root]
+            replaced[value] = root  # Later uses of { value } skip the chain
+            return root
+
+        work = phis[::-1]
+        while work:
+            instr = work.pop()
+            if instr in replaced:
+                continue
+            instruction = self.FindInstruction(instr)
+            a = Replacement(instruction.a)
+            b = Replacement(instruction.b)
+            if a == b or b == instr:
+                replaced[instr] = a
+            elif a == instr:
+                replaced[instr] = b
+            else:
+                continue
+            work.extend(users.get(instr, ()))
+        if not replaced:
+            return
+        log.debug("Removing trivial phis: %s", replaced)
+        # Drop the phis from their blocks, remembering new first instructions for branch targets
+        targets = {}
+        for curr_block in blocks:
+            instructions = [instr for instr in curr_block.instructions if instr not in replaced]
+            removed = len(curr_block.instructions) - len(instructions)
+            if removed == 0:
+                continue
+            if curr_block.type == BlockNode.WHILE_JOIN:
+                curr_block.while_phi_idx -= removed
+            first = curr_block.instructions[0]
+            if not instructions:
+                # Keep the first phi as the block's placeholder
+                instructions = [first]
+                instruction = self.FindInstruction(first)
+                instruction.op = OP.EMPTY
+                instruction.a = 0
+                instruction.b = 0
+            elif first in replaced:
+                targets[first] = instructions[0]
+            for instr in curr_block.instructions:
+                if instr in replaced and instr != instructions[0]:
+                    del self.instr_blocks[instr]
+            curr_block.instructions = instructions
+            self.stale_blocks.add(curr_block.idx)
+        # Rewrite the uses
+        for curr_block in blocks:
             for instr in curr_block.instructions:
-                if instr == id:
-                    return curr_block
-            for children in reversed(curr_block.children):
-                if children:
-                    if children.type == BlockNode.JOIN:
-                        if children.idx in seen_join:
-                            stack.insert(0, children)
-                        else:
-                            seen_join.append(children.idx)
-                    elif children.type == BlockNode.WHILE_JOIN:
-                        if children.idx not in seen_while_join:
-                            stack.insert(0, children)
-                            seen_while_join.append(children.idx)
-                    else:
-                        stack.insert(0, children)
+                instruction = self.FindInstruction(instr)
+                op = instruction.op
+                if op == OP.CONST or op == OP.KILL or op == OP.EMPTY:
+                    continue
+                a = instruction.a
+                b = instruction.b
+                if op == OP.BRA:
+                    a = targets.get(a, a)
+                else:
+                    a = Replacement(a)
+                    b = targets.get(b, b) if OP.IS_BRANCH[op] else Replacement(b)
+                if a != instruction.a or b != instruction.b:
+                    instruction.a = a
+                    instruction.b = b
+                    self.values.Rekey(instruction)
+        # Patch the symtables, down to (and including) the loop layer
+        seen = set()
+        for curr_block in blocks:
+            table = curr_block.symtable
+            while table is not None and id(table) not in seen:
+                seen.add(id(table))
+                bindings = table.bindings
+                for var, value in bindings.items():
+                    if value in replaced:
+                        bindings[var] = Replacement(value)
+                if table is layer:
+                    break
+                table = table.parent
+
+    # Return: Block holding instruction { id }, or None
+    def FindInstructionBlock(self, id) -> BlockNode:
+        return self.instr_blocks.get(id)
+
+    # Return: (block, index in block.instructions) of instruction { id }, or (None, -1)
+    def FindInstructionPosition(self, id) -> tuple:
+        block = self.instr_blocks.get(id)
+        if block is None:
+            return (None, -1)
+        if block.idx in self.stale_blocks:
+            for position, instr in enumerate(block.instructions):
+                self.instr_positions[instr] = position
+            self.stale_blocks.discard(block.idx)
+        return (block, self.instr_positions[id])
+
+    # Record that { id } was appended to { block }
+    def RegisterInstruction(self, block, id) -> None:
+        self.instr_blocks[id] = block
+        self.instr_positions[id] = len(block.instructions) - 1
+
+    # Record that { id } was inserted into { block } ahead of other instructions
+    def RegisterInsertedInstruction(self, block, id) -> None:
+        self.instr_blocks[id] = block
+        self.stale_blocks.add(block.idx)
+    # ------------------------------------------------------------------------------------
+
+    # Finalize -----------------------------------------------------------------------------
+    # Release the state that is only needed while parsing, once Parse has returned
+    #   - Block symtables, CSE dominator links and pending branch links, the CSE value table and
+    #     the loop bookkeeping are dropped (instructions added afterwards get no CSE)
+    #   - Instructions no longer in any block (removed phis) are dropped and the rest renumbered densely
+    #   Return: (resident bytes before, resident bytes after), 0 where unknown
+    def Finalize(self) -> tuple:
+        before = ResidentMemory()
+        count = len(self.instrList)
+        for block in self.Blocks():
+            block.symtable = None
+            block.waiting_on = None
+        self.values = None
+        self.open_loops = {}
+        self.loop_variants = {}
+        self.current_join_blocks = []
+        self.Renumber()
+        gc.collect()  # Dropped symtables / loop layers hold reference cycles
+        after = ResidentMemory()
+        log.info(
+            "Finalize: %d -> %d instructions | resident memory: %.1f MB -> %.1f MB",
+            count,
+            len(self.instrList),
+            before / 1e6,
+            after / 1e6,
+        )
+        return (before, after)
+
+    # Renumber the instructions held by blocks 1..n, keeping their order, into a new instruction list
+    #   Operands and branch targets are rewritten, instructions in no block are dropped
+    #   Return: Dict of old instruction ID -> new instruction ID
+    def Renumber(self) -> dict:
+        live = sorted(instr for block in self.Blocks() for instr in block.instructions)
+        mapping = {old: new for new, old in enumerate(live, 1)}
+
+        def Remap(op, value):
+            if op == OP.CONST or op == OP.KILL or op == OP.EMPTY:  # Literal / array name operands
+                return value
+            new = mapping.get(value)
+            if new is not None:
+                return new
+            if type(value) is int and value > 0:
+                log.warning("Renumber: operand %d is not an instruction in any block", value)
+            return value
+
+        self.instrList.Renumber(live, Remap)
+        self.instr_blocks = {}
+        self.instr_positions = {}
+        self.stale_blocks = set()
+        for block in self.Blocks():
+            block.instructions = [mapping[instr] for instr in block.instructions]
+            for position, instr in enumerate(block.instructions):
+                self.instr_blocks[instr] = block
+                self.instr_positions[instr] = position
+        self.consts = {const: mapping[instr] for const, instr in self.consts.items() if instr in mapping}
+        log.debug("Renumber: %d instructions", len(live))
+        return mapping
+
+    # Pass support -------------------------------------------------------------------------
+    # Editing helpers for the optimization passes over the finished IR (sccp.py, ...)
+    #   Removed blocks leave None in block_list, so block idx lookups stay valid
+
+    # Return: Blocks that were not removed, by idx (including blocks unreachable from the root)
+    def Blocks(self) -> list:
+        return [block for block in self.block_list if block is not None]
+
+    # Return: Operands of { instruction } that use another instruction's value
+    #   (const literals, array names, "#BASE" and branch targets are not uses)
+    @staticmethod
+    def ValueOperands(instruction) -> list:
+        op = instruction.op
+        if op == OP.CONST or op == OP.KILL or op == OP.EMPTY or op == OP.BRA:
+            return []
+        if OP.IS_BRANCH[op]:
+            return [instruction.a]
+        return [value for value in (instruction.a, instruction.b) if type(value) is int and value > 0]
+
+    # Return: Dict of instruction ID -> IDs of the instructions using its value (see ValueOperands)
+    def Users(self) -> dict:
+        users = {}
+        for block in self.Blocks():
+            for instr in block.instructions:
+                for value in self.ValueOperands(self.FindInstruction(instr)):
+                    users.setdefault(value, []).append(instr)
+        return users
+
+    # Rewrite every use of the instructions in { replaced } (old ID -> new ID, chains are followed)
+    def ReplaceUses(self, replaced) -> None:
+        def Replacement(value):
+            if value not in replaced:
+                return value
+            root = replaced[value]
+            while root in replaced:
+                root = replaced[root]
+            replaced[value] = root  # Later uses of { value } skip the chain
+            return root
+
+        for block in self.Blocks():
+            for instr in block.instructions:
+                instruction = self.FindInstruction(instr)
+                op = instruction.op
+                if op == OP.CONST or op == OP.KILL or op == OP.EMPTY or op == OP.BRA:
+                    continue
+                a = Replacement(instruction.a)
+                b = instruction.b if OP.IS_BRANCH[op] else Replacement(instruction.b)
+                if a != instruction.a or b != instruction.b:
+                    instruction.a = a
+                    instruction.b = b
+                    if self.values is not None:
+                        self.values.Rekey(instruction)
+
+    # Retarget the branches into { block } (the last instruction of its predecessors) from { old } to { new }
+    def RetargetBranches(self, block, old, new) -> None:
+        for pred in block.preds:
+            if not pred.instructions:
+                continue
+            instruction = self.FindInstruction(pred.instructions[-1])
+            if instruction.op == OP.BRA and instruction.a == old:
+                instruction.a = new
+            elif OP.IS_BRANCH[instruction.op] and instruction.b == old:
+                instruction.b = new
+
+    # Remove the instructions { ids } (a set) from their blocks (their uses must already be rewritten)
+    #   Return: Number of instructions removed
+    def RemoveInstructions(self, ids) -> int:
+        return self.DetachInstructions(ids, forget=True)
+
+    # Return: Index ahead of { block }'s trailing branch (the end of its instructions if it has none)
+    def BranchIndex(self, block) -> int:
+        index = len(block.instructions)
+        if index and OP.IS_BRANCH[self.FindInstruction(block.instructions[-1]).op]:
+            index -= 1
+        return index
+
+    # Create instruction (op, a, b) at { index } of { block } (None: at the end, ahead of its branch)
+    #   Return: New instruction ID
+    def InsertNewInstruction(self, block, op, a, b, index=None) -> int:
+        id = self.instrList.AddInstruction(op, a, b)
+        if index is None:
+            index = self.BranchIndex(block)
+        first = block.instructions[0] if block.instructions else 0
+        block.instructions.insert(index, id)
+        self.instr_blocks[id] = block
+        self.stale_blocks.add(block.idx)
+        if index == 0 and first:
+            self.RetargetBranches(block, first, id)
+        return id
+
+    # Rewrite instruction { id } in place as (op, a, b), keeping its ID and uses
+    def RewriteInstruction(self, id, op, a, b) -> None:
+        instruction = self.FindInstruction(id)
+        self.ForgetValue(id)
+        instruction.op = op
+        instruction.a = a
+        instruction.b = b
+
+    # Move the instructions { ids } (in order) to the end of { block }, ahead of its branch
+    def MoveInstructions(self, ids, block) -> None:
+        self.DetachInstructions(set(ids), forget=False)
+        index = self.BranchIndex(block)
+        block.instructions[index:index] = ids
+        for id in ids:
+            self.instr_blocks[id] = block
+        self.stale_blocks.add(block.idx)
+
+    # Take the instructions { ids } (a set) out of their blocks
+    #   forget: the instructions leave the IR (otherwise they are being moved to another block)
+    #   A block left without instructions keeps a placeholder (its first instruction, or a new empty
+    #   instruction when moving), and branches to a block whose first instruction changed are retargeted
+    #   Return: Number of instructions taken out (placeholders not included)
+    def DetachInstructions(self, ids, forget) -> int:
+        detached = 0
+        touched = {}
+        for id in ids:
+            block = self.instr_blocks.get(id)
+            if block is not None:
+                touched[block.idx] = block
+        for block in touched.values():
+            instructions = [instr for instr in block.instructions if instr not in ids]
+            first = block.instructions[0]
+            if not instructions and forget:
+                instructions = [first]
+                self.ForgetValue(first)
+                instruction = self.FindInstruction(first)
+                instruction.op = OP.EMPTY
+                instruction.a = 0
+                instruction.b = 0
+            elif not instructions:
+                instructions = [self.instrList.AddEmptyInstruction()]
+                self.instr_blocks[instructions[0]] = block
+            if instructions[0] != first:
+                self.RetargetBranches(block, first, instructions[0])
+            for instr in block.instructions:
+                if instr in ids and instr != instructions[0]:
+                    if forget:
+                        self.ForgetInstruction(instr)
+                    detached += 1
+            block.instructions = instructions
+            self.stale_blocks.add(block.idx)
+        return detached
+
+    # Insert a new block on the edge { pred } -> { succ } (keeping its place in both edge arrays)
+    #   A split back edge stays the back edge into { succ }, so { succ } still heads its loop
+    #   The new block ends in a bra to { succ }, so it does not need to be laid out ahead of { succ }. It takes
+    #   { succ }'s place in { pred }'s edges, so a fall-through from { pred } now falls into the new block
+    #   Return: New block, holding the bra
+    def SplitEdge(self, pred, succ) -> BlockNode:
+        self.InvalidateOrders()
+        block = self.NewBlock()
+        i = pred.succs.index(succ)
+        j = succ.preds.index(pred)
+        kind = pred.succ_kinds[i]
+        pred.succs = pred.succs[:i] + (block,) + pred.succs[i + 1 :]
+        succ.preds = succ.preds[:j] + (block,) + succ.preds[j + 1 :]
+        into, out = (BlockNode.EDGE_BASIC, kind) if kind == BlockNode.EDGE_BACK else (kind, BlockNode.EDGE_BRANCH)
+        pred.succ_kinds = pred.succ_kinds[:i] + (into,) + pred.succ_kinds[i + 1 :]
+        block.preds, block.pred_kinds = (pred,), (into,)
+        block.succs, block.succ_kinds = (succ,), (out,)
+        succ.pred_kinds = succ.pred_kinds[:j] + (out,) + succ.pred_kinds[j + 1 :]
+        block.symtable = None
+        self.AddScope(block, pred)
+        id = self.instrList.AddInstruction(OP.BRA, succ.instructions[0], 0)
+        block.AddInstructionToBlock(id)
+        self.RegisterInstruction(block, id)
+        # A branch from { pred } to { succ } now lands on the new block
+        branch = self.FindInstruction(pred.instructions[-1]) if pred.instructions else None
+        if branch is not None and branch.op == OP.BRA and branch.a == succ.instructions[0]:
+            branch.a = id
+        elif branch is not None and OP.IS_BRANCH[branch.op] and branch.b == succ.instructions[0]:
+            branch.b = id
+        return block
+
+    # Remove { block } with its edges and instructions
+    def RemoveBlock(self, block) -> None:
+        self.InvalidateOrders()
+        for succ in list(block.succs):
+            block.RemoveEdge(succ)
+        for pred in list(block.preds):
+            pred.RemoveEdge(block)
+        for instr in block.instructions:
+            self.ForgetInstruction(instr)
+        block.instructions = []
+        self.block_list[block.idx] = None
+
+    # Return: While join blocks heading a loop (with a back edge), outer loops before the loops they contain
+    def LoopHeaders(self) -> list:
+        return [block for block in self.ReversePostorder() if BlockNode.EDGE_BACK in block.pred_kinds]
+
+    # Return: Blocks of the loop headed by { header }, in reverse postorder
+    #   Found by walking the predecessors back from the end of the loop body up to { header }
+    def LoopBlocks(self, header) -> list:
+        body = {header.idx}
+        stack = [pred for pred, kind in zip(header.preds, header.pred_kinds) if kind == BlockNode.EDGE_BACK]
+        while stack:
+            block = stack.pop()
+            if block.idx not in body:
+                body.add(block.idx)
+                stack.extend(block.preds)
+        number = self.orders.get("rpo_number")
+        if number is None:
+            number = self.orders["rpo_number"] = {block.idx: i for i, block in enumerate(self.ReversePostorder())}
+        return sorted((self.block_list[idx] for idx in body), key=lambda block: number[block.idx])
+
+    # Return: Preheader of the loop headed by { header }: the block before the loop when it only leads into
+    #   the loop, otherwise a new block on the loop entry edge
+    def Preheader(self, header) -> BlockNode:
+        entries = [pred for pred, kind in zip(header.preds, header.pred_kinds) if kind != BlockNode.EDGE_BACK]
+        pred = entries[0]
+        if len(entries) == 1 and len(pred.succs) == 1 and pred is not self.root:
+            return pred
+        block = self.SplitEdge(pred, header)
+        log.debug("BB%d: new preheader of loop BB%d", block.idx, header.idx)
+        return block
+
+    # Append the instructions and outgoing edges of { succ } to { block } and remove { succ }
+    #   { succ } must be the only successor of { block } and { block } its only predecessor
+    def MergeBlocks(self, block, succ) -> None:
+        self.InvalidateOrders()
+        block.RemoveEdge(succ)
+        succ.MoveEdges(block)
+        for instr in succ.instructions:
+            self.instr_blocks[instr] = block
+        block.instructions += succ.instructions
+        self.stale_blocks.add(block.idx)
+        succ.instructions = []
+        self.block_list[succ.idx] = None
+
+    # Drop removed instruction { id } from the block registry, the const pool and the CSE table
+    def ForgetInstruction(self, id) -> None:
+        self.instr_blocks.pop(id, None)
+        self.instr_positions.pop(id, None)
+        self.ForgetValue(id)
+
+    # Drop instruction { id } from the const pool and the CSE table (its value is no longer available)
+    def ForgetValue(self, id) -> None:
+        instruction = self.FindInstruction(id)
+        if instruction.op == OP.CONST and self.consts.get(instruction.a) == id:
+            del self.consts[instruction.a]
+        if self.values is not None:
+            self.values.Remove(id)
     # ------------------------------------------------------------------------------------
 
+    # Traversals ---------------------------------------------------------------------------
+    # Depth first walk from { starts }, entering a join block only once all of its predecessors were walked
+    #   while_joins: enter while join blocks (on the first visit), otherwise never enter them
+    #   branch_first: walk succs[1] before succs[0]
+    def Walk(self, starts, while_joins=True, branch_first=False):
+        stack = [block for block in reversed(starts) if block]
+        arrived = {}  # Join block idx -> predecessors walked so far
+        seen_while_join = set()
+        while stack:
+            curr_block = stack.pop()
+            yield curr_block
+            for succ in (curr_block.succs if branch_first else reversed(curr_block.succs)):
+                if succ.type == BlockNode.JOIN:
+                    count = arrived.get(succ.idx, 0) + 1
+                    arrived[succ.idx] = count
+                    if count == len(succ.preds):
+                        stack.append(succ)
+                elif succ.type == BlockNode.WHILE_JOIN:
+                    if while_joins and succ.idx not in seen_while_join:
+                        stack.append(succ)
+                        seen_while_join.add(succ.idx)
+                else:
+                    stack.append(succ)
+
+    # Blocks in walk order from the root (the order blocks are printed and drawn in), cached
+    def Preorder(self, branch_first=False) -> list:
+        key = "branch_preorder" if branch_first else "preorder"
+        order = self.orders.get(key)
+        if order is None:
+            order = self.orders[key] = list(self.Walk([self.root], branch_first=branch_first))
+        return order
+
+    # Blocks reachable from the root in depth first postorder (children before parents), cached
+    def Postorder(self) -> list:
+        order = self.orders.get("postorder")
+        if order is None:
+            order = []
+            seen = {self.root.idx}
+            stack = [(self.root, iter(self.root.succs))]
+            while stack:
+                block, succs = stack[-1]
+                for succ in succs:
+                    if succ.idx not in seen:
+                        seen.add(succ.idx)
+                        stack.append((succ, iter(succ.succs)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(block)
+            self.orders["postorder"] = order
+        return order
+
+    # Reverse postorder (parents before children, except along loop back edges), cached
+    def ReversePostorder(self) -> list:
+        order = self.orders.get("rpo")
+        if order is None:
+            order = self.orders["rpo"] = self.Postorder()[::-1]
+        return order
+
+    # Dominator tree / dominance frontiers of the current CFG, cached
+    def Dominators(self) -> DominatorTree:
+        dominators = self.orders.get("dominators")
+        if dominators is None:
+            dominators = self.orders["dominators"] = DominatorTree(self)
+        return dominators
+
+    # Forget cached orders, called whenever blocks are linked
+    def InvalidateOrders(self) -> None:
+        self.orders.clear()
+
+    # Create a new block and add it to the registry
+    def NewBlock(self) -> BlockNode:
+        block = BlockNode(self.index)
+        self.block_list.append(block)
+        self.index += 1
+        return block
+
     # Add root (called on creation)
     #   Return: New block
     def AddRoot(self) -> BlockNode:
-        new_block = BlockNode(self.index)
-        new_block.dom_instructions = (
-            {  # List of previous dom instruction ids (only those that has CSE enabled)
-                OP.CONST: [],
-                OP.ADD: [],
-                OP.SUB: [],
-                OP.MUL: [],
-                OP.DIV: [],
-                OP.CMP: [],
-                OP.LOAD: [],  # also includes stores and adda
-            }
-        )
-        for i in self.list_of_vars:
-            new_block.vartable[i] = 0
-            new_block.usedvartable[i] = []
+        new_block = self.NewBlock()
+        self.AddScope(new_block)
         self.SetCurrent(new_block)
-        self.index += 1
         return new_block
 
     # Adds a const instruction to the root
     def AddConst(self, instr) -> None:
         self.root.instructions.append(instr)
+        self.RegisterInstruction(self.root, instr)
+        self.consts.setdefault(self.FindInstruction(instr).a, instr)
 
     # Add block directly below the arg block
     #   Return: New block
     def AddBlock(self, block) -> BlockNode:
-        new_block = BlockNode(self.index)
-        block.children[0] = new_block
-        new_block.parents[0] = block
-        new_block.symtable = block.symtable.copy()
-        new_block.dom_instructions = copy.deepcopy(block.dom_instructions)
+        self.InvalidateOrders()
+        new_block = self.NewBlock()
+        block.AddEdge(new_block, BlockNode.EDGE_BASIC)
+        new_block.symtable = block.symtable.Snapshot()
+        self.AddScope(new_block, block)
         self.SetCurrent(new_block)
-        new_block.dom_block = block
-        for i in self.list_of_vars:
-            new_block.vartable[i] = 0
-            new_block.usedvartable[i] = []
-        self.index += 1
         return new_block
 
     # Add If block: Fall-join
     #   Returns: List of new blocks: list[fall block, join block]
     def AddIfBranch(self, block) -> tuple:
-        # Save the block's children for connection later
-        after_block = block.children[0]
+        self.InvalidateOrders()
         # Create "fall-through" path
-        fall_block = BlockNode(self.index)
-        fall_block.symtable = block.symtable.copy()
-        fall_block.dom_instructions = copy.deepcopy(block.dom_instructions)
-        fall_block.dom_block = block
-        for i in self.list_of_vars:
-            fall_block.vartable[i] = 0
-            fall_block.usedvartable[i] = []
+        fall_block = self.NewBlock()
+        fall_block.symtable = block.symtable.Snapshot()
+        self.AddScope(fall_block, block)
         fall_block.type = BlockNode.FALL  # Designate as a branch block
-        self.index += 1
         # Create "join" block
-        join_block = BlockNode(self.index)
-        join_block.symtable = block.symtable.copy()
-        join_block.dom_instructions = copy.deepcopy(block.dom_instructions)
-        join_block.dom_block = block
-        for i in self.list_of_vars:
-            join_block.vartable[i] = 0
-            join_block.usedvartable[i] = []
+        join_block = self.NewBlock()
+        join_block.symtable = block.symtable.Snapshot()
+        self.AddScope(join_block, block)
         join_block.type = BlockNode.JOIN  # Designate as a join block
-        self.index += 1
-        # Finish connections
-        block.SetChildren(fall_block, join_block)
-        fall_block.SetParent(block)
-        fall_block.SetChild(join_block)
-        join_block.SetParents(fall_block, block)
+        # Finish connections (if a block came after, it now comes after the join block)
+        block.MoveEdges(join_block)
+        block.AddEdge(fall_block, BlockNode.EDGE_FALL)
+        fall_block.AddEdge(join_block, BlockNode.EDGE_BRANCH)  # bra at the end of the then part
+        block.AddEdge(join_block, BlockNode.EDGE_BRANCH)
         # Update the new current join_block
         self.current_join_blocks.insert(0, join_block)
-        # If a block came after, set the "After block"""
-        if after_block is not None:
-            join_block.SetChild(after_block)
-            if after_block.parents[0].idx == block.idx:
-                after_block.SetParent(join_block)
-            else:
-                after_block.SetParents(after_block.parents[0], join_block)
         return [fall_block, join_block]
 
     # Add Else branch as a "sibling" to the given fall_branch
@@ -417,77 +855,50 @@ class BlockTree:
         bot_fall_block: BlockNode,
         join_block: BlockNode,
     ) -> BlockNode:
+        self.InvalidateOrders()
         # Create "fall through" path
-        branch_block = BlockNode(self.index)
-        branch_block.symtable = block.symtable.copy()
-        branch_block.dom_instructions = copy.deepcopy(block.dom_instructions)
-        branch_block.dom_block = block
+        branch_block = self.NewBlock()
+        branch_block.symtable = block.symtable.Snapshot()
+        self.AddScope(branch_block, block)
         branch_block.type = BlockNode.BRANCH  # Designate as a branch block
-        for i in self.list_of_vars:
-            branch_block.vartable[i] = 0
-            branch_block.usedvartable[i] = []
-        self.index += 1
-        # Finish connections
-        branch_block.SetParent(block)
-        branch_block.SetChild(join_block)
-        block.SetChildren(top_fall_block, branch_block)
-        join_block.SetParents(bot_fall_block, branch_block)
-        self.printBlock(branch_block, branch_block.idx)
+        # Finish connections: the branch now goes to the else block, which falls through to the join block
+        block.RemoveEdge(join_block)
+        block.AddEdge(branch_block, BlockNode.EDGE_BRANCH)
+        branch_block.AddEdge(join_block, BlockNode.EDGE_FALL)
+        if log.isEnabledFor(logging.DEBUG):
+            self.printBlock(branch_block, branch_block.idx)
         return branch_block
 
     # Add the while branch blocks given the current block (Join block, Fall block, Follow block)
     def AddWhileBranch(self, block: BlockNode) -> tuple:
+        self.InvalidateOrders()
         # print("################################### DEBUG ##################################### ")
         # print("Before While branch")
         # self.print()
-        after_block = block.children[0]
         # Create join block
-        join_block = BlockNode(self.index)
-        join_block.symtable = block.symtable.copy()
-        join_block.dom_instructions = copy.deepcopy(block.dom_instructions)
-        join_block.dom_block = block
+        join_block = self.NewBlock()
+        join_block.symtable = block.symtable.Snapshot()
+        self.AddScope(join_block, block)
         join_block.type = BlockNode.WHILE_JOIN
-        for i in self.list_of_vars:
-            join_block.vartable[i] = 0
-            join_block.usedvartable[i] = []
-        self.index += 1
         # Create Fall block
-        fall_block = BlockNode(self.index)
-        fall_block.symtable = block.symtable.copy()
-        fall_block.dom_instructions = copy.deepcopy(block.dom_instructions)
-        fall_block.dom_block = join_block
+        fall_block = self.NewBlock()
+        fall_block.symtable = block.symtable.Snapshot()
+        self.AddScope(fall_block, block)
         fall_block.type = BlockNode.FALL
-        for i in self.list_of_vars:
-            fall_block.vartable[i] = 0
-            fall_block.usedvartable[i] = []
-        self.index += 1
         # Create Follow block
-        follow_block = BlockNode(self.index)
-        follow_block.symtable = block.symtable.copy()
-        follow_block.dom_instructions = copy.deepcopy(block.dom_instructions)
-        follow_block.dom_block = join_block
+        follow_block = self.NewBlock()
+        follow_block.symtable = block.symtable.Snapshot()
+        self.AddScope(follow_block, block)
         follow_block.type = BlockNode.FOLLOW
-        for i in self.list_of_vars:
-            follow_block.vartable[i] = 0
-            follow_block.usedvartable[i] = []
-        self.index += 1
-        # Create connections
-        block.SetChild(join_block)
-        fall_block.SetParent(join_block)
-        join_block.SetChildren(fall_block, follow_block)
-        follow_block.SetParent(join_block)
+        # Create connections (if a block came after, it now comes after the follow block)
+        block.MoveEdges(follow_block)
+        block.AddEdge(join_block, BlockNode.EDGE_BASIC)
+        join_block.AddEdge(fall_block, BlockNode.EDGE_FALL)
+        join_block.AddEdge(follow_block, BlockNode.EDGE_FOLLOW)
         # Create "loop back" connection
-        fall_block.SetChild(join_block)
-        join_block.SetParents(block, fall_block)
+        fall_block.AddEdge(join_block, BlockNode.EDGE_BACK)
         # Update the new current join_block
         self.current_join_blocks.insert(0, join_block)
-        # If a block came after, set the "After block"""
-        if after_block is not None:
-            follow_block.SetChild(after_block)
-            if after_block.parents[0].idx == block.idx:
-                after_block.SetParent(follow_block)
-            else:
-                after_block.SetParents(after_block.parents[0], follow_block)
         # print("After While branch")
         # self.print()
         # print("################################### ##################################### ")
@@ -505,72 +916,47 @@ class BlockTree:
     # ---------------------------------------------------------------------------------------------
 
     def InsertInstruction(self, block: BlockNode, id):
-        print(
-            "Inserting to BB"
-            + str(block.idx)
-            + " | "
-            + self.FindInstruction(id).toString()
-        )
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Inserting to BB%d | %s", block.idx, self.FindInstruction(id).toString())
         block.AddInstructionToBlock(id)
-        instr = self.FindInstruction(id)
-        if instr.op in OP.DOM_CODES:
-            if instr.op == OP.LOAD or instr.op == OP.ADDA or instr.op == OP.STORE:
-                block.dom_instructions[OP.LOAD].insert(0, id)
-            else:
-                block.dom_instructions[instr.op].insert(0, id)
-        if block.waiting_on[0] > 0:
+        self.RegisterInstruction(block, id)
+        if self.values is not None:
+            self.values.Insert(block, self.FindInstruction(id))
+        if block.waiting_on and block.waiting_on[0] > 0:
             self.LinkBlock(id, block)
 
     def InsertInstructionAtFront(self, block: BlockNode, id):
-        print(
-            "Inserting to front of BB"
-            + str(block.idx)
-            + " | "
-            + self.FindInstruction(id).toString()
-        )
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Inserting to front of BB%d | %s", block.idx, self.FindInstruction(id).toString())
         block.AddInstructionToFront(id)
-        instr = self.FindInstruction(id)
-        if instr.op in OP.DOM_CODES:
-            if instr.op == OP.LOAD or instr.op == OP.ADDA or instr.op == OP.STORE:
-                block.dom_instructions[OP.LOAD].insert(0, id)
-            else:
-                block.dom_instructions[instr.op].insert(0, id)
-        if block.waiting_on[0] > 0:
+        self.RegisterInsertedInstruction(block, id)
+        if self.values is not None:
+            self.values.Insert(block, self.FindInstruction(id))
+        if block.waiting_on and block.waiting_on[0] > 0:
             self.LinkBlock(id, block)
 
     def InsertInstructionAtIndex(self, block: BlockNode, id, idx):
-        print(
-            "Inserting to idx "
-            + str(idx)
-            + " of BB"
-            + str(block.idx)
-            + " | "
-            + self.FindInstruction(id).toString()
-        )
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Inserting to idx %d of BB%d | %s", idx, block.idx, self.FindInstruction(id).toString())
         block.AddInstructionToIndex(id, idx)
-        instr = self.FindInstruction(id)
-        if instr.op in OP.DOM_CODES:
-            if instr.op == OP.LOAD or instr.op == OP.ADDA or instr.op == OP.STORE:
-                block.dom_instructions[OP.LOAD].insert(0, id)
-            else:
-                block.dom_instructions[instr.op].insert(0, id)
+        self.RegisterInsertedInstruction(block, id)
+        if self.values is not None:
+            self.values.Insert(block, self.FindInstruction(id))
 
     # Inserts a new instruction in the InstructionList in the block tree
+    #   Each const value is only added to the root once
     def AddConstInstruction(self, const):
         id = self.FindConst(const)
         if id != 0:
             return id
         id = self.instrList.AddConst(const)
         self.InsertInstruction(self.root, id)
+        self.consts[const] = id
         return id
 
+    # Return: Instruction ID of the const instruction for { const }, or 0 if there is none
     def FindConst(self, const) -> int:
-        for ids in self.root.instructions:
-            instruction = self.FindInstruction(ids)
-            if instruction:
-                if instruction.op == OP.CONST and instruction.a == const:
-                    return instruction.instr_id
-        return 0
+        return self.consts.get(const, 0)
 
     # Add an instruction to the current block
     #   Return the instruction ID
@@ -579,7 +965,7 @@ class BlockTree:
         id = self.FindDomInstruction(
             op, a, b
         )  # Check if there is a domating instruction
-        print(str(op) + " " + str(a) + " " + str(b) + " | Find dom?: " + str(id))
+        log.debug("%s %s %s | Find dom?: %s", OP.NAMES[op], a, b, id)
         if id != 0:
             return id  # If there is, return the dom instruction's ID
         id = self.instrList.AddInstruction(op, a, b)  # Otherwise make a new instruction
@@ -587,7 +973,7 @@ class BlockTree:
         return id
     
     def AddInstructionNoCSE(self, op, a, b) -> int:
-        print(str(op) + " " + str(a) + " " + str(b) + " | Not looking for a dom")
+        log.debug("%s %s %s | Not looking for a dom", OP.NAMES[op], a, b)
         id = self.instrList.AddInstruction(op, a, b)  # Otherwise make a new instruction
         self.InsertInstruction(self.current_block, id)
         return id
@@ -627,12 +1013,6 @@ class BlockTree:
         self.InsertInstruction(self.current_block, id)
         return id
 
-    # Function for use in while loops
-    def InsertPhiAtFront(self, a, b):
-        id = self.instrList.AddPhiInstruction(a, b)
-        self.InsertInstructionAtFront(self.current_block, id)
-        return id
-
     # Function for use in while loops
     def InsertPhiAtIndex(self, a, b, idx):
         id = self.instrList.AddPhiInstruction(a, b)
@@ -648,6 +1028,8 @@ class BlockTree:
     def AddKillInstruction(self, array_name):
         id = self.instrList.AddKillInstruction(array_name)
         self.InsertInstructionAtFront(self.current_block, id)
+        if self.values is not None:
+            self.values.Kill(self.current_block, id)
         return id
 
     # --------------------------------------------------------------
@@ -658,66 +1040,36 @@ class BlockTree:
 
     # Search for a block by its ID
     #   Return: The block item, or None if not found
-    def FindBlock(self, root, x) -> int:
-        if root is None or root.idx == x:
-            return root
-        print(str(root.idx))
-        l = self.FindBlock(root.children[0], x)
-        r = self.FindBlock(root.children[1], x)
-        if l:
-            return l
-        if r:
-            return r
+    def FindBlock(self, x) -> BlockNode:
+        if 0 <= x < len(self.block_list):
+            return self.block_list[x]
+        return None
 
+    # Log a block's contents (debug level, callers should check log.isEnabledFor first)
     def printBlock(self, block, num):
-        print("---------------------------")
-        print("BB" + str(num) + " " + str(block.type))
+        lines = ["---------------------------", "BB" + str(num) + " " + str(block.type)]
         for instr in block.instructions:
-            self.instrList.FindInstruction(instr).printInstruction()
-        print("Parents: ")
-        for parent in block.parents:
-            if parent:
-                print("BB" + str(parent.idx))
-        print("Children: ")
-        for child in block.children:
-            if child:
-                print("BB" + str(child.idx))
-        print("Dom instructions:")
-        for instr in block.dom_instructions:
-            print(str(instr) + " : " + str(block.dom_instructions[instr]))
-        print("Sym table:")
-        for sym in block.symtable:
-            print(str(sym) + " : " + str(block.symtable[sym]))
-        print("Invariant table: ")
-        for sym in block.vartable:
-            print(str(sym) + " : " + str(block.vartable[sym]))
-        print("Used Var table:")
-        for sym in block.usedvartable:
-            print(str(sym) + " : " + str(block.usedvartable[sym])) 
-
-    # Print blocks with "level-order traversal" using FIFO
+            instruction = self.instrList.FindInstruction(instr)
+            lines.append(
+                str(instruction.instr_id) + " | " + str(OP.NAMES[instruction.op]) + " " + str(instruction.a) + " " + str(instruction.b)
+            )
+        lines.append("Predecessors: ")
+        for pred, kind in zip(block.preds, block.pred_kinds):
+            lines.append("BB" + str(pred.idx) + " (" + BlockNode.EDGE_NAMES[kind] + ")")
+        lines.append("Successors: ")
+        for succ, kind in zip(block.succs, block.succ_kinds):
+            lines.append("BB" + str(succ.idx) + " (" + BlockNode.EDGE_NAMES[kind] + ")")
+        if block.symtable is not None:
+            lines.append("Sym table:")
+            for sym, value in self.SymbolNames(block.symtable).items():
+                lines.append(str(sym) + " : " + str(value))
+        if block.idx in self.loop_variants:
+            lines.append("Loop variants: " + str(self.VariableNames(self.loop_variants[block.idx])))
+        log.debug("\n".join(lines))
+
+    # Log blocks with "level-order traversal" using FIFO (debug level)
     def print(self) -> None:
-        stack = []
-        seen_join = []
-        seen_while_join = []
-        curr_block = None
-        num = 0
-        stack.append(self.root)
-        # Construct the nodes first
-        while len(stack) > 0:
-            curr_block = stack.pop(0)
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        for curr_block in self.Preorder():
             self.printBlock(curr_block, curr_block.idx)
-            num += 1
-            for children in reversed(curr_block.children):
-                if children:
-                    if children.type == BlockNode.JOIN:
-                        if children.idx in seen_join:
-                            stack.insert(0, children)
-                        else:
-                            seen_join.append(children.idx)
-                    elif children.type == BlockNode.WHILE_JOIN:
-                        if children.idx not in seen_while_join:
-                            stack.insert(0, children)
-                            seen_while_join.append(children.idx)
-                    else:
-                        stack.insert(0, children)
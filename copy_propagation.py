@@ -0,0 +1,93 @@
+# Author: Brandon Wang
+#
+# Copy propagation and trivial phi elimination over a finished BlockTree
+#   - A phi is trivial when its operands, leaving out the phi itself, are all the same value:
+#     phi(x, x) or phi(x, phi). It is a copy of x, and x dominates the phi's block
+#   - The IR has no move instruction, the symtables already resolve let b <- a. What is left are the
+#     identities add x #0 / add #0 x / sub x #0 / mul x #1 / mul #1 x / lsh x #0, which are copies of x too
+#   - Every use of a copy is rewritten to the copied value. A phi using a removed copy can become trivial
+#     in turn, so the phis using it are checked again until nothing changes
+
+import logging
+
+from op_codes import OP
+
+log = logging.getLogger("smpl.copy")
+
+
+class CopyPropagation:
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.replaced = {}  # Copy -> the value it copies (chains are followed)
+        self.removed_phis = 0
+        self.removed_copies = 0
+
+    # Remove trivial phis and identities until nothing changes
+    #   Return: (phis removed, identities removed)
+    def Run(self) -> tuple:
+        blocks = self.blocks
+        users = blocks.Users()
+        work = []
+        for block in blocks.Blocks():
+            work.extend(block.instructions)
+        work.reverse()  # Pop in program order
+        while work:
+            instr = work.pop()
+            if instr in self.replaced:
+                continue
+            value = self.Copied(instr)
+            if value is None:
+                continue
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%s is a copy of %s", blocks.FindInstruction(instr).toString(), value)
+            self.replaced[instr] = value
+            if blocks.FindInstruction(instr).op == OP.PHI:
+                self.removed_phis += 1
+            else:
+                self.removed_copies += 1
+            work.extend(users.get(instr, ()))
+        blocks.ReplaceUses(self.replaced)
+        blocks.RemoveInstructions(self.replaced)
+        log.info("Copy propagation: removed %d trivial phis, %d identities", self.removed_phis, self.removed_copies)
+        return (self.removed_phis, self.removed_copies)
+
+    # Return: Value { value } stands for once the copies found so far are removed
+    def Resolve(self, value):
+        replaced = self.replaced
+        if value not in replaced:
+            return value
+        root = replaced[value]
+        while root in replaced:
+            root = replaced[root]
+        while value in replaced and replaced[value] != root:  # Shorten the chain for the next lookup
+            replaced[value], value = root, replaced[value]
+        return root
+
+    # Return: Const value of operand { value }, or None
+    def Constant(self, value):
+        if type(value) is not int or value <= 0:
+            return None
+        instruction = self.blocks.FindInstruction(value)
+        if instruction is None or instruction.op != OP.CONST or type(instruction.a) is not int:
+            return None
+        return instruction.a
+
+    # Return: Value copied by instruction { instr }, or None if it is not a copy
+    def Copied(self, instr):
+        instruction = self.blocks.FindInstruction(instr)
+        op = instruction.op
+        if op == OP.PHI:
+            operands = {self.Resolve(instruction.a), self.Resolve(instruction.b)}
+            operands.discard(instr)
+            return operands.pop() if len(operands) == 1 else None
+        if op == OP.ADD or op == OP.MUL:
+            identity = 0 if op == OP.ADD else 1
+            if self.Constant(self.Resolve(instruction.b)) == identity:
+                return self.Resolve(instruction.a)
+            if self.Constant(self.Resolve(instruction.a)) == identity:
+                return self.Resolve(instruction.b)
+            return None
+        if op == OP.SUB or op == OP.LSH:
+            if self.Constant(self.Resolve(instruction.b)) == 0:
+                return self.Resolve(instruction.a)
+        return None
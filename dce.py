@@ -0,0 +1,208 @@
+# Author: Brandon Wang
+#
+# Dead code elimination and CFG simplification over a finished BlockTree, repeated until nothing changes
+#   - Blocks that cannot be reached from the root are removed (phis keep the input of the remaining edge)
+#   - Mark and sweep over the SSA use chains: instructions with effects (OP.HAS_EFFECT: store, read,
+#     write, writeNL, end and branches) are live, and so is every value a live instruction uses.
+#     Everything else (unused arithmetic, loads and phis, kills, empty placeholders) is removed
+#   - A store overwritten in its block (same adda) before any load of the array is removed
+#   - A conditional branch whose both sides reach the same block through empty blocks (and no phis) is
+#     dropped with the empty blocks, then chains of blocks (single successor -> single predecessor) are merged
+#   The root keeps the constants and is never merged
+
+import logging
+
+from blocks import BlockNode
+from op_codes import OP
+
+log = logging.getLogger("smpl.dce")
+
+
+class DeadCodeElimination:
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.removed_blocks = 0
+        self.removed_stores = 0
+        self.merged_blocks = 0
+
+    # Eliminate dead code until nothing changes
+    #   Return: (instructions removed, blocks removed)
+    def Run(self) -> tuple:
+        blocks = self.blocks
+        before = sum(len(block.instructions) for block in blocks.Blocks())
+        block_count = len(blocks.Blocks())
+        changed = True
+        while changed:
+            changed = self.RemoveUnreachable()
+            changed |= self.Sweep(self.Mark())
+            changed |= self.RemoveDeadStores()
+            changed |= self.SimplifyBranches()
+            changed |= self.MergeChains()
+        after = sum(len(block.instructions) for block in blocks.Blocks())
+        self.removed_blocks = block_count - len(blocks.Blocks())
+        log.info(
+            "DCE: removed %d instructions, %d blocks | %d dead stores, %d blocks merged",
+            before - after,
+            self.removed_blocks,
+            self.removed_stores,
+            self.merged_blocks,
+        )
+        return (before - after, self.removed_blocks)
+
+    # Remove the blocks that cannot be reached from the root
+    #   Return: True if a block was removed
+    def RemoveUnreachable(self) -> bool:
+        blocks = self.blocks
+        reachable = {block.idx for block in blocks.Postorder()}
+        unreachable = [block for block in blocks.Blocks() if block.idx not in reachable]
+        if not unreachable:
+            return False
+        # Phis of reachable blocks lose the inputs of the edges from removed blocks
+        replaced = {}
+        for block in blocks.Blocks():
+            if block.idx not in reachable:
+                continue
+            kept = [i for i, pred in enumerate(block.preds) if pred.idx in reachable]
+            if len(kept) == len(block.preds):
+                continue
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if instruction.op == OP.PHI and len(kept) == 1:
+                    replaced[instr] = (instruction.a, instruction.b)[kept[0]]
+        for block in unreachable:
+            log.debug("BB%d is unreachable", block.idx)
+            blocks.RemoveBlock(block)
+        blocks.ReplaceUses(replaced)
+        blocks.RemoveInstructions(replaced)
+        return True
+
+    # Return: Set of the live instruction IDs
+    def Mark(self) -> set:
+        blocks = self.blocks
+        live = set()
+        work = []
+        for block in blocks.Blocks():
+            for instr in block.instructions:
+                if OP.HAS_EFFECT[blocks.FindInstruction(instr).op]:
+                    live.add(instr)
+                    work.append(instr)
+        while work:
+            instruction = blocks.FindInstruction(work.pop())
+            for value in blocks.ValueOperands(instruction):
+                if value not in live:
+                    live.add(value)
+                    work.append(value)
+        return live
+
+    # Remove the instructions that are not { live }
+    #   Return: True if an instruction was removed
+    def Sweep(self, live) -> bool:
+        blocks = self.blocks
+        dead = set()
+        for block in blocks.Blocks():
+            for instr in block.instructions:
+                if instr not in live:
+                    dead.add(instr)
+        # A block left without instructions keeps a placeholder, which is not a change
+        return blocks.RemoveInstructions(dead) > 0
+
+    # Return: Const ID of the array base addressed by adda { adda }, or None if not known
+    def ArrayBase(self, adda):
+        add = self.blocks.FindInstruction(self.blocks.FindInstruction(adda).b)
+        if add is None or add.op != OP.ADD or add.a != "#BASE":
+            return None
+        return add.b
+
+    # Remove stores overwritten in their block before the array is loaded from
+    #   Return: True if a store was removed
+    def RemoveDeadStores(self) -> bool:
+        blocks = self.blocks
+        replaced = {}  # Dead store -> the value it stored (loads reuse a store's ID as the loaded value)
+        for block in blocks.Blocks():
+            pending = {}  # adda ID -> store not read yet
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if instruction.op == OP.STORE:
+                    if instruction.a in pending:
+                        dead = blocks.FindInstruction(pending[instruction.a])
+                        log.debug("BB%d: %s is overwritten", block.idx, dead.toString())
+                        replaced[dead.instr_id] = dead.b
+                    pending[instruction.a] = instr
+                elif instruction.op == OP.LOAD and pending:
+                    # Another index may alias, so any load of the array keeps its stores
+                    base = self.ArrayBase(instruction.a)
+                    for adda in list(pending):
+                        if base is None or self.ArrayBase(adda) in (base, None):
+                            del pending[adda]
+        if not replaced:
+            return False
+        self.removed_stores += len(replaced)
+        blocks.ReplaceUses(replaced)
+        blocks.RemoveInstructions(replaced)
+        return True
+
+    # Return: True if { block } only passes control on (empty placeholder and / or bra) from { pred }
+    def IsForwarder(self, block, pred) -> bool:
+        if block is self.blocks.root or block.preds != (pred,) or len(block.succs) != 1:
+            return False
+        for instr in block.instructions:
+            if self.blocks.FindInstruction(instr).op not in (OP.EMPTY, OP.BRA):
+                return False
+        return True
+
+    # Drop conditional branches whose both sides reach the same block through empty blocks
+    #   Return: True if a branch was dropped
+    def SimplifyBranches(self) -> bool:
+        blocks = self.blocks
+        changed = False
+        for block in blocks.Blocks():
+            if len(block.succs) != 2 or not block.instructions:
+                continue
+            branch = blocks.FindInstruction(block.instructions[-1])
+            if not OP.IS_BRANCH[branch.op] or branch.op == OP.BRA:
+                continue
+            sides = [succ.succs[0] if self.IsForwarder(succ, block) else succ for succ in block.succs]
+            join = sides[0]
+            if join is not sides[1] or join is block or join.type == BlockNode.WHILE_JOIN:
+                continue
+            if any(blocks.FindInstruction(instr).op == OP.PHI for instr in join.instructions):
+                continue
+            log.debug("BB%d: %s leads to BB%d either way", block.idx, branch.toString(), join.idx)
+            for succ in list(block.succs):
+                if succ is join:
+                    block.RemoveEdge(succ)
+                else:
+                    blocks.RemoveBlock(succ)
+            block.AddEdge(join, BlockNode.EDGE_BASIC)
+            blocks.RemoveInstructions({branch.instr_id})
+            blocks.InvalidateOrders()
+            changed = True
+        return changed
+
+    # Merge each block into its predecessor when it is the predecessor's only successor and vice versa
+    #   Return: True if blocks were merged
+    def MergeChains(self) -> bool:
+        blocks = self.blocks
+        changed = False
+        for block in blocks.Blocks():
+            if block is blocks.root or blocks.FindBlock(block.idx) is not block:
+                continue  # The root, or merged into a block before it
+            while len(block.succs) == 1:
+                succ = block.succs[0]
+                if succ is blocks.root or succ is block or len(succ.preds) != 1:
+                    break
+                if any(blocks.FindInstruction(instr).op == OP.PHI for instr in succ.instructions):
+                    break
+                log.debug("Merging BB%d into BB%d", succ.idx, block.idx)
+                last = blocks.FindInstruction(block.instructions[-1])
+                blocks.MergeBlocks(block, succ)
+                # The bra into { succ } and empty placeholders are no longer needed
+                dropped = {
+                    instr
+                    for instr in block.instructions
+                    if instr == last.instr_id and last.op == OP.BRA or blocks.FindInstruction(instr).op == OP.EMPTY
+                }
+                blocks.RemoveInstructions(dropped)
+                self.merged_blocks += 1
+                changed = True
+        return changed
@@ -0,0 +1,135 @@
+# Author: Brandon Wang
+#
+# Dominator tree and dominance frontiers of a BlockTree's control flow graph
+#   - Immediate dominators are computed with the iterative algorithm of Cooper, Harvey and Kennedy
+#     ("A Simple, Fast Dominance Algorithm") over the blocks in reverse postorder
+#   - The dominator tree is numbered in depth first pre / post order, so Dominates(a, b) is two compares
+#   - Dominance frontiers are collected by walking up from the predecessors of each join point
+#   Predecessors come from the successor edges (the edges the branches actually take)
+
+import logging
+
+log = logging.getLogger("smpl.dominators")
+
+
+class DominatorTree:
+    def __init__(self, blocks):
+        order = blocks.ReversePostorder()  # Only blocks reachable from the root
+        self.order = order
+        self.number = {block.idx: i for i, block in enumerate(order)}  # Block idx -> reverse postorder number
+        number = self.number
+        # Predecessors, by reverse postorder number
+        preds = [[] for _ in order]
+        for i, block in enumerate(order):
+            for succ in block.succs:
+                if succ.idx in number:
+                    preds[number[succ.idx]].append(i)
+        self.preds = preds
+        # Immediate dominators (idom[0] = 0 for the root), by reverse postorder number
+        idom = [None] * len(order)
+        if order:
+            idom[0] = 0
+        changed = True
+        while changed:
+            changed = False
+            for i in range(1, len(order)):
+                new_idom = None
+                for pred in preds[i]:
+                    if idom[pred] is None:
+                        continue
+                    if new_idom is None:
+                        new_idom = pred
+                        continue
+                    # Intersect: walk both fingers up to the common dominator
+                    a, b = pred, new_idom
+                    while a != b:
+                        while a > b:
+                            a = idom[a]
+                        while b > a:
+                            b = idom[b]
+                    new_idom = a
+                if idom[i] != new_idom:
+                    idom[i] = new_idom
+                    changed = True
+        self.idom = idom
+        # Dominator tree children and depth first pre / post numbers
+        children = [[] for _ in order]
+        for i in range(1, len(order)):
+            children[idom[i]].append(i)
+        self.children = children
+        self.pre = [0] * len(order)
+        self.post = [0] * len(order)
+        if order:
+            counter = 0
+            stack = [(0, iter(children[0]))]
+            self.pre[0] = counter
+            counter += 1
+            while stack:
+                node, kids = stack[-1]
+                for kid in kids:
+                    self.pre[kid] = counter
+                    counter += 1
+                    stack.append((kid, iter(children[kid])))
+                    break
+                else:
+                    stack.pop()
+                    self.post[node] = counter
+                    counter += 1
+        # Dominance frontiers
+        frontiers = [[] for _ in order]
+        for i in range(len(order)):
+            if len(preds[i]) < 2:
+                continue
+            for pred in preds[i]:
+                runner = pred
+                while runner != idom[i]:
+                    if not frontiers[runner] or frontiers[runner][-1] != i:
+                        frontiers[runner].append(i)
+                    runner = idom[runner]
+        self.frontiers = frontiers
+        if log.isEnabledFor(logging.DEBUG):
+            for i, block in enumerate(order):
+                log.debug(
+                    "BB%d: idom BB%d | frontier %s",
+                    block.idx,
+                    order[idom[i]].idx,
+                    ["BB" + str(order[f].idx) for f in frontiers[i]],
+                )
+
+    # Return: Immediate dominator of { block } (None for the root or an unreachable block)
+    def IDom(self, block):
+        i = self.number.get(block.idx)
+        if not i:
+            return None
+        return self.order[self.idom[i]]
+
+    # Return: True if { a } dominates { b } (every block dominates itself)
+    def Dominates(self, a, b) -> bool:
+        i = self.number.get(a.idx)
+        j = self.number.get(b.idx)
+        if i is None or j is None:
+            return False
+        return self.pre[i] <= self.pre[j] and self.post[j] <= self.post[i]
+
+    # Return: True if { a } dominates { b } and is not { b }
+    def StrictlyDominates(self, a, b) -> bool:
+        return a.idx != b.idx and self.Dominates(a, b)
+
+    # Return: Blocks immediately dominated by { block }
+    def Children(self, block) -> list:
+        i = self.number.get(block.idx)
+        if i is None:
+            return []
+        return [self.order[kid] for kid in self.children[i]]
+
+    # Return: Dominance frontier of { block } (where its definitions need phis)
+    def Frontier(self, block) -> list:
+        i = self.number.get(block.idx)
+        if i is None:
+            return []
+        return [self.order[f] for f in self.frontiers[i]]
+
+    # Return: Blocks in dominator tree preorder (every block after its dominators)
+    def Preorder(self) -> list:
+        pre = self.pre
+        return sorted(self.order, key=lambda block: pre[self.number[block.idx]])
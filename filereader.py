@@ -1,29 +1,49 @@
 # Author: Brandon Wang
 
+import logging
+
+log = logging.getLogger("smpl.tokenizer")
+
+
 class FileReader:
 
     # EOF Special Character
     Error = 0
     EOF = 255
 
-    def __init__(self, filename):
-        self.file = open(filename, "r")
+    # Load the whole source into a single buffer that is walked by index
+    #   filename: path of a source file
+    #   source: program text (str or bytes) to read instead of a file
+    def __init__(self, filename=None, source=None):
+        if source is None:
+            source = FileReader.Load(filename)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            source = bytes(source).decode()
+        # Match the newline translation of a text-mode file
+        if "\r" in source:
+            source = source.replace("\r\n", "\n").replace("\r", "\n")
+        self.buffer = source
+        self.length = len(source)
         self.error = 0
         self.pos = 0
 
+    # Read a whole file as text (the tokenizer walks a str, so the file is decoded in one go)
+    @staticmethod
+    def Load(filename) -> str:
+        with open(filename, "rb") as file:
+            return file.read().decode()
+
     def next(self) -> str:
         if self.error == 1:
             return FileReader.Error
-        nextchar = self.file.read(1)
-        if not nextchar:
+        pos = self.pos
+        if pos >= self.length:
             return FileReader.EOF
-        self.pos += 1
-        return nextchar
+        self.pos = pos + 1
+        return self.buffer[pos]
 
     # FileReader.Error() will output an error message with the current file position and set an internal error state
     def Error(self, errorMsg) -> None:
         # Output an error message
-        print(errorMsg)
-        print("FileReader: Current file position = %d" % self.pos)
+        log.error("%s (FileReader: Current file position = %d)", errorMsg, self.pos)
         self.error = 1
- 
@@ -0,0 +1,187 @@
+# Author: Brandon Wang
+#
+# Global value numbering over a finished BlockTree
+#   - Instructions are hashed on (op, value number of a, value number of b), visiting the blocks in reverse
+#     postorder until no number changes (Simpson's RPO algorithm). The hash table starts over on every
+#     pass, and phi inputs not numbered yet (loop back values) are left out, so a loop phi is assumed to
+#     be a copy of its entry value until a pass shows otherwise
+#   - A phi whose inputs all have the same number gets that number. Other phis are hashed with their
+#     block, so phi(x, y) and phi(x', y') in the same join block are congruent when x ~ x' and y ~ y'
+#   - Walking the dominator tree, an instruction congruent to one that dominates it is replaced by it
+#   - A value left in both arms of an if / else (neither arm dominates the other) is hoisted into the
+#     branch block when its operands are available there, then the copy in the other arm is replaced too
+#   Loads, stores and reads keep their own numbers (memory is left to the construction-time CSE and its kills)
+
+import logging
+
+from blocks import BlockNode
+from op_codes import OP
+
+log = logging.getLogger("smpl.gvn")
+
+
+class GlobalValueNumbering:
+    # Ops hashed on their operands' value numbers
+    NUMBERED = [False] * len(OP.NAMES)
+    for op in (OP.ADD, OP.SUB, OP.MUL, OP.DIV, OP.CMP, OP.ADDA, OP.LSH):
+        NUMBERED[op] = True
+    # Ops whose operands are sorted before hashing
+    COMMUTATIVE = [False] * len(OP.NAMES)
+    for op in (OP.ADD, OP.MUL):
+        COMMUTATIVE[op] = True
+    # Ops that can be hoisted out of an if / else arm (no effects, never fault)
+    HOISTABLE = [False] * len(OP.NAMES)
+    for op in (OP.ADD, OP.SUB, OP.MUL, OP.CMP, OP.ADDA, OP.LSH):
+        HOISTABLE[op] = True
+    del op
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.numbers = {}  # Instruction ID -> value number (ID of the first instruction of its class)
+        self.passes = 0  # Passes over the blocks until the numbers settled
+        self.removed = 0  # Redundant instructions removed (phis included)
+        self.removed_phis = 0
+        self.hoisted = 0
+
+    # Number the values, remove the redundant ones, hoist the values of both if / else arms
+    #   Return: Number of redundant instructions removed
+    def Run(self) -> int:
+        self.Number()
+        self.Eliminate()
+        if self.Hoist():
+            self.Eliminate()
+        log.info(
+            "GVN: removed %d redundant instructions (%d phis), %d hoisted out of if / else arms, %d passes"
+            " | construction-time CSE reused %d",
+            self.removed,
+            self.removed_phis,
+            self.hoisted,
+            self.passes,
+            self.blocks.cse_hits,
+        )
+        return self.removed
+
+    # Number every instruction of the reachable blocks until the numbers settle
+    def Number(self) -> None:
+        blocks = self.blocks
+        order = blocks.ReversePostorder()
+        reached = {block.idx for block in order}
+        numbers = self.numbers
+
+        # Value number of operand { value } (constants and names like "#BASE" stand for themselves)
+        def Operand(value):
+            if type(value) is not int or value <= 0:
+                return value
+            return numbers.get(value, value)
+
+        changed = True
+        while changed:
+            changed = False
+            self.passes += 1
+            table = {}  # (op, numbers of a and b) or (phi, block idx, numbers of a and b) -> value number
+            for block in order:
+                for instr in block.instructions:
+                    instruction = blocks.FindInstruction(instr)
+                    op = instruction.op
+                    if op == OP.PHI:
+                        inputs = set()
+                        for value in (instruction.a, instruction.b):
+                            if value in numbers:
+                                inputs.add(numbers[value])
+                            elif blocks.FindInstructionBlock(value).idx not in reached:
+                                inputs.add(value)  # Never numbered, it can only be itself
+                        if len(inputs) == 1:
+                            number = inputs.pop()
+                        elif not inputs:
+                            number = instr
+                        else:
+                            key = (op, block.idx, Operand(instruction.a), Operand(instruction.b))
+                            number = table.setdefault(key, instr)
+                    elif GlobalValueNumbering.NUMBERED[op]:
+                        a, b = Operand(instruction.a), Operand(instruction.b)
+                        if GlobalValueNumbering.COMMUTATIVE[op] and type(a) is int and type(b) is int and b < a:
+                            a, b = b, a
+                        number = table.setdefault((op, a, b), instr)
+                    else:
+                        number = instr
+                    if numbers.get(instr) != number:
+                        numbers[instr] = number
+                        changed = True
+        log.debug("GVN: numbers settled after %d passes", self.passes)
+
+    # Replace each numbered instruction by a congruent instruction dominating it
+    def Eliminate(self) -> None:
+        blocks = self.blocks
+        dominators = blocks.Dominators()
+        if not dominators.order:
+            return
+        numbers = self.numbers
+        leaders = {}  # Value number -> instruction holding it in the blocks dominating the current one
+        added = []  # Value numbers given a leader, in order (popped when leaving a dominator subtree)
+        replaced = {}
+        stack = [(dominators.order[0], None)]  # (block, None) to enter it, (block, len(added)) to leave it
+        while stack:
+            block, mark = stack.pop()
+            if mark is not None:
+                while len(added) > mark:
+                    del leaders[added.pop()]
+                continue
+            stack.append((block, len(added)))
+            for instr in block.instructions:
+                op = blocks.FindInstruction(instr).op
+                if op != OP.PHI and not GlobalValueNumbering.NUMBERED[op]:
+                    continue
+                number = numbers[instr]
+                leader = leaders.get(number)
+                if leader is None:
+                    leaders[number] = instr
+                    added.append(number)
+                    continue
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("BB%d: %s is %d", block.idx, blocks.FindInstruction(instr).toString(), leader)
+                replaced[instr] = leader
+                if op == OP.PHI:
+                    self.removed_phis += 1
+            for child in reversed(dominators.Children(block)):
+                stack.append((child, None))
+        self.removed += len(replaced)
+        blocks.ReplaceUses(replaced)
+        blocks.RemoveInstructions(replaced)
+
+    # Hoist the values computed in both arms of an if / else into the branch block (inner branches first)
+    #   Return: True if an instruction was hoisted
+    def Hoist(self) -> bool:
+        blocks = self.blocks
+        numbers = self.numbers
+        hoisted = 0
+        for block in blocks.Postorder():
+            if len(block.succs) != 2 or block.type == BlockNode.WHILE_JOIN:
+                continue
+            then, other = block.succs
+            if then is other or then.preds != (block,) or other.preds != (block,):
+                continue
+            theirs = {
+                numbers[instr]
+                for instr in other.instructions
+                if GlobalValueNumbering.HOISTABLE[blocks.FindInstruction(instr).op]
+            }
+            if not theirs:
+                continue
+            local = set(then.instructions)
+            moved = []
+            for instr in then.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if not GlobalValueNumbering.HOISTABLE[instruction.op] or numbers[instr] not in theirs:
+                    continue
+                # Operands from before the branch are available, and so are the ones hoisted already
+                if any(value in local for value in blocks.ValueOperands(instruction)):
+                    continue
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("BB%d: hoisting %s out of BB%d", block.idx, instruction.toString(), then.idx)
+                moved.append(instr)
+                local.discard(instr)
+            if moved:
+                blocks.MoveInstructions(moved, block)
+                hoisted += len(moved)
+        self.hoisted += hoisted
+        return hoisted > 0
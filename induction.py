@@ -0,0 +1,200 @@
+# Author: Brandon Wang
+#
+# Induction variables and strength reduction over a finished BlockTree
+#   - A basic induction variable of a while loop is a phi of its join block, phi(init, next), whose loop
+#     value is next = add phi step / add step phi / sub phi step with a loop-invariant step
+#   - A mul of an induction variable (or of its next value) by a loop invariant, like the mul index #4 of an
+#     array access, is replaced by a new induction variable: phi(init * factor, next'), with
+#     next' = add / sub phi' step * factor right after next. The products of the invariants are made in
+#     the loop's preheader (or folded if they are constants), so the loop only adds
+#   - A mul of a derived induction variable, (phi + / - offset) * factor, becomes an add / sub of the new
+#     phi and offset * factor
+#   - Afterwards, every mul by a power of two becomes an lsh (a mul by 1 is dropped)
+#   The parser compiles / to mul, so there are no divs to reduce (a div by 1 is still dropped). A signed
+#   div by 2^k is not a single shift anyway: a shift rounds toward minus infinity, the div toward zero
+
+import logging
+
+from blocks import BlockNode
+from op_codes import OP
+
+log = logging.getLogger("smpl.induction")
+
+
+class StrengthReduction:
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.induction_variables = 0  # Basic induction variables found
+        self.reduced = 0  # Multiplies replaced by induction variables
+        self.shifts = 0  # Multiplies / divides by powers of two rewritten
+        self.replaced = {}  # Reduced multiply -> instruction replacing its value (rewritten after all loops)
+
+    # Reduce the multiplies in every loop, then the multiplies by powers of two
+    #   Return: (multiplies replaced by induction variables, multiplies / divides by powers of two rewritten)
+    def Run(self) -> tuple:
+        for header in reversed(self.blocks.LoopHeaders()):  # Inner loops first
+            self.ReduceLoop(header)
+        self.blocks.ReplaceUses(self.replaced)
+        self.blocks.RemoveInstructions(self.replaced)
+        self.ReducePowers()
+        log.info(
+            "Strength reduction: %d induction variables, %d multiplies reduced | %d powers of two",
+            self.induction_variables,
+            self.reduced,
+            self.shifts,
+        )
+        return (self.reduced, self.shifts)
+
+    # Return: Value of { value } if it is a const instruction with a number, otherwise None
+    def Constant(self, value):
+        if type(value) is not int or value <= 0:
+            return None
+        instruction = self.blocks.FindInstruction(value)
+        if instruction is None or instruction.op != OP.CONST or type(instruction.a) is not int:
+            return None
+        return instruction.a
+
+    # Return: Value of { a } * { b } made at the end of { block } (a const when both are consts)
+    def Multiply(self, block, a, b) -> int:
+        x, y = self.Constant(a), self.Constant(b)
+        if x is not None and y is not None:
+            return self.blocks.AddConstInstruction(x * y)
+        if x == 1:
+            return b
+        if y == 1:
+            return a
+        return self.blocks.InsertNewInstruction(block, OP.MUL, a, b)
+
+    # Replace the multiplies of induction variables by loop invariants in the loop headed by { header }
+    def ReduceLoop(self, header) -> None:
+        blocks = self.blocks
+        if len(header.preds) != 2:
+            return
+        back = header.pred_kinds.index(BlockNode.EDGE_BACK)
+        body = {block.idx for block in blocks.LoopBlocks(header)}
+
+        def Invariant(value):
+            if type(value) is not int or value <= 0:
+                return False
+            return blocks.FindInstructionBlock(value).idx not in body
+
+        # Basic induction variables: phi -> (init, next, step, add / sub)
+        variables = {}
+        nexts = {}  # next -> phi
+        for instr in header.instructions:
+            instruction = blocks.FindInstruction(instr)
+            if instruction.op != OP.PHI:
+                continue
+            operands = (instruction.a, instruction.b)
+            init, next = operands[1 - back], operands[back]
+            if type(init) is not int or init <= 0 or not Invariant(init) or type(next) is not int or next <= 0:
+                continue
+            update = blocks.FindInstruction(next)
+            if blocks.FindInstructionBlock(next).idx not in body:
+                continue
+            if update.op == OP.ADD and update.a == instr and Invariant(update.b):
+                step = update.b
+            elif update.op == OP.ADD and update.b == instr and Invariant(update.a):
+                step = update.a
+            elif update.op == OP.SUB and update.a == instr and Invariant(update.b):
+                step = update.b
+            else:
+                continue
+            log.debug("BB%d: induction variable %d = phi(%d, %d), step %d", header.idx, instr, init, next, step)
+            variables[instr] = (init, next, step, update.op)
+            nexts[next] = instr
+        if not variables:
+            return
+        self.induction_variables += len(variables)
+        # Derived induction variables: add / sub (phi, invariant) other than next -> (phi, offset, add / sub)
+        derived = {}
+        for block in blocks.LoopBlocks(header):
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if instr in nexts or (instruction.op != OP.ADD and instruction.op != OP.SUB):
+                    continue
+                if instruction.a in variables and Invariant(instruction.b):
+                    derived[instr] = (instruction.a, instruction.b, instruction.op)
+                elif instruction.op == OP.ADD and instruction.b in variables and Invariant(instruction.a):
+                    derived[instr] = (instruction.b, instruction.a, OP.ADD)
+        # Multiplies by loop invariants: (mul, multiplied value, factor)
+        multiplies = []
+        for block in blocks.LoopBlocks(header):
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if instruction.op != OP.MUL or instr in self.replaced:
+                    continue
+                for value, factor in ((instruction.a, instruction.b), (instruction.b, instruction.a)):
+                    if (value in variables or value in nexts or value in derived) and Invariant(factor):
+                        multiplies.append((instr, value, factor))
+                        break
+        if not multiplies:
+            return
+        preheader = blocks.Preheader(header)
+        reduced = {}  # (phi, factor) -> (new phi, its next)
+        replaced = self.replaced
+        for instr, value, factor in multiplies:
+            phi = nexts.get(value, value)
+            if value in derived:
+                phi, offset, op = derived[value]
+            if (phi, factor) not in reduced:
+                reduced[(phi, factor)] = self.NewInductionVariable(header, back, preheader, variables[phi], factor)
+            new_phi, new_next = reduced[(phi, factor)]
+            if value in derived:
+                # (phi +- offset) * factor = new phi +- offset * factor
+                log.debug("%s reduced to an %s of %d", blocks.FindInstruction(instr).toString(), OP.NAMES[op], new_phi)
+                blocks.RewriteInstruction(instr, op, new_phi, self.Multiply(preheader, offset, factor))
+                self.reduced += 1
+                continue
+            replaced[instr] = new_next if value in nexts else new_phi
+            self.reduced += 1
+            log.debug("%s reduced to %d", blocks.FindInstruction(instr).toString(), replaced[instr])
+
+    # Make the induction variable phi(init * factor, next') of loop { header } for induction variable
+    #   { variable } = (init, next, step, add / sub), with next' right after next
+    #   Return: (new phi, next')
+    def NewInductionVariable(self, header, back, preheader, variable, factor) -> tuple:
+        blocks = self.blocks
+        init, next, step, op = variable
+        operands = [self.Multiply(preheader, init, factor), 0]
+        scaled_step = self.Multiply(preheader, step, factor)
+        if back == 0:
+            operands.reverse()
+        phi = blocks.InsertNewInstruction(header, OP.PHI, operands[0], operands[1], 0)
+        block, position = blocks.FindInstructionPosition(next)
+        new_next = blocks.InsertNewInstruction(block, op, phi, scaled_step, position + 1)
+        if back == 0:
+            blocks.FindInstruction(phi).a = new_next
+        else:
+            blocks.FindInstruction(phi).b = new_next
+        return (phi, new_next)
+
+    # Rewrite multiplies by powers of two as shifts, and drop multiplies / divides by 1
+    def ReducePowers(self) -> None:
+        blocks = self.blocks
+        replaced = {}
+        for block in blocks.Blocks():
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if instruction.op == OP.MUL:
+                    candidates = ((instruction.a, instruction.b), (instruction.b, instruction.a))
+                elif instruction.op == OP.DIV:
+                    candidates = ((instruction.a, instruction.b),)
+                else:
+                    continue
+                for value, factor in candidates:
+                    constant = self.Constant(factor)
+                    if constant is None or constant <= 0 or constant & (constant - 1):
+                        continue
+                    if constant == 1:
+                        replaced[instr] = value
+                    elif instruction.op == OP.MUL:
+                        shift = blocks.AddConstInstruction(constant.bit_length() - 1)
+                        log.debug("BB%d: %s becomes lsh", block.idx, instruction.toString())
+                        blocks.RewriteInstruction(instr, OP.LSH, value, shift)
+                    else:
+                        continue
+                    self.shifts += 1
+                    break
+        blocks.ReplaceUses(replaced)
+        blocks.RemoveInstructions(replaced)
@@ -2,24 +2,29 @@
 #
 # Instruction class is a dynamic LinkedList that holds compiler instructions
 
+from array import array
 from op_codes import OP
+import logging
+
+log = logging.getLogger("smpl.instructions")
 
 
 class InstructionNode:
+    __slots__ = ("op", "a", "b", "instr_id", "prev_instr", "next_instr")
+
     def __init__(self):
-        self.op = None
+        self.op = OP.EMPTY
         self.a = 0
         self.b = 0
         self.instr_id = 0
         self.prev_instr = None
         self.next_instr = None
-        self.prev_dom_instr = None
 
     def printInstruction(self):
         print(
             str(self.instr_id)
             + " | "
-            + str(self.op)
+            + str(OP.NAMES[self.op])
             + " "
             + str(self.a)
             + " "
@@ -29,13 +34,13 @@ class InstructionNode:
     # Convert to string for DOT
     def toString(self) -> str:
         s = str(self.instr_id) + ": "
-        if self.op == None:  # Empty block
+        if self.op == OP.EMPTY:  # Empty block
             return s
         elif self.op == OP.CONST:  # Const block
-            s = s + str(self.op) + " #" + str(self.a)
+            s = s + OP.NAMES[self.op] + " #" + str(self.a)
             return s
         else:
-            s = s + str(self.op)
+            s = s + OP.NAMES[self.op]
             if isinstance(self.a, int):
                 if self.a > 0:
                     s = s + " (" + str(self.a) + ")"
@@ -55,6 +60,17 @@ class InstructionList:
         self.head = None
         self.tail = None
         self.next_instr_num = 1
+        self.nodes = [None]  # Instruction id -> InstructionNode (ids are dense, slot 0 unused)
+
+    # Iterate the instructions in the order they were added
+    def __iter__(self):
+        curr_node = self.head
+        while curr_node is not None:
+            yield curr_node
+            curr_node = curr_node.next_instr
+
+    def __len__(self) -> int:
+        return len(self.nodes) - 1
 
     def AddNode(self, op, a, b) -> int:
         node = InstructionNode()
@@ -68,6 +84,7 @@ class InstructionList:
         else:
             self.tail.next_instr = node
         self.tail = node
+        self.nodes.append(node)
         self.next_instr_num += 1
         return node.instr_id
 
@@ -79,11 +96,11 @@ class InstructionList:
 
     # Add an empty instruction (used on new blocks, will replace once done)
     def AddEmptyInstruction(self) -> int:
-        return self.AddInstruction(None, 0, 0)
+        return self.AddInstruction(OP.EMPTY, 0, 0)
 
     # Add an array kill instruction (special: {kill a})
     def AddKillInstruction(self, array) -> int:
-        return self.AddInstruction("kill", array, 0)
+        return self.AddInstruction(OP.KILL, array, 0)
 
     # No check for CSE
     #   Returns: New instr ID for read node
@@ -113,15 +130,38 @@ class InstructionList:
     def AddPhiInstruction(self, a, b) -> int:
         return self.AddNode(OP.PHI, a, b)
 
+    # Keep only instructions { ids } (ascending), renumbered 1..n in the same order
+    #   remap(op, operand) -> operand rewrites the operands of each kept instruction
+    #   The kept nodes are reused, so no node is allocated
+    def Renumber(self, ids, remap) -> None:
+        nodes = [None]
+        prev = None
+        for id in ids:
+            node = self.nodes[id]
+            node.a = remap(node.op, node.a)
+            node.b = remap(node.op, node.b)
+            node.instr_id = len(nodes)
+            node.prev_instr = prev
+            if prev is not None:
+                prev.next_instr = node
+            nodes.append(node)
+            prev = node
+        if prev is not None:
+            prev.next_instr = None
+        self.nodes = nodes
+        self.head = nodes[1] if prev is not None else None
+        self.tail = prev
+        self.next_instr_num = len(nodes)
+
     # Find an instruction by its ID and return the instruction node
     #   Not found: Return None
     def FindInstruction(self, id) -> InstructionNode:
-        curr_node = self.tail
-        while curr_node is not None:
-            if curr_node.instr_id == id:
-                return curr_node
-            curr_node = curr_node.prev_instr
-        print("InstructionList: Did not find ID " + str(id))
+        try:
+            if id > 0:
+                return self.nodes[id]
+        except (TypeError, IndexError):  # Not an instruction id (const value, "#BASE", ...)
+            pass
+        log.debug("InstructionList: Did not find ID %s", id)
         return None
 
     def PrintInstruction(self, id):
@@ -132,7 +172,7 @@ class InstructionList:
             print(
                 str(id)
                 + " | "
-                + str(instr.op)
+                + str(OP.NAMES[instr.op])
                 + " "
                 + str(instr.a)
                 + " "
@@ -150,10 +190,164 @@ class InstructionList:
                 "Node "
                 + str(curr_node.instr_id)
                 + " | "
-                + str(curr_node.op)
+                + str(OP.NAMES[curr_node.op])
                 + " "
                 + str(curr_node.a)
                 + " "
                 + str(curr_node.b)
             )
             curr_node = curr_node.next_instr
+
+
+# Read / write view of one row of a CompactInstructionList
+#   Same interface as InstructionNode, so existing callers work unchanged (not a subclass, so a view only
+#   holds its two slots)
+class InstructionView:
+    __slots__ = ("instr_list", "instr_id")
+
+    printInstruction = InstructionNode.printInstruction
+    toString = InstructionNode.toString
+
+    def __init__(self, instr_list, instr_id):
+        self.instr_list = instr_list
+        self.instr_id = instr_id
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, InstructionView)
+            and other.instr_list is self.instr_list
+            and other.instr_id == self.instr_id
+        )
+
+    def __hash__(self):
+        return hash((id(self.instr_list), self.instr_id))
+
+    @property
+    def op(self):
+        return self.instr_list.ops[self.instr_id]
+
+    @op.setter
+    def op(self, op):
+        self.instr_list.ops[self.instr_id] = op
+
+    @property
+    def a(self):
+        return self.instr_list.GetOperand(self.instr_list.a, self.instr_id)
+
+    @a.setter
+    def a(self, value):
+        self.instr_list.SetOperand(self.instr_list.a, self.instr_id, value)
+
+    @property
+    def b(self):
+        return self.instr_list.GetOperand(self.instr_list.b, self.instr_id)
+
+    @b.setter
+    def b(self, value):
+        self.instr_list.SetOperand(self.instr_list.b, self.instr_id, value)
+
+    @property
+    def prev_instr(self):
+        return self.instr_list.View(self.instr_list.prev[self.instr_id])
+
+    @prev_instr.setter
+    def prev_instr(self, node):
+        self.instr_list.prev[self.instr_id] = node.instr_id if node else 0
+
+    @property
+    def next_instr(self):
+        return self.instr_list.View(self.instr_list.next[self.instr_id])
+
+    @next_instr.setter
+    def next_instr(self, node):
+        self.instr_list.next[self.instr_id] = node.instr_id if node else 0
+
+
+# InstructionList stored as parallel columns ("struct of arrays") instead of one object per instruction
+#   Row i of every column holds instruction id i (row 0 is unused), links hold ids (0 = None)
+#   FindInstruction returns an InstructionView over the row
+class CompactInstructionList(InstructionList):
+    # Operands are stored inline when they fit a signed 64 bit int, otherwise (consts like "a_adr",
+    # "#BASE", floats, ...) the column holds BOXED and the value is kept in the boxed dict
+    BOXED = -(1 << 63)
+    MAX_INLINE = (1 << 63) - 1
+
+    def __init__(self):
+        self.next_instr_num = 1
+        self.head_id = 0
+        self.tail_id = 0
+        self.ops = array("B", [OP.EMPTY])
+        self.a = array("q", [0])
+        self.b = array("q", [0])
+        self.prev = array("l", [0])
+        self.next = array("l", [0])
+        self.boxed = {}  # (0 = a / 1 = b, instr id) -> operand that does not fit a column
+
+    @property
+    def head(self):
+        return self.View(self.head_id)
+
+    @property
+    def tail(self):
+        return self.View(self.tail_id)
+
+    def __iter__(self):
+        id = self.head_id
+        while id:
+            yield InstructionView(self, id)
+            id = self.next[id]
+
+    def __len__(self) -> int:
+        return len(self.ops) - 1
+
+    # View of instruction { id }, or None for id 0
+    def View(self, id):
+        return InstructionView(self, id) if id else None
+
+    def GetOperand(self, column, id):
+        value = column[id]
+        if value == CompactInstructionList.BOXED:
+            return self.boxed[(column is self.b, id)]
+        return value
+
+    def SetOperand(self, column, id, value):
+        key = (column is self.b, id)
+        if type(value) is int and CompactInstructionList.BOXED < value <= CompactInstructionList.MAX_INLINE:
+            column[id] = value
+            self.boxed.pop(key, None)
+        else:
+            column[id] = CompactInstructionList.BOXED
+            self.boxed[key] = value
+
+    def AddNode(self, op, a, b) -> int:
+        id = self.next_instr_num
+        self.ops.append(op)
+        self.a.append(0)
+        self.b.append(0)
+        self.SetOperand(self.a, id, a)
+        self.SetOperand(self.b, id, b)
+        self.prev.append(self.tail_id)
+        self.next.append(0)
+        if self.head_id == 0:
+            self.head_id = id
+        else:
+            self.next[self.tail_id] = id
+        self.tail_id = id
+        self.next_instr_num += 1
+        return id
+
+    # Keep only instructions { ids } (ascending), renumbered 1..n (see InstructionList.Renumber)
+    def Renumber(self, ids, remap) -> None:
+        ops, a, b, boxed = self.ops, self.a, self.b, self.boxed
+        self.__init__()
+        for id in ids:
+            op = ops[id]
+            a_value = boxed[(False, id)] if a[id] == CompactInstructionList.BOXED else a[id]
+            b_value = boxed[(True, id)] if b[id] == CompactInstructionList.BOXED else b[id]
+            self.AddNode(op, remap(op, a_value), remap(op, b_value))
+
+    def FindInstruction(self, id) -> InstructionView:
+        if type(id) is int and 0 < id < self.next_instr_num:
+            return InstructionView(self, id)
+        log.debug("InstructionList: Did not find ID %s", id)
+        return None
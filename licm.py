@@ -0,0 +1,69 @@
+# Author: Brandon Wang
+#
+# Loop-invariant code motion over a finished BlockTree
+#   - Each while join block with a back edge heads a loop, its blocks are found by walking the predecessors
+#     back from the end of the loop body up to the join block
+#   - An add / sub / mul / lsh / cmp / adda is invariant when each of its operands is defined outside of the loop
+#     (consts, values from before the loop) or is invariant itself. These never fault, so they are hoisted
+#     even from a loop that runs zero times or from a branch inside the loop
+#   - Invariant instructions move to the end of the loop's preheader: the block before the loop when it
+#     only leads into the loop, otherwise a new block on the loop entry edge
+#   Inner loops are done first, so what they hoist can move on out of the outer loops
+#   Loads stay in the loop (a store in the loop could change what they read)
+
+import logging
+
+from op_codes import OP
+
+log = logging.getLogger("smpl.licm")
+
+
+class LoopInvariantCodeMotion:
+    # Ops that can be hoisted (no effects, never fault)
+    HOISTABLE = [False] * len(OP.NAMES)
+    for op in (OP.ADD, OP.SUB, OP.MUL, OP.CMP, OP.ADDA, OP.LSH):
+        HOISTABLE[op] = True
+    del op
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.hoisted = {}  # While join block idx -> instructions hoisted out of its loop
+
+    # Hoist the invariant instructions out of every loop
+    #   Return: Number of instructions hoisted (per loop in self.hoisted)
+    def Run(self) -> int:
+        headers = self.blocks.LoopHeaders()
+        for header in reversed(headers):  # Inner loops first
+            count = self.HoistLoop(header)
+            self.hoisted[header.idx] = count
+            log.info("LICM: loop BB%d: hoisted %d instructions", header.idx, count)
+        total = sum(self.hoisted.values())
+        log.info("LICM: hoisted %d instructions out of %d loops", total, len(headers))
+        return total
+
+    # Hoist the invariant instructions of the loop headed by { header } into its preheader
+    #   Return: Number of instructions hoisted
+    def HoistLoop(self, header) -> int:
+        blocks = self.blocks
+        loop = blocks.LoopBlocks(header)
+        body = {block.idx for block in loop}
+        invariant = []
+        hoisted = set()
+        for block in loop:
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if not LoopInvariantCodeMotion.HOISTABLE[instruction.op]:
+                    continue
+                for value in blocks.ValueOperands(instruction):
+                    if value not in hoisted and blocks.FindInstructionBlock(value).idx in body:
+                        break
+                else:
+                    invariant.append(instr)
+                    hoisted.add(instr)
+        if invariant:
+            preheader = blocks.Preheader(header)
+            if log.isEnabledFor(logging.DEBUG):
+                for instr in invariant:
+                    log.debug("BB%d: hoisting %s", preheader.idx, blocks.FindInstruction(instr).toString())
+            blocks.MoveInstructions(invariant, preheader)
+        return len(invariant)
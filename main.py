@@ -1,25 +1,81 @@
 # For 242P - Compilers
 # Author: Brandon Wang
 #
-# 
+#
 
 import argparse
+import logging
+import sys
+from copy_propagation import CopyPropagation
+from dce import DeadCodeElimination
+from gvn import GlobalValueNumbering
+from induction import StrengthReduction
+from licm import LoopInvariantCodeMotion
+from pre import LazyCodeMotion
+from sccp import ConstantPropagation
 from smpl_parser import Parser
 from visualizer import Visualizer
 
+# Logging channels, one per subsystem ("smpl.<channel>")
+CHANNELS = ["tokenizer", "parser", "blocks", "instructions", "dominators", "sccp", "gvn", "pre", "dce", "licm", "induction", "copy", "visualizer"]
+
+# Optimization passes (flag, pass class, help), run over the finished BlockTree in this order
+PASSES = [
+    ("sccp", ConstantPropagation, "sparse conditional constant propagation"),
+    ("gvn", GlobalValueNumbering, "global value numbering, values of both if / else arms hoisted"),
+    ("pre", LazyCodeMotion, "partial redundancy elimination by lazy code motion"),
+    ("licm", LoopInvariantCodeMotion, "hoist loop-invariant instructions into loop preheaders"),
+    ("iv", StrengthReduction, "induction variable strength reduction, shifts for powers of two"),
+    ("copy", CopyPropagation, "copy propagation and trivial phi elimination"),
+    ("dce", DeadCodeElimination, "dead code elimination and CFG simplification"),
+]
+
+
+# Send log messages to stderr so they never mix with the DOT output
+#   verbosity: 0 = warnings and errors, 1 = info, 2 = debug (all channels)
+#   channels: channels to log at debug level regardless of verbosity
+def ConfigureLogging(verbosity, channels):
+    levels = [logging.WARNING, logging.INFO, logging.DEBUG]
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=levels[min(verbosity, len(levels) - 1)],
+        format="%(name)s: %(levelname)s: %(message)s",
+    )
+    for channel in channels:
+        logging.getLogger("smpl." + channel).setLevel(logging.DEBUG)
+
+
 def main():
     # Parse command line arguments
     argparser = argparse.ArgumentParser()
     argparser.add_argument('file', type=str)
+    argparser.add_argument('-o', '--output', type=str, help='write the DOT graph to this file instead of stdout')
+    argparser.add_argument('-v', '--verbose', action='count', default=0, help='-v for info, -vv for debug logging')
+    argparser.add_argument('--debug', action='append', default=[], choices=CHANNELS, help='debug logging for one channel')
+    argparser.add_argument('--compact', action='store_true', help='columnar instruction storage for very large programs')
+    argparser.add_argument('--dom', action='store_true', help='draw dominator tree edges')
+    argparser.add_argument('--finalize', action='store_true', help='release parser state and renumber instructions densely')
+    for flag, _, help in PASSES:
+        argparser.add_argument('--' + flag, action='store_true', help=help)
     args = argparser.parse_args()
+    ConfigureLogging(args.verbose, args.debug)
 
     # Pass file into the parser
-    parser = Parser(args.file)
+    parser = Parser(args.file, compact=args.compact)
     blocks = parser.Parse()
-    viz = Visualizer(blocks)
+    for flag, Pass, _ in PASSES:
+        if getattr(args, flag):
+            Pass(blocks).Run()
+    if args.finalize:
+        blocks.Finalize()
+    viz = Visualizer(blocks, dominators=args.dom)
     viz.Construct()
-    print(viz.Output())
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(viz.Output())
+    else:
+        sys.stdout.write(viz.Output() + "\n")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
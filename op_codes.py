@@ -1,27 +1,78 @@
 # File to hold constants for OP codes
 # Author: Brandon Wang
 
-class OP: 
-    CONST = "const"      
-    ADD = "add"
-    SUB = "sub"
-    MUL = "mul"
-    DIV = "div"
-    CMP = "cmp"
-    ADDA = "adda"
-    LOAD = "load"
-    STORE = "store"
-    PHI = "phi"
-    END = "end"
-    BRA = "bra"
-    BNE = "bne"
-    BEQ = "beq"
-    BLE = "ble"
-    BLT = "blt"
-    BGE = "bge"
-    BGT = "bgt"
-    READ = "read"
-    WRITE = "write"
-    WRITENL = "writeNL"
-
-    DOM_CODES = [CONST, ADD, SUB, MUL, DIV, CMP, ADDA, LOAD, STORE]
\ No newline at end of file
+# Op codes are small ints so properties can be looked up by indexing the tables below
+#   OP.NAMES[op] is the name used when printing (only needed at the output edge)
+class OP:
+    EMPTY = 0  # Placeholder instruction of an empty block
+    CONST = 1
+    ADD = 2
+    SUB = 3
+    MUL = 4
+    DIV = 5
+    CMP = 6
+    ADDA = 7
+    LOAD = 8
+    STORE = 9
+    PHI = 10
+    END = 11
+    BRA = 12
+    BNE = 13
+    BEQ = 14
+    BLE = 15
+    BLT = 16
+    BGE = 17
+    BGT = 18
+    READ = 19
+    WRITE = 20
+    WRITENL = 21
+    KILL = 22  # Array kill (special: {kill a}), stops CSE of loads past it
+    LSH = 23  # Shift left: a << b (strength reduced multiply by a power of two)
+
+    NAMES = [
+        None, "const", "add", "sub", "mul", "div", "cmp", "adda", "load", "store", "phi", "end",
+        "bra", "bne", "beq", "ble", "blt", "bge", "bgt", "read", "write", "writeNL", "kill", "lsh",
+    ]
+
+    # CSE classes: ops with a class are filed in the ValueTable, which scopes each block's lookups to the
+    #   instructions of the blocks it was created from (adda / load / store share the memory class,
+    #   and array kills stop their reuse)
+    CSE_CONST = 0
+    CSE_ADD = 1
+    CSE_SUB = 2
+    CSE_MUL = 3
+    CSE_DIV = 4
+    CSE_CMP = 5
+    CSE_MEMORY = 6
+    CSE_NAMES = ["const", "add", "sub", "mul", "div", "cmp", "load"]
+    NUM_CSE_CLASSES = len(CSE_NAMES)
+
+    # CSE_CLASS[op] = CSE class of op, or -1 if op is never common subexpression eliminated
+    CSE_CLASS = [-1] * len(NAMES)
+    CSE_CLASS[CONST] = CSE_CONST
+    CSE_CLASS[ADD] = CSE_ADD
+    CSE_CLASS[SUB] = CSE_SUB
+    CSE_CLASS[MUL] = CSE_MUL
+    CSE_CLASS[DIV] = CSE_DIV
+    CSE_CLASS[CMP] = CSE_CMP
+    CSE_CLASS[ADDA] = CSE_MEMORY
+    CSE_CLASS[LOAD] = CSE_MEMORY
+    CSE_CLASS[STORE] = CSE_MEMORY
+
+    IS_CSE = [cse_class >= 0 for cse_class in CSE_CLASS]
+
+    # bra and the conditional branches (their target block is operand b, or a for bra)
+    IS_BRANCH = [False] * len(NAMES)
+    for op in (BRA, BNE, BEQ, BLE, BLT, BGE, BGT):
+        IS_BRANCH[op] = True
+
+    # Instructions kept even when their value is unused (effects on memory, input / output and control)
+    HAS_EFFECT = [False] * len(NAMES)
+    for op in (STORE, END, BRA, BNE, BEQ, BLE, BLT, BGE, BGT, READ, WRITE, WRITENL):
+        HAS_EFFECT[op] = True
+
+    # Instructions that touch array memory
+    IS_MEMORY = [False] * len(NAMES)
+    for op in (ADDA, LOAD, STORE, KILL):
+        IS_MEMORY[op] = True
+    del op
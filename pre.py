@@ -0,0 +1,295 @@
+# Author: Brandon Wang
+#
+# Partial redundancy elimination by lazy code motion (Knoop, Ruething and Steffen) over a finished BlockTree
+#   - An expression is an (op, a, b) of add / sub / mul / cmp / adda / lsh. In SSA its operands never
+#     change, so the block defining an operand is the only place that kills it
+#   - Availability (forward) and anticipability (backward) give the earliest edges an expression can be
+#     computed on, and placements are delayed along the edges as long as that saves no computation
+#     (LATER). Expressions are inserted on the edges where a later placement is not possible, and the
+#     first computation of a block is deleted when its value reaches the block on every path
+#   - Inserting on an edge: at the end of its source block if that only leads to the edge's target,
+#     otherwise on a new block splitting the (critical) edge
+#   - The values of a deleted computation come together in new phis, placed only in the join blocks
+#     where the value is needed, and a phi left with one input is dropped again
+#   An expression is only inserted on paths that compute it later anyway, so no path computes more than
+#   before (phis are not computations). Loads are left in place (stores may change what they read)
+
+import logging
+
+from op_codes import OP
+
+log = logging.getLogger("smpl.pre")
+
+
+class LazyCodeMotion:
+    # Ops of the expressions moved (no effects, never fault)
+    EXPRESSION = [False] * len(OP.NAMES)
+    for op in (OP.ADD, OP.SUB, OP.MUL, OP.CMP, OP.ADDA, OP.LSH):
+        EXPRESSION[op] = True
+    # Ops whose operands are sorted, so a + b and b + a are one expression
+    COMMUTATIVE = [False] * len(OP.NAMES)
+    for op in (OP.ADD, OP.MUL):
+        COMMUTATIVE[op] = True
+    del op
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.expressions = {}  # (op, a, b) -> expression index (bit in the bitsets)
+        self.keys = []  # Expression index -> (op, a, b)
+        # Local bitsets of expressions, by block idx
+        self.computed = {}  # Computed in the block (downward exposed, operands never change after)
+        self.exposed = {}  # Computed in the block before any of its operands is defined there (upward exposed)
+        self.killed = {}  # An operand is defined in the block
+        self.available = {}  # Block idx -> bitset of the expressions available on entry, before the rewrite
+        self.removed = 0  # Partially redundant computations deleted (made available by an insertion)
+        self.redundant = 0  # Fully redundant computations deleted (already available on every path)
+        self.inserted = 0  # Computations inserted on edges
+        self.phis = 0  # Phis added for the moved values
+
+    # Move the computations, then delete the redundant ones
+    #   Return: (partially redundant computations removed, computations inserted)
+    def Run(self) -> tuple:
+        blocks = self.blocks
+        order = blocks.ReversePostorder()
+        reached = {block.idx for block in order}
+        if any(pred.idx not in reached for block in order for pred in block.preds):
+            log.info("PRE: skipped, unreachable blocks left (run --sccp / --dce first)")
+            return (0, 0)
+        self.Collect(order)
+        insert, delete = self.Placement(order)
+        if insert or any(delete.values()):
+            self.Rewrite(insert, delete)
+        log.info(
+            "PRE: removed %d partially redundant computations, inserted %d | %d fully redundant, %d phis,"
+            " %d expressions in more than one block",
+            self.removed,
+            self.inserted,
+            self.redundant,
+            self.phis,
+            len(self.keys),
+        )
+        return (self.removed, self.inserted)
+
+    # Return: Expression (op, a, b) computed by { instruction }
+    @staticmethod
+    def Key(instruction) -> tuple:
+        op, a, b = instruction.op, instruction.a, instruction.b
+        if LazyCodeMotion.COMMUTATIVE[op] and type(a) is int and type(b) is int and b < a:
+            a, b = b, a
+        return (op, a, b)
+
+    # Return: Indexes of the bits set in { bits }, lowest first
+    @staticmethod
+    def Bits(bits) -> list:
+        indexes = []
+        while bits:
+            low = bits & -bits
+            indexes.append(low.bit_length() - 1)
+            bits ^= low
+        return indexes
+
+    # Number the expressions and compute the local bitsets of the blocks in { order }
+    def Collect(self, order) -> None:
+        blocks = self.blocks
+        # Only expressions computed in more than one block can be redundant, the others get no bit
+        seen = {}  # (op, a, b) -> idx of the first block computing it
+        for block in order:
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if not LazyCodeMotion.EXPRESSION[instruction.op]:
+                    continue
+                key = self.Key(instruction)
+                first = seen.setdefault(key, block.idx)
+                if first != block.idx and key not in self.expressions:
+                    self.expressions[key] = len(self.keys)
+                    self.keys.append(key)
+        users = {}  # Value -> bitset of the expressions using it
+        for key, index in self.expressions.items():
+            for value in key[1:]:
+                if type(value) is int and value > 0:
+                    users[value] = users.get(value, 0) | 1 << index
+        for block in order:
+            computed = exposed = killed = 0
+            defined = set()
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                index = None
+                if LazyCodeMotion.EXPRESSION[instruction.op]:
+                    index = self.expressions.get(self.Key(instruction))
+                if index is not None:
+                    bit = 1 << index
+                    computed |= bit
+                    if not any(value in defined for value in blocks.ValueOperands(instruction)):
+                        exposed |= bit
+                killed |= users.get(instr, 0)
+                defined.add(instr)
+            self.computed[block.idx] = computed
+            self.exposed[block.idx] = exposed
+            self.killed[block.idx] = killed
+
+    # Lazy code motion dataflow over the blocks in { order } (reverse postorder, the root first)
+    #   Return: (edge (pred idx, succ idx) -> bitset to insert, block idx -> bitset to delete)
+    def Placement(self, order) -> tuple:
+        full = (1 << len(self.keys)) - 1
+        computed, exposed, killed = self.computed, self.exposed, self.killed
+        root = order[0].idx
+        # Available at the end of each block (on every path from the root)
+        avail_out = {block.idx: full for block in order}
+        avail_out[root] = computed[root]
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                avail_in = full
+                for pred in block.preds:
+                    avail_in &= avail_out[pred.idx]
+                new = computed[block.idx] | avail_in & ~killed[block.idx]
+                if new != avail_out[block.idx]:
+                    avail_out[block.idx] = new
+                    changed = True
+        for block in order:
+            avail_in = full if block.preds else 0
+            for pred in block.preds:
+                avail_in &= avail_out[pred.idx]
+            self.available[block.idx] = avail_in
+        # Anticipated at the start / end of each block (computed on every path on, before a kill)
+        ant_in = {block.idx: full for block in order}
+        ant_out = {block.idx: 0 for block in order}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(order):
+                out = full if block.succs else 0
+                for succ in block.succs:
+                    out &= ant_in[succ.idx]
+                ant_out[block.idx] = out
+                new = exposed[block.idx] | out & ~killed[block.idx]
+                if new != ant_in[block.idx]:
+                    ant_in[block.idx] = new
+                    changed = True
+        # Earliest edges to compute each expression on
+        earliest = {}
+        for block in order:
+            for pred in block.preds:
+                bits = ant_in[block.idx] & ~avail_out[pred.idx]
+                if pred.idx != root:
+                    bits &= killed[pred.idx] | ~ant_out[pred.idx]
+                earliest[(pred.idx, block.idx)] = bits
+        # Delay the placements while every path into a block could still compute the expression later
+        later_in = {block.idx: full for block in order}
+        later_in[root] = 0
+        later = {}
+        changed = True
+        while changed:
+            changed = False
+            for block in order:
+                new = full if block.preds else 0
+                for pred in block.preds:
+                    edge = (pred.idx, block.idx)
+                    later[edge] = earliest[edge] | later_in[pred.idx] & ~exposed[pred.idx]
+                    new &= later[edge]
+                if new != later_in[block.idx]:
+                    later_in[block.idx] = new
+                    changed = True
+        insert = {}
+        for edge, bits in later.items():
+            bits &= ~later_in[edge[1]]
+            if bits:
+                insert[edge] = bits
+        delete = {block.idx: exposed[block.idx] & ~later_in[block.idx] for block in order[1:]}
+        return (insert, delete)
+
+    # Insert the computations on their edges, delete the redundant ones and join the values with phis
+    def Rewrite(self, insert, delete) -> None:
+        blocks = self.blocks
+        inserted = {}  # Block idx -> bitset of the expressions inserted at its end
+        for (pred_idx, succ_idx), bits in sorted(insert.items()):
+            pred, succ = blocks.FindBlock(pred_idx), blocks.FindBlock(succ_idx)
+            block = pred if len(pred.succs) == 1 else blocks.SplitEdge(pred, succ)
+            for index in self.Bits(bits):
+                op, a, b = self.keys[index]
+                instr = blocks.InsertNewInstruction(block, op, a, b)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("BB%d: inserted %s", block.idx, blocks.FindInstruction(instr).toString())
+                self.inserted += 1
+            inserted[block.idx] = inserted.get(block.idx, 0) | bits
+        order = blocks.ReversePostorder()  # With the blocks splitting edges
+        # Values needed at the start / end of each block, for a deleted computation on every path on
+        need_in = {block.idx: 0 for block in order}
+        need_out = {block.idx: 0 for block in order}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(order):
+                out = 0
+                for succ in block.succs:
+                    out |= need_in[succ.idx]
+                need_out[block.idx] = out
+                supplied = self.computed.get(block.idx, 0) | inserted.get(block.idx, 0)
+                new = delete.get(block.idx, 0) | out & ~supplied
+                if new != need_in[block.idx]:
+                    need_in[block.idx] = new
+                    changed = True
+        # Value of each needed expression at the start / end of each block
+        entry = {}
+        end = {}
+        phis = []  # (phi, its block, expression index), inputs filled in once every block has its end values
+        replaced = {}
+        for block in order:
+            for index in self.Bits(need_in[block.idx]):
+                if len(block.preds) == 1:
+                    entry[(block.idx, index)] = end[(block.preds[0].idx, index)]
+                else:
+                    phi = blocks.InsertNewInstruction(block, OP.PHI, 0, 0, 0)
+                    phis.append((phi, block, index))
+                    entry[(block.idx, index)] = phi
+            first = {}  # Expression index -> value of its first computation in the block
+            deleted = delete.get(block.idx, 0)
+            available = self.available.get(block.idx, 0)
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                if not LazyCodeMotion.EXPRESSION[instruction.op]:
+                    continue
+                index = self.expressions.get(self.Key(instruction))
+                if index is None:
+                    continue
+                if index in first:
+                    continue  # Computed again in the block, left to CSE
+                if deleted >> index & 1:
+                    replaced[instr] = first[index] = entry[(block.idx, index)]
+                    if available >> index & 1:
+                        self.redundant += 1
+                    else:
+                        self.removed += 1
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("BB%d: %s is redundant", block.idx, instruction.toString())
+                else:
+                    first[index] = instr
+            for index in self.Bits(need_out[block.idx]):
+                end[(block.idx, index)] = first[index] if index in first else entry[(block.idx, index)]
+        for phi, block, index in phis:
+            instruction = blocks.FindInstruction(phi)
+            instruction.a, instruction.b = (end[(pred.idx, index)] for pred in block.preds)
+        # Phis whose inputs turned out to be one value (the same value on every path, around a loop)
+        changed = True
+        while changed:
+            changed = False
+            for phi, block, index in phis:
+                if phi in replaced:
+                    continue
+                instruction = blocks.FindInstruction(phi)
+                inputs = {self.Resolve(replaced, instruction.a), self.Resolve(replaced, instruction.b)}
+                inputs.discard(phi)
+                if len(inputs) == 1:
+                    replaced[phi] = inputs.pop()
+                    changed = True
+        self.phis = sum(phi not in replaced for phi, block, index in phis)
+        blocks.ReplaceUses(replaced)
+        blocks.RemoveInstructions(replaced)
+
+    # Return: Value replacing { value } in { replaced } (chains are followed)
+    @staticmethod
+    def Resolve(replaced, value):
+        while value in replaced:
+            value = replaced[value]
+        return value
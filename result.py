@@ -14,9 +14,12 @@ class Result:
     VAR = 1
     FUNC = 2
 
+    # One Result per factor / operation, so no per-instance dict
+    __slots__ = ("kind", "value", "address", "function", "variables")
+
     def __init__(self):
         self.kind = -1       # Default value -1 to signal that no kind was assigned yet
         self.value = 0       # value if it is a constant
         self.address = 0     # address if it is a variable
         self.function = 0    # ID of function node
-        self.variables = []     
\ No newline at end of file
+        self.variables = 0   # Bitset of the variable slots used (bit 1 << slot, see BlockTree.slots)    
\ No newline at end of file
@@ -0,0 +1,227 @@
+# Author: Brandon Wang
+#
+# Sparse conditional constant propagation (Wegman and Zadeck) over a finished BlockTree
+#   - Instruction values start unknown and are lowered to a constant, then to OVERDEFINED
+#   - Only blocks reached over an executable edge are evaluated, and a branch on a constant only makes
+#     its taken edge executable, so phis ignore the inputs of paths that are never taken
+#   - The IR is then rewritten: constant values replace their instructions, decided branches become
+#     bra (or are dropped), blocks that are never reached are removed and phis left with one
+#     executable input become copies of it
+#   cmp a b is a - b, the conditional branches test it against 0
+
+import logging
+
+from op_codes import OP
+
+log = logging.getLogger("smpl.sccp")
+
+
+class ConstantPropagation:
+    OVERDEFINED = None  # Lattice bottom: not a constant (unknown values are simply not in self.values)
+
+    # Branch op -> taken for cmp value c
+    TAKEN = {
+        OP.BNE: lambda c: c != 0,
+        OP.BEQ: lambda c: c == 0,
+        OP.BLE: lambda c: c <= 0,
+        OP.BLT: lambda c: c < 0,
+        OP.BGE: lambda c: c >= 0,
+        OP.BGT: lambda c: c > 0,
+    }
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.values = {}  # Instruction ID -> constant value or OVERDEFINED (missing = not known yet)
+        self.executable = set()  # Executable edges as (pred idx, succ idx)
+        self.reached = set()  # Idx of the blocks reached over an executable edge
+        self.users = {}
+        self.removed_instructions = 0
+        self.removed_blocks = 0
+        self.folded_branches = 0
+
+    # Analyze and rewrite the IR
+    #   Return: (instructions removed, blocks removed)
+    def Run(self) -> tuple:
+        before = sum(len(block.instructions) for block in self.blocks.Blocks())
+        self.Analyze()
+        self.Rewrite()
+        after = sum(len(block.instructions) for block in self.blocks.Blocks())
+        self.removed_instructions = before - after
+        log.info(
+            "SCCP: removed %d instructions, %d blocks | %d branches decided",
+            self.removed_instructions,
+            self.removed_blocks,
+            self.folded_branches,
+        )
+        return (self.removed_instructions, self.removed_blocks)
+
+    # Lattice value of operand { value } (an instruction ID, or a non-instruction operand like "#BASE")
+    #   Return: Constant, OVERDEFINED, or KeyError if not known yet
+    def Value(self, value):
+        if type(value) is not int or value <= 0:
+            return ConstantPropagation.OVERDEFINED
+        return self.values[value]
+
+    # Propagate constants along the executable edges until nothing changes
+    def Analyze(self) -> None:
+        blocks = self.blocks
+        self.users = blocks.Users()
+        flow = [(None, blocks.root)]  # Edges that became executable
+        ssa = []  # Instructions whose operands changed
+        while flow or ssa:
+            while flow:
+                pred, block = flow.pop()
+                if pred is not None:
+                    edge = (pred.idx, block.idx)
+                    if edge in self.executable:
+                        continue
+                    self.executable.add(edge)
+                if block.idx in self.reached:
+                    # Another way into the block, only its phis can change
+                    for instr in block.instructions:
+                        if blocks.FindInstruction(instr).op == OP.PHI:
+                            self.Visit(block, instr, flow, ssa)
+                    continue
+                self.reached.add(block.idx)
+                for instr in block.instructions:
+                    self.Visit(block, instr, flow, ssa)
+                if not block.instructions or not OP.IS_BRANCH[blocks.FindInstruction(block.instructions[-1]).op]:
+                    for succ in block.succs:
+                        flow.append((block, succ))
+            while ssa and not flow:
+                instr = ssa.pop()
+                block = blocks.FindInstructionBlock(instr)
+                if block is not None and block.idx in self.reached:
+                    self.Visit(block, instr, flow, ssa)
+
+    # Evaluate instruction { instr } of reached block { block }
+    def Visit(self, block, instr, flow, ssa) -> None:
+        instruction = self.blocks.FindInstruction(instr)
+        op = instruction.op
+        OVERDEFINED = ConstantPropagation.OVERDEFINED
+        if OP.IS_BRANCH[op]:
+            if op == OP.BRA:
+                for succ in block.succs:
+                    flow.append((block, succ))
+                return
+            if instruction.a not in self.values:
+                return  # Not known yet
+            condition = self.values[instruction.a]
+            target = self.blocks.FindInstructionBlock(instruction.b)
+            for succ in block.succs:
+                if condition is OVERDEFINED or ConstantPropagation.TAKEN[op](condition) == (succ is target):
+                    flow.append((block, succ))
+            return
+        if op == OP.CONST:
+            new = instruction.a if type(instruction.a) is int else OVERDEFINED  # "<array>_adr" is an address
+        elif op == OP.PHI:
+            new = self.MeetPhi(block, instruction)
+            if new is KeyError:
+                return
+        elif op in (OP.ADD, OP.SUB, OP.MUL, OP.DIV, OP.CMP, OP.LSH):
+            try:
+                a = self.Value(instruction.a)
+                b = self.Value(instruction.b)
+            except KeyError:
+                return
+            new = OVERDEFINED if a is OVERDEFINED or b is OVERDEFINED else self.Fold(op, a, b)
+        elif op in (OP.READ, OP.LOAD, OP.ADDA, OP.STORE):
+            new = OVERDEFINED
+        else:  # write, writeNL, end, kill, empty: no value
+            return
+        old = self.values.get(instr, KeyError)
+        if old is OVERDEFINED or old == new:
+            return
+        if old is not KeyError:
+            new = OVERDEFINED  # Values only move down the lattice: a second, different constant
+        self.values[instr] = new
+        ssa.extend(self.users.get(instr, ()))
+
+    # Meet of the phi's inputs over the executable edges into { block }
+    #   Return: Constant, OVERDEFINED, or KeyError if no input is known yet
+    def MeetPhi(self, block, instruction):
+        result = KeyError
+        for pred, value in zip(block.preds, (instruction.a, instruction.b)):
+            if (pred.idx, block.idx) not in self.executable:
+                continue
+            try:
+                value = self.Value(value)
+            except KeyError:
+                continue
+            if value is ConstantPropagation.OVERDEFINED:
+                return value
+            if result is KeyError:
+                result = value
+            elif result != value:
+                return ConstantPropagation.OVERDEFINED
+        return result
+
+    # Return: Value of { op } on constants { a } and { b }, or OVERDEFINED (division by zero, negative shift)
+    @staticmethod
+    def Fold(op, a, b):
+        if op == OP.ADD:
+            return a + b
+        if op == OP.SUB or op == OP.CMP:
+            return a - b
+        if op == OP.MUL:
+            return a * b
+        if op == OP.LSH:
+            return a << b if b >= 0 else ConstantPropagation.OVERDEFINED
+        if b == 0:
+            return ConstantPropagation.OVERDEFINED
+        quotient = abs(a) // abs(b)  # Truncates toward zero
+        return quotient if (a < 0) == (b < 0) else -quotient
+
+    # Rewrite the IR with the analysis results
+    def Rewrite(self) -> None:
+        blocks = self.blocks
+        blocks.InvalidateOrders()
+        removed = set()
+        replaced = {}  # Instruction ID -> ID replacing its value
+        for block in blocks.Blocks():
+            if block.idx not in self.reached:
+                continue
+            for instr in block.instructions:
+                instruction = blocks.FindInstruction(instr)
+                op = instruction.op
+                if op == OP.PHI:
+                    inputs = [
+                        value
+                        for pred, value in zip(block.preds, (instruction.a, instruction.b))
+                        if (pred.idx, block.idx) in self.executable
+                    ]
+                    if len(inputs) == 1:
+                        replaced[instr] = inputs[0]
+                elif OP.IS_BRANCH[op] and op != OP.BRA:
+                    condition = self.values.get(instruction.a, ConstantPropagation.OVERDEFINED)
+                    if condition is ConstantPropagation.OVERDEFINED:
+                        continue
+                    self.folded_branches += 1
+                    target = blocks.FindInstructionBlock(instruction.b)
+                    if ConstantPropagation.TAKEN[op](condition):
+                        log.debug("BB%d: %s always taken", block.idx, instruction.toString())
+                        for succ in list(block.succs):
+                            if succ is not target:
+                                block.RemoveEdge(succ)
+                        instruction.op = OP.BRA
+                        instruction.a = instruction.b
+                        instruction.b = 0
+                    else:
+                        log.debug("BB%d: %s never taken", block.idx, instruction.toString())
+                        block.RemoveEdge(target)
+                        removed.add(instr)
+                    continue
+                if op == OP.CONST or instr in replaced:
+                    continue
+                value = self.values.get(instr, ConstantPropagation.OVERDEFINED)
+                if value is not ConstantPropagation.OVERDEFINED:
+                    replaced[instr] = blocks.AddConstInstruction(value)
+        # Blocks that are never reached (their values are only used by the phis replaced above)
+        for block in blocks.Blocks():
+            if block.idx not in self.reached:
+                log.debug("BB%d is never reached", block.idx)
+                blocks.RemoveBlock(block)
+                self.removed_blocks += 1
+        blocks.ReplaceUses(replaced)
+        removed.update(replaced)
+        blocks.RemoveInstructions(removed)
@@ -5,6 +5,9 @@ from tokenizer import Tokenizer
 from result import Result
 from instructions import InstructionList, InstructionNode
 from op_codes import OP
+import logging
+
+log = logging.getLogger("smpl.parser")
 
 # Simple recursive descent parser for smpl
 # SSA Format: op | x | y
@@ -20,45 +23,40 @@ from op_codes import OP
 #       Array of pointers that point to the previous instruction
 #       Don't need to explicitly check for dominance
 
-from blocks import BlockTree, BlockNode
+from blocks import BlockTree
 
 
 class Parser:
-    def __init__(self, filename):
-        self.tokenizer = Tokenizer(filename)  # Private tokenizer object
+    # Parse a source file, or program text given directly as str / bytes
+    #   compact: keep instructions in columnar storage (see CompactInstructionList)
+    def __init__(self, filename=None, source=None, compact=False):
+        self.tokenizer = Tokenizer(filename, source)  # Private tokenizer object
         # self.instrList = InstructionList()      # Create LinkedList of instruction nodes
-        self.blocks = BlockTree()
+        self.blocks = BlockTree(compact)
         # Serves as the "current token" that is being read
         self.currToken = 0
         self.inputSym = 0  # Current token on the input
+        self.tokens = self.tokenizer.stream  # (kind, value, line, column) token stream
+        self.line = 0  # Position of the current token on the input
+        self.column = 0
         # Array dict to store sizes of arrays
         self.array_list = {}
+        self.var_slots = {}  # Identifier token value -> slot of the declared variable / array
         self.error = 0  # Internal error code
         self.next()
-        print(
-            "Parser created. First token: "
-            + str(self.tokenizer.Id2String(self.tokenizer.id))
-        )
+        log.debug("Parser created. First token: %s", self.tokenizer.Id2String(self.tokenizer.id))
 
     def next(self):
         self.currToken = self.inputSym  # Update current token
-        self.inputSym = self.tokenizer.GetNext()  # Lookahead 1 token
+        self.inputSym, _, self.line, self.column = next(self.tokens)  # Lookahead 1 token
+        if not log.isEnabledFor(logging.DEBUG):
+            return
         if self.inputSym == Tokenizer.TOKEN_ID:
-            print(
-                "Next (id): "
-                + str(self.tokenizer.id)
-                + ": "
-                + str(self.tokenizer.Id2String(self.tokenizer.id))
-            )
+            log.debug("Next (id): %d: %s", self.tokenizer.id, self.tokenizer.Id2String(self.tokenizer.id))
         elif self.inputSym == Tokenizer.TOKEN_NUM:
-            print("Next (num): " + str(self.tokenizer.val))
+            log.debug("Next (num): %s", self.tokenizer.val)
         else:
-            print(
-                "Next (sym): "
-                + str(self.inputSym)
-                + ": "
-                + str(self.tokenizer.Id2String(self.inputSym))
-            )
+            log.debug("Next (sym): %d: %s", self.inputSym, self.tokenizer.Id2String(self.inputSym))
 
     def CheckFor(self, token):
         if self.inputSym == Tokenizer.TOKEN_ID and self.tokenizer.id == token:
@@ -74,17 +72,19 @@ class Parser:
             )
             self.SyntaxErr(errorMsg)
 
+    # Return: Slot of the variable / array named by the current identifier token
+    def Slot(self) -> int:
+        return self.var_slots[self.tokenizer.id]
+
     def SyntaxErr(self, errMsg):
-        print("Syntax Error: " + errMsg)
+        log.error("Syntax Error (line %d, column %d): %s", self.line, self.column, errMsg)
         self.error = 1
 
     # ---------------------------------------------------------------------------
 
     # Start Parse function, returns the full block tree
     def Parse(self) -> InstructionList:
-        print(
-            "========================== Starting parse ======================================="
-        )
+        log.debug("========================== Starting parse =======================================")
         # Check for 'main' to signal program start
         self.CheckFor(Tokenizer.TOKEN_MAIN)
         # Check for var declarations
@@ -97,7 +97,7 @@ class Parser:
             vars_done = False
             while not vars_done:
                 id = self.tokenizer.id
-                self.blocks.list_of_vars.append(self.tokenizer.Id2String(id))
+                self.var_slots[id] = self.blocks.AddVariable(self.tokenizer.Id2String(id))
                 self.next()
                 if self.inputSym == Tokenizer.TOKEN_COMMA:
                     self.next()
@@ -131,7 +131,7 @@ class Parser:
                 arr_name = self.tokenizer.Id2String(
                     self.tokenizer.id
                 )  # next should be name of the array
-                self.blocks.list_of_vars.append(arr_name)
+                self.var_slots[self.tokenizer.id] = self.blocks.AddVariable(arr_name)
             else:
                 self.SyntaxErr("Array has no name")
                 return
@@ -142,11 +142,11 @@ class Parser:
 
         # Create the block tree
         self.blocks.Create()
-        for vars in self.blocks.list_of_vars:
-            self.blocks.AddSymbol(vars, -1)
+        for slot in range(len(self.blocks.list_of_vars)):
+            self.blocks.AddSymbol(slot, -1)
         if (arr):
             # To designate arrays, assign the var in the symtable to -2
-            self.blocks.AddSymbol(arr_name, -2)
+            self.blocks.AddSymbol(self.blocks.slots[arr_name], -2)
             # Add consts needed for arrays
             self.blocks.AddConstInstruction(4)
             self.blocks.AddConstInstruction(str(arr_name) + "_adr")
@@ -160,19 +160,17 @@ class Parser:
         # Check for end program period
         self.CheckFor(Tokenizer.TOKEN_PERIOD)
         self.blocks.AddEndInstruction()
-        print("--------------------")
-        print("Symbol Table:")
-        print(self.blocks.PrintSymTable())
-        print("--------------------")
-        self.blocks.print()
+        if log.isEnabledFor(logging.DEBUG):
+            self.blocks.PrintSymTable()
+            self.blocks.print()
         # Return the Block Tree
         return self.blocks
 
     # Function should incorporate CSE and Delayed Code Generation
     def Compute(self, op, a, b) -> Result:
-        print("Computing")
+        log.debug("Computing")
         x = Result()
-        x.variables = a.variables + b.variables
+        x.variables = a.variables | b.variables
         if a.kind == Result.CONST and b.kind == Result.CONST:  # CONST op CONST
             x.kind = Result.CONST
             if op == OP.ADD:
@@ -189,8 +187,8 @@ class Parser:
                 self.SyntaxErr("WARNING: Use of un-initialized variable, setting to 0.")
                 a.address = const_zero
             instruction = self.blocks.FindInstruction(a.address)
-            print("VAR op CONST")
-            print(instruction.toString())
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("VAR op CONST: %s", instruction.toString())
             if instruction.op == OP.CONST:
                 x.kind = Result.CONST
                 val = instruction.a
@@ -205,12 +203,10 @@ class Parser:
             else:
                 x.kind = Result.VAR
                 const_addr = self.blocks.AddConstInstruction(b.value)
-                # If assignment uses a variant, create a new instruction without CSE
-                for var in x.variables:
-                    print("")
-                    if self.blocks.current_block.vartable[var] == 1:
-                        x.address = self.blocks.AddInstructionNoCSE(op, a.address, const_addr)
-                        return x
+                # If assignment uses a variant of the current loop, create a new instruction without CSE
+                if self.blocks.LoopVariants() & x.variables:
+                    x.address = self.blocks.AddInstructionNoCSE(op, a.address, const_addr)
+                    return x
                 x.address = self.blocks.AddInstruction(op, a.address, const_addr)
 
         elif a.kind == Result.CONST and b.kind == Result.VAR:  # CONST op VAR
@@ -266,11 +262,11 @@ class Parser:
                 x.address = self.blocks.AddInstruction(op, a.address, b.address)
         else:
             # Should not get here
-            print("Error occured")
+            log.error("Error occured")
         if x.kind == Result.CONST:
-            print("Compute finish (const): " + str(x.value))
+            log.debug("Compute finish (const): %s", x.value)
         if x.kind == Result.VAR:
-            print("Compute finish (Var): " + str(x.address))
+            log.debug("Compute finish (Var): %s", x.address)
         return x
 
     # Parses an entire statement
@@ -279,7 +275,7 @@ class Parser:
             return
         # Begin statements Loop
         while self.inputSym != Tokenizer.TOKEN_END:
-            print("----- Parse statement ----")
+            log.debug("----- Parse statement ----")
             while self.inputSym == Tokenizer.TOKEN_SEMI:
                 self.next()
             # Statements should start with a Token
@@ -293,16 +289,16 @@ class Parser:
                 elif self.tokenizer.id == Tokenizer.TOKEN_WHILE:
                     self.While()
                 elif self.tokenizer.id == Tokenizer.TOKEN_ELSE:
-                    print("Found else, stop statement.")
+                    log.debug("Found else, stop statement.")
                     return
                 elif self.tokenizer.id == Tokenizer.TOKEN_FI:
-                    print("Found fi, stop statement")
+                    log.debug("Found fi, stop statement")
                     return
                 elif self.tokenizer.id == Tokenizer.TOKEN_OD:
-                    print("Found od, stop statement")
+                    log.debug("Found od, stop statement")
                     return
                 else:
-                    print("Error: Statement unknown start: " + str(self.tokenizer.id))
+                    log.error("Error: Statement unknown start: %s", self.tokenizer.id)
                     return
             else:
                 self.SyntaxErr(
@@ -313,7 +309,7 @@ class Parser:
                 )
                 self.error = 1
                 return
-            print("----- End statement ----")
+            log.debug("----- End statement ----")
         return
 
     # Parses an Expression
@@ -367,16 +363,14 @@ class Parser:
                 x.kind = Result.FUNC
                 x.function = self.Function()
                 self.next()
-            elif self.blocks.Lookup(self.tokenizer.Id2String(self.tokenizer.id)) == -2:
+            elif self.blocks.Lookup(self.Slot()) == -2:
                 # Factor is an array
                 arr_name = self.tokenizer.Id2String(self.tokenizer.id)
                 self.next()
                 self.CheckFor(Tokenizer.TOKEN_OPENBRACKET)
                 if self.inputSym == Tokenizer.TOKEN_ID:
                     # Index is a variable
-                    index = self.blocks.Lookup(
-                        self.tokenizer.Id2String(self.tokenizer.id)
-                    )
+                    index = self.blocks.Lookup(self.Slot())
                 else:
                     # Index is a constant
                     index = self.blocks.AddConstInstruction(self.tokenizer.val)
@@ -387,10 +381,9 @@ class Parser:
             else:
                 # Factor is a variable
                 x.kind = Result.VAR
-                x.address = self.blocks.Lookup(
-                    self.tokenizer.Id2String(self.tokenizer.id)
-                )
-                x.variables.append(self.tokenizer.Id2String(self.tokenizer.id))
+                slot = self.Slot()
+                x.address = self.blocks.Lookup(slot)
+                x.variables = 1 << slot
                 self.next()
 
         else:
@@ -404,9 +397,8 @@ class Parser:
         x = Result()
         # DESIGNATOR
         if self.inputSym == Tokenizer.TOKEN_ID:
-            var_id = self.tokenizer.Id2String(self.tokenizer.id)
-            # Mark var as a "variant" in the block (for while blocks)
-            self.blocks.current_block.vartable[var_id] = 1
+            var_id = self.Slot()
+            var_name = self.tokenizer.Id2String(self.tokenizer.id)
             self.next()
             index = 0
             if self.inputSym == Tokenizer.TOKEN_OPENBRACKET:
@@ -414,49 +406,36 @@ class Parser:
                 # Designator is an array
                 if self.inputSym == Tokenizer.TOKEN_ID:
                     # Index is a variable
-                    print("Index is a variable")
-                    index = self.blocks.Lookup(
-                        self.tokenizer.Id2String(self.tokenizer.id)
-                    )
+                    log.debug("Index is a variable")
+                    index = self.blocks.Lookup(self.Slot())
                 else:
                     # Index is a constant
-                    print("Index is a constant")
+                    log.debug("Index is a constant")
                     index = self.blocks.AddConstInstruction(self.tokenizer.val)
                 self.next()
                 self.CheckFor(Tokenizer.TOKEN_CLOSEBRACKET)
             self.CheckFor(Tokenizer.TOKEN_BECOMES)  # <-
             # Parse the expression
             y = self.E()
-            # If any variables were used, assign them in usedvartable
-            for vars in y.variables:
-                self.blocks.current_block.usedvartable[var_id].append(vars)
             # Assign a const
             if y.kind == Result.CONST:
                 id = self.blocks.AddConstInstruction(y.value)
                 # Check if array
                 if self.blocks.Lookup(var_id) == -2:
-                    self.Store(var_id, index, id)
+                    self.Store(var_name, index, id)
+                    self.KillArray(var_name)
                 else:
                     self.blocks.AddSymbol(var_id, id)
-                if len(self.blocks.current_join_blocks) > 0:
-                    self.Phi(var_id)
             # Assign a var address
             elif y.kind == Result.VAR:
                 # Check if array
                 if self.blocks.Lookup(var_id) == -2:
-                    self.Store(var_id, index, y.address)
+                    self.Store(var_name, index, y.address)
+                    self.KillArray(var_name)
                 else:
                     self.blocks.AddSymbol(var_id, y.address)
-                # Phi handling: Implement the phi function described in BrandisMossenbock
-                # Phi steps:
-                #   - When parsing branch, on assignment -> create new phi in join block with phi(new_assignment, backup_value)
-                #           *backup_value is the original assignment
-                #   - Should have a "current join_node pointer" for use that can queue old cur_join_nodes (list with append() and pop())
-                #   - When done and now parsing the "else" statement -> Add / update the phi assignments in the join_block
-                if len(self.blocks.current_join_blocks) > 0:
-                    self.Phi(
-                        var_id
-                    )  # Check if there is a current join block (current block is in a branch)
+                # Phis are not created here: if join blocks get theirs at fi (BlockTree.AddJoinPhis),
+                #   while join blocks on the first read in the loop and at od (BlockTree.SealLoop)
 
             # Read function
             elif y.kind == Result.FUNC:
@@ -467,137 +446,38 @@ class Parser:
             self.SyntaxErr("Let needs a designator")
             return None
 
-    def Phi(self, var):
+    # Array store inside a branch / loop: kill the array in the innermost join block
+    #   (arrays get a kill instead of a phi)
+    def KillArray(self, var):
         orig_block = self.blocks.current_block
         if len(self.blocks.current_join_blocks) > 0:
             join_block = self.blocks.current_join_blocks[0]
-            print("Join block: " + str(join_block.idx))
-            old_block = self.blocks.current_block
+            log.debug("Join block: %d", join_block.idx)
             self.blocks.SetCurrent(join_block)
-            new_value = old_block.symtable[var]
-            # Check if an array first
-            if new_value == -2:  # Array, no phi, use kill instead
-                kill_id = self.blocks.AddKillInstruction(var)
-                self.blocks.current_block.dom_instructions[OP.LOAD].insert(0, kill_id)
-                # Look through block to see if old commands need to be re-built 
-                for i in range(len(self.blocks.current_block.instructions)):
-                    instr = self.blocks.current_block.instructions[i]
-                    curr_instruction = self.blocks.FindInstruction(instr)
-                    a_instr = self.blocks.FindInstruction(curr_instruction.a)
-                    b_instr = self.blocks.FindInstruction(curr_instruction.b)
-                    if a_instr and a_instr.op == OP.LOAD:
-                        print("Found instruction that needs to be reloaded: " + str(curr_instruction.op))
-                        instruction_index = self.blocks.current_block.instructions.index(instr)
-                        id = self.RebuildLoad(curr_instruction.a, join_block, instruction_index)
-                        curr_instruction.a = id
-                        i += 5
-                    if b_instr and b_instr.op == OP.LOAD:
-                        print("Found instruction that needs to be reloaded: " + str(curr_instruction.op))
-                        instruction_index = self.blocks.current_block.instructions.index(instr)
-                        id = self.RebuildLoad(curr_instruction.b, join_block, instruction_index)
-                        curr_instruction.b = id
-                        i += 5
-                    if a_instr and a_instr.op == OP.STORE:
-                        print("Found instruction that needs to be reloaded: " + str(curr_instruction.op))
-                        instruction_index = self.blocks.current_block.instructions.index(instr)
-                        id = self.RebuildStore(curr_instruction.a, join_block, instruction_index)
-                        curr_instruction.a = id
-                        i += 5
-                    if b_instr and b_instr.op == OP.STORE:
-                        print("Found instruction that needs to be reloaded: " + str(curr_instruction.op))
-                        instruction_index = self.blocks.current_block.instructions.index(instr)
-                        id = self.RebuildStore(curr_instruction.b, join_block, instruction_index)
-                        curr_instruction.b = id
-                        i += 5
-                            
-            # Check if in a while loop
-            elif join_block.type == BlockNode.WHILE_JOIN:
-                # 1. Check if a phi insertion is necessary
-                # 2. Insert the phi (No CSE)
-                # 3. Save var's old address before change in step 4
-                # 4. Change join_block symtable so { var : phi_instr }
-                # 5. Change all following instructions that use { var } to the new { phi_instr } address
-                #       a. Instructions in current_join block that use { var } change
-                #       b. Instructions in fall block(s) that use { var } add a new instruction
-                #           - vars that use i --> updated in sym table to the new instruction
-                #           - vars that do not --> left alone
-                if join_block.symtable[var] != orig_block.symtable[var]:
-                    print("WHILE: Inserting Phi into BB" + str(join_block.idx))
-                    if join_block.symtable[var] == -1:  # Unintialized variable used
-                        return
-                    else:
-                        orig_value = join_block.symtable[var]
-                        phi_instr = 0
-                        if self.blocks.current_block.while_phi_idx == 0:
-                            phi_instr = self.blocks.InsertPhiAtFront(
-                                orig_value, new_value
-                            )
-                            self.blocks.current_block.while_phi_idx += 1
-                        else:
-                            phi_instr = self.blocks.InsertPhiAtIndex(
-                                orig_value,
-                                new_value,
-                                self.blocks.current_block.while_phi_idx,
-                            )
-                            self.blocks.current_block.while_phi_idx += 1
-                        print(
-                            "Before: "
-                            + str(var)
-                            + " = "
-                            + str(self.blocks.current_block.symtable[var])
-                        )
-                        self.blocks.AddSymbol(var, phi_instr)
-                        print(
-                            "After: "
-                            + str(var)
-                            + " = "
-                            + str(self.blocks.current_block.symtable[var])
-                        )
-                        self.blocks.ChangeAllSymbols(join_block, orig_value, phi_instr)
-                        for join_b in self.blocks.current_join_blocks:
-                            if join_b.idx == join_block.idx:
-                                continue
-                            if join_b.symtable[var] == -1:
-                                continue
-                            mapped_instr = self.blocks.FindInstruction(join_b.symtable[var])
-                            if mapped_instr.op == OP.PHI:
-                                mapped_instr.b = phi_instr
-                                self.blocks.ChangeAllSymbols(join_b, mapped_instr.instr_id, phi_instr)
-            # Otherwise in a if branch
-            else:
-                for join_block in self.blocks.current_join_blocks:
-                    if join_block.symtable[var] != old_block.symtable[var]:
-                        if (
-                            join_block.symtable[var] == -1
-                        ):  # Local variable initialized in scope of branch
-                            self.blocks.SetCurrent(orig_block)
-                        elif (
-                            self.blocks.FindInstruction(join_block.symtable[var]).op
-                            == OP.PHI
-                        ):
-                            instr = self.blocks.FindInstruction(join_block.symtable[var])
-                            print(
-                                "Modifying Phi at "
-                                + str(instr.instr_id)
-                                + ".b from "
-                                + str(instr.b)
-                                + " to "
-                                + str(new_value)
-                            )
-                            instr.b = new_value
-                            self.blocks.SetCurrent(orig_block)
-                            return
-                        else:
-                            orig_value = join_block.symtable[var]
-                            phi_instr = self.blocks.AddPhiInstruction(new_value, orig_value)
-                            self.blocks.AddSymbol(var, phi_instr)
-                            print(
-                                "IF: Inserting Phi into BB"
-                                + str(join_block.idx)
-                                + " | "
-                                + str(phi_instr)
-                            )
-
+            self.blocks.AddKillInstruction(var)
+            # Look through block to see if old commands need to be re-built
+            instructions = self.blocks.current_block.instructions
+            i = 0
+            while i < len(instructions):
+                instr = instructions[i]
+                curr_instruction = self.blocks.FindInstruction(instr)
+                if curr_instruction.op == OP.PHI:  # Phi operands are the values coming in, not reloaded
+                    i += 1
+                    continue
+                a_instr = self.blocks.FindInstruction(curr_instruction.a)
+                b_instr = self.blocks.FindInstruction(curr_instruction.b)
+                # Uses a load of the array or a stored value: load it again after the kill
+                if a_instr and a_instr.op in (OP.LOAD, OP.STORE):
+                    log.debug("Found instruction that needs to be reloaded: %s", OP.NAMES[curr_instruction.op])
+                    curr_instruction.a = self.RebuildLoad(curr_instruction.a, join_block, i)
+                    self.blocks.values.Rekey(curr_instruction)
+                    i += 4  # { instr } moved past the 4 instructions of the rebuilt load
+                if b_instr and b_instr.op in (OP.LOAD, OP.STORE):
+                    log.debug("Found instruction that needs to be reloaded: %s", OP.NAMES[curr_instruction.op])
+                    curr_instruction.b = self.RebuildLoad(curr_instruction.b, join_block, i)
+                    self.blocks.values.Rekey(curr_instruction)
+                    i += 4
+                i += 1
         self.blocks.SetCurrent(orig_block)
 
     # Process a function (after a call is made)
@@ -675,7 +555,7 @@ class Parser:
         # -----------------------------------------------
         # Create the If / Join blocks
         # print("--------------- Before if call:")
-        print("--- IF --- ")
+        log.debug("--- IF --- ")
         # self.blocks.print()
         old_block = self.blocks.current_block
         fall_block, join_block = self.blocks.AddIfBranch(self.blocks.current_block)
@@ -686,19 +566,23 @@ class Parser:
         self.Statement()
         # End statements, add a branch instruction to link to join block (to be linked later)
         bra_id = self.blocks.AddInstruction(OP.BRA, 0, 0)
+        then_table = self.blocks.current_block.symtable
+        else_table = join_block.symtable  # Without an else, values come straight from the if block
 
         # -----------------------------------------------
 
         if self.tokenizer.id == Tokenizer.TOKEN_ELSE:
-            print("--- ELSE --- ")
+            log.debug("--- ELSE --- ")
             # if / else - Add an else block
             # print("--------------- Before else call:")
             # self.blocks.print()
-            print("=====")
-            print("Old: " + str(old_block.idx))
-            print("Top fall: " + str(fall_block.idx))
-            print("Join: " + str(self.blocks.current_join_blocks[0].idx))
-            print("Current: " + str(self.blocks.current_block.idx))
+            log.debug(
+                "Old: %d | Top fall: %d | Join: %d | Current: %d",
+                old_block.idx,
+                fall_block.idx,
+                self.blocks.current_join_blocks[0].idx,
+                self.blocks.current_block.idx,
+            )
             branch_block = self.blocks.AddElseBranch(
                 old_block,
                 fall_block,
@@ -710,19 +594,21 @@ class Parser:
             self.CheckFor(Tokenizer.TOKEN_ELSE)
             self.blocks.SetCurrent(branch_block)
             self.Statement()
-            if len(branch_block.instructions) == 0:
+            if len(self.blocks.current_block.instructions) == 0:
                 # Add an "empty" instruction as placeholder for the block
-                print("Add empty placeholder block in branch_block")
+                log.debug("Add empty placeholder block in branch_block")
                 self.blocks.AddEmptyInstruction()
+            else_table = self.blocks.current_block.symtable
 
         # -----------------------------------------------
 
         if self.tokenizer.id == Tokenizer.TOKEN_FI:
-            print("--- FI --- ")
+            log.debug("--- FI --- ")
+            self.blocks.AddJoinPhis(join_block, then_table, else_table)
             if len(branch_block.instructions) == 0:
                 self.blocks.SetCurrent(branch_block)
                 # Add an "empty" instruction as placeholder for the block
-                print("Add empty placeholder block in either branch / join block")
+                log.debug("Add empty placeholder block in either branch / join block")
                 self.blocks.AddEmptyInstruction()
             self.CheckFor(Tokenizer.TOKEN_FI)
             self.CheckFor(Tokenizer.TOKEN_SEMI)
@@ -739,8 +625,23 @@ class Parser:
         # Update the current join block
         self.blocks.current_join_blocks.pop(0)
 
+    # Handle while loops: Join block (loop header) -> Fall block (body) -> back to Join block, else Follow block
+    #   The join block stays unsealed (phis are created as variables are read) until od
     def While(self) -> None:
         self.CheckFor(Tokenizer.TOKEN_WHILE)  # WHILE
+        # Look ahead for the variables assigned in the loop (the loop variants)
+        assigned = self.tokenizer.LoopAssignments(self.column)
+        if len(self.blocks.current_block.instructions) == 0:
+            # Add an "empty" instruction as placeholder for the block
+            self.blocks.AddEmptyInstruction()
+        # Create the blocks before parsing (Join block, Fall block, Follow block)
+        join_block, fall_block, follow_block = self.blocks.AddWhileBranch(
+            self.blocks.current_block
+        )
+        self.blocks.OpenLoop(join_block, assigned)
+        # -----------------------------------------------
+        # Parse the compare on the join block, so the condition reads the loop's values
+        self.blocks.SetCurrent(join_block)
         a = self.E()  # expression (LH of compare)
         # relOp (==, !=, <, <=< >, >=)
         relOp = self.inputSym
@@ -757,14 +658,6 @@ class Parser:
         else:
             id_b = b.address
         self.CheckFor(Tokenizer.TOKEN_DO)  # do
-
-        # Create the blocks before parsing (Join block, Fall block, Follow block)
-        join_block, fall_block, follow_block = self.blocks.AddWhileBranch(
-            self.blocks.current_block
-        )
-        # -----------------------------------------------
-        # Parse the branch / cmp instructions on the join block first
-        self.blocks.SetCurrent(join_block)
         cmp_id = self.blocks.AddInstruction(OP.CMP, id_a, id_b)  # Add CMP instruction
         # Start while loop parsing
         op = 0
@@ -786,35 +679,38 @@ class Parser:
         )  # Add RelOp instruction (still need to link second arg)
         # -----------------------------------------------
         # Inside the while loop: parse to fall block
+        fall_block.symtable = join_block.symtable.Snapshot()
         self.blocks.SetCurrent(fall_block)
         self.Statement()
 
         if self.tokenizer.id == Tokenizer.TOKEN_OD:
-            print("--- OD --- ")
+            log.debug("--- OD --- ")
             self.CheckFor(Tokenizer.TOKEN_OD)
             self.CheckFor(Tokenizer.TOKEN_SEMI)
+            # Seal the join block before linking back to it (trivial phis may go away)
+            self.blocks.SealLoop(join_block, self.blocks.current_block.symtable)
             bra_id = self.blocks.AddInstruction(OP.BRA, join_block.instructions[0], 0)
 
         # -----------------------------------------------
         # While loop finished
         self.blocks.SetCurrent(follow_block)
         follow_block.waiting_on = (relOp_id, 1)
-        follow_block.symtable = join_block.symtable.copy()
+        follow_block.symtable = join_block.symtable.Snapshot()
 
         # Update the current join block
         self.blocks.current_join_blocks.pop(0)
 
     def Store(self, arr, index, val):
-        print("Store(" + str(arr) + ", " + str(index) + ", " + str(val) + ")")
+        log.debug("Store(%s, %s, %s)", arr, index, val)
         # First check if arr[index] has already been stored previously
         # Check if const #4 has been created
         elem_size_id = self.blocks.AddConstInstruction(4)
-        print("Position of elem_size_id: " + str(elem_size_id))
+        log.debug("Position of elem_size_id: %s", elem_size_id)
         # Check if the mul to find index has been created
         mul = self.blocks.FindDomInstruction(OP.MUL, index, elem_size_id)
         if mul == 0:
             mul = self.blocks.AddInstruction(OP.MUL, index, elem_size_id)
-        print("Position of mul: " + str(mul))
+        log.debug("Position of mul: %s", mul)
         # Check if the const for the base of arr has been created
         base = self.blocks.AddConstInstruction(str(arr) + "_adr")
         # Check if the add to get base array start has been created
@@ -832,44 +728,21 @@ class Parser:
             if self.blocks.FindInstruction(store).b != val:
                 store = self.blocks.AddInstruction(OP.STORE, adda, val)
         return store
-    
-    # old_store = Old store command to rebuild
-    # block = Block to insert into
-    # idx = Index of block to insert into
-    def RebuildStore(self, old_store, block, idx):
-        store_cmd = self.blocks.FindInstruction(old_store)
-        adda = self.blocks.FindInstruction(store_cmd.a)
-        mul = self.blocks.FindInstruction(adda.a)
-        add = self.blocks.FindInstruction(adda.b)
-    
-        index = self.blocks.FindInstruction(mul.a)
-        val = self.blocks.FindInstruction(store_cmd.b)
-
-        orig_block = self.blocks.current_block
-        self.blocks.SetCurrent(block)
-        new_mul = self.blocks.AddInstructionAtIndex(idx, OP.MUL, index, mul.b)
-        new_add = self.blocks.AddInstructionAtIndex(idx+1, OP.ADD, "#BASE", add.b)
-        new_adda = self.blocks.AddInstructionAtIndex(idx+2, OP.ADDA, new_mul, new_add)
-        new_store = self.blocks.AddInstructionAtIndex(idx+3, OP.STORE, new_adda, val)
-        self.blocks.SetCurrent(orig_block)
-
-        return new_store
-
 
     def Load(self, arr, index) -> int:
         # Check if there is a kill first
 
 
-        print("Load(" + str(arr) + ", " + str(index) + ")")
+        log.debug("Load(%s, %s)", arr, index)
         # First check if arr[index] has already been loaded previously
         # Check if const #4 has been created
         elem_size_id = self.blocks.AddConstInstruction(4)
-        print("Position of elem_size_id: " + str(elem_size_id))
+        log.debug("Position of elem_size_id: %s", elem_size_id)
         # Check if the mul to find index has been created
         mul = self.blocks.FindDomInstruction(OP.MUL, index, elem_size_id)
         if mul == 0:
             mul = self.blocks.AddInstruction(OP.MUL, index, elem_size_id)
-        print("Position of mul: " + str(mul))
+        log.debug("Position of mul: %s", mul)
         # Check if the const for the base of arr has been created
         base = self.blocks.AddConstInstruction(str(arr) + "_adr")
         # Check if the add to get base array start has been created
@@ -902,7 +775,7 @@ class Parser:
         adda = self.blocks.FindInstruction(load_cmd.a)
         mul = self.blocks.FindInstruction(adda.a)
         add = self.blocks.FindInstruction(adda.b)
-        index = self.blocks.FindInstruction(mul.a)
+        index = mul.a
 
         orig_block = self.blocks.current_block
         self.blocks.SetCurrent(block)
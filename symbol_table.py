@@ -0,0 +1,127 @@
+# Author: Brandon Wang
+#
+# SymbolTable is a persistent (structurally shared) map of variable -> instruction id
+#   - A table is a dict of its own bindings on top of a chain of frozen parent layers
+#   - Snapshot() freezes the bindings made so far into a new layer that both tables share,
+#     so creating a block no longer copies every variable
+#   - Chains longer than MAX_DEPTH are collapsed into a single flat layer to keep lookups short
+#   - A loop layer (see Loop) resolves variables that are not bound inside the loop on demand,
+#     so the loop header can create phis lazily until the loop is sealed
+
+
+class SymbolTable:
+    # Collapse the frozen layers into one once a chain gets this deep
+    MAX_DEPTH = 8
+
+    def __init__(self, parent=None):
+        self.parent = parent  # Frozen SymbolTable shared with other tables (None for the first table)
+        self.bindings = {}  # Bindings made on top of the parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.resolve = None  # Loop layer only: resolve(var) -> value, called for vars not bound above it
+
+    def __getitem__(self, var):
+        table = self
+        while table is not None:
+            bindings = table.bindings
+            if var in bindings:
+                return bindings[var]
+            if table.resolve is not None:
+                return table.resolve(var)
+            table = table.parent
+        raise KeyError(var)
+
+    def __setitem__(self, var, value):
+        self.bindings[var] = value
+
+    def __contains__(self, var) -> bool:
+        table = self
+        while table is not None:
+            if var in table.bindings:
+                return True
+            table = table.parent
+        return False
+
+    def get(self, var, default=None):
+        try:
+            return self[var]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self.Flatten())
+
+    def __len__(self) -> int:
+        return len(self.Flatten())
+
+    def __repr__(self) -> str:
+        return repr(self.Flatten())
+
+    # All visible bindings as one dict
+    #   stop: only flatten the layers above this table
+    def Flatten(self, stop=None) -> dict:
+        layers = []
+        table = self
+        while table is not stop:
+            layers.append(table.bindings)
+            table = table.parent
+        flat = {}
+        for bindings in reversed(layers):
+            flat.update(bindings)
+        return flat
+
+    # Freeze the current bindings and return a new table that starts from them
+    #   Later changes to either table are not seen by the other
+    def Snapshot(self):
+        if self.bindings:
+            layer = SymbolTable(self.parent)
+            layer.bindings = self.bindings
+            self.parent = layer
+            self.bindings = {}
+            self.depth = layer.depth + 1
+        if self.parent is not None and self.parent.depth >= SymbolTable.MAX_DEPTH:
+            # Collapse the chain down to the nearest open loop layer; the flat layer is shared the same way
+            barrier = self.parent
+            while barrier is not None and barrier.resolve is None:
+                barrier = barrier.parent
+            layer = SymbolTable(barrier)
+            layer.bindings = self.parent.Flatten(barrier)
+            self.parent = layer
+            self.depth = layer.depth + 1
+        return SymbolTable(self.parent)
+
+    # Start a loop body from the current bindings
+    #   Return: (table for the loop header, loop layer). Reads that reach the loop layer call
+    #   { resolve }(var) until the layer's resolve is cleared (the loop is sealed)
+    def Loop(self, resolve) -> tuple:
+        table = self.Snapshot()
+        layer = SymbolTable(table.parent)
+        layer.resolve = resolve
+        layer.depth = 0  # Collapsing never crosses an open loop layer, so depth restarts here
+        return (SymbolTable(layer), layer)
+
+    # Variables bound differently in { self } and { other }
+    #   Return: Dict of var -> (value in self, value in other)
+    #   Only the layers that are not shared by both tables are looked at
+    def Diff(self, other) -> dict:
+        shared = set()
+        table = other
+        while table is not None:
+            shared.add(id(table))
+            table = table.parent
+        # Layers of self above the first layer shared with other
+        changed = set()
+        common = self
+        while common is not None and id(common) not in shared:
+            changed.update(common.bindings)
+            common = common.parent
+        table = other
+        while table is not common:
+            changed.update(table.bindings)
+            table = table.parent
+        diff = {}
+        for var in changed:
+            mine = self.get(var)
+            theirs = other.get(var)
+            if mine != theirs:
+                diff[var] = (mine, theirs)
+        return diff
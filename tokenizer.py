@@ -45,6 +45,8 @@
 # FileReader.Error =0
 # FileReader.EOF = 255
 
+import re
+
 from filereader import FileReader
 
 # Tokenizer class to tokenize input from FileReader 
@@ -95,7 +97,8 @@ class Tokenizer:
     TOKEN_OUTPUTNUM = 257
     TOKEN_OUTPUTNL = 258
 
-    tokens = [None] * 1000
+    # Reserved token strings, indexed by token value (identifiers are appended per Tokenizer)
+    tokens = [None] * (TOKEN_OUTPUTNL + 1)
     tokens[TOKEN_ERROR] = "error"
     tokens[TOKEN_TIMES] = "*"
     tokens[TOKEN_DIV] = "/"
@@ -138,126 +141,130 @@ class Tokenizer:
     tokens[TOKEN_OUTPUTNUM] = "OutputNum"      # OutputNum(x)
     tokens[TOKEN_OUTPUTNL] = "OutputNewLine"   # OutputNewLine()
 
-   
+    # Reserved token string -> token value
+    keywords = {token: i for i, token in enumerate(tokens) if token is not None}
+
+    # Single / double character symbol -> token value
+    symbols = {token: i for token, i in keywords.items() if not token[0].isalpha()}
+
+    # Scanner DFA as one compiled regex, tried at the current position after skipping blanks:
+    #   group 1 = newline, 2 = number, 3 = identifier / keyword, 4 = symbol
+    SCANNER = re.compile(
+        r"[ \t]*(?:(\n)|(\d+)|([^\W\d_][^\W_]*)|(==|!=|<=|>=|<-|[-*/+<>.,\[\]();{}]))"
+    )
+    BLANKS = re.compile(r"[ \t]*")
+    # Loop look-ahead: nested while / od and the names after let
+    LOOP_SCAN = re.compile(r"\b(?:(while)|(od)|let\s+([^\W\d_][^\W_]*))\b")
+    NEWLINE = 1
+    NUMBER = 2
+    IDENTIFIER = 3
+    SYMBOL = 4
 
-    def __init__(self, filename):
-        self.file_reader = FileReader(filename)     # File reader internal object
+    # Tokenize a source file, or program text given directly as str / bytes
+    def __init__(self, filename=None, source=None):
+        self.file_reader = FileReader(filename, source)     # File reader internal object
         self.error = 0                              # Internal error state
-        self.inputSym = ''                          # Current character on the input 
         self.val = 0                                # last number encountered 
         self.id = 0                                 # last identifier encountered
-        self.id_last_index = 259                    # unused index to add new identifiers 
-        self.next()                                 # Cache front-most char on init
+        self.line = 1                               # line of the last token
+        self.column = 1                             # column of the last token
+        self.line_start = 0                         # buffer position of the line of the last token
+        self.tokens = list(Tokenizer.tokens)        # token value -> string, grows with each new identifier
+        self.token_ids = dict(Tokenizer.keywords)   # string -> token value, for O(1) lookups
+        self.id_last_index = len(self.tokens)       # unused index to add new identifiers 
+        self.stream = self.Tokens()                 # Lazy stream of tokens over the whole buffer
 
-    def next(self) -> str:
-        self.inputSym = self.file_reader.next()
-
-    def GetNext(self) -> int:
-        while (self.inputSym == '' or self.inputSym == ' ' or self.inputSym == '\n' or self.inputSym == '\t'):
-            self.next()
-        if self.inputSym == FileReader.EOF:                 # if input symbol is EOF, return eof
-            return Tokenizer.TOKEN_EOF
-        if self.error == 1:                                 # if Tokenizer.Error() has been called, return error token
-            return Tokenizer.TOKEN_ERROR
-        elif self.inputSym.isnumeric():                     # if input symbol is a number, get the full number, update number variable, and return numberToken
-            self.number()
-            return Tokenizer.TOKEN_NUM
-        elif self.inputSym.isalpha():                       # If input symbol is a letter, check for identifier or if its a reserved keyword, update to id var, and return idToken
-            id_str = self.identifier()
-            token_id = self.String2Id(id_str)
-            if token_id == -1:                              # Token is not found...
-                self.tokens[self.id_last_index] = id_str
-                self.id = self.id_last_index
-                self.id_last_index += 1
-                return Tokenizer.TOKEN_ID                   
-            else:
-                self.id = token_id
-                return Tokenizer.TOKEN_ID                 
-        else:                                               # If not a number or letter, check if its a symbol
-            if (self.inputSym == "="):
-                self.next()
-                if (self.inputSym == "="):
-                    self.next()
-                    return self.TOKEN_EQ
-            elif (self.inputSym == "!"):
-                self.next()
-                if (self.inputSym == "="):
-                    self.next()
-                    return self.TOKEN_NEQ
-            elif (self.inputSym == "<"):
-                self.next()
-                if (self.inputSym == "="):
-                    self.next()
-                    return self.TOKEN_LEQ
-                elif (self.inputSym == "-"):
-                    self.next()
-                    return self.TOKEN_BECOMES
-                else:
-                    return self.TOKEN_LESS
-            elif (self.inputSym == ">"):
-                self.next()
-                if (self.inputSym == "="):
-                    self.next()
-                    return self.TOKEN_GEQ
-                else:
-                    return self.TOKEN_GTR
+    # Generator over the whole buffer yielding (kind, value, line, column) tuples
+    #   kind: token value (TOKEN_ID for identifiers and keywords, TOKEN_NUM for numbers)
+    #   value: id of the identifier / keyword, the number, or 0 for symbols
+    # Updates self.id / self.val as each identifier / number is produced
+    # After the end of the buffer (or an error) TOKEN_EOF (TOKEN_ERROR) is repeated forever
+    def Tokens(self):
+        buffer = self.file_reader.buffer
+        length = self.file_reader.length
+        match = Tokenizer.SCANNER.match
+        token_ids = self.token_ids
+        symbols = Tokenizer.symbols
+        TOKEN_ID, TOKEN_NUM = Tokenizer.TOKEN_ID, Tokenizer.TOKEN_NUM
+        NEWLINE, NUMBER, IDENTIFIER = Tokenizer.NEWLINE, Tokenizer.NUMBER, Tokenizer.IDENTIFIER
+        pos = 0
+        line = 1
+        line_start = 0
+        while True:
+            found = match(buffer, pos)
+            if found is None:
+                break
+            kind = found.lastindex
+            pos = found.end()
+            if kind == IDENTIFIER:
+                text = found.group(kind)
+                id = token_ids.get(text)
+                if id is None:
+                    id = self.InsertVar(text)
+                self.id = id
+                yield (TOKEN_ID, id, line, pos - len(text) - line_start + 1)
+            elif kind == NEWLINE:
+                line += 1
+                line_start = pos
+                self.line_start = pos
+            elif kind == NUMBER:
+                text = found.group(kind)
+                self.val = int(text)
+                yield (TOKEN_NUM, self.val, line, pos - len(text) - line_start + 1)
             else:
-                token_id = self.String2Id(self.inputSym)
-                if token_id == -1:                            # Throw syntax error if also not a symbol
-                    self.Error("Syntax Error")
-                    return Tokenizer.TOKEN_ERROR
-                else:
-                    self.next()
-                    return token_id
-            
+                text = found.group(kind)
+                yield (symbols[text], 0, line, pos - len(text) - line_start + 1)
+        # Either the end of the buffer (after trailing blanks) or a character that starts no token
+        pos = Tokenizer.BLANKS.match(buffer, pos).end()
+        self.file_reader.pos = pos
+        column = pos - line_start + 1
+        if pos < length:
+            self.line, self.column = line, column
+            self.Error(
+                "Syntax Error: unexpected '%s' at line %d, column %d" % (buffer[pos], line, column)
+            )
+            while True:
+                yield (Tokenizer.TOKEN_ERROR, 0, line, column)
+        while True:
+            yield (Tokenizer.TOKEN_EOF, 0, line, column)
 
-            self.next()
-            if (self.inputSym != ' ' and self.inputSym != '\n' and not self.inputSym.isalpha() and not self.inputSym.isnumeric()):
-                sym += self.inputSym
-                print(sym)
-                self.next()
-            token_id = self.String2Id(sym)
-            if token_id == -1:                            # Throw syntax error if also not a symbol
-                self.Error("Syntax Error: ")
-                return Tokenizer.TOKEN_ERROR
+    # Look ahead from the last token (at { column } of its line) to the od closing the current loop
+    #   Return: Set of names assigned with let in the loop (including nested loops / ifs)
+    def LoopAssignments(self, column) -> set:
+        assigned = set()
+        depth = 1
+        for found in Tokenizer.LOOP_SCAN.finditer(self.file_reader.buffer, self.line_start + column - 1):
+            if found.group(1):
+                depth += 1
+            elif found.group(2):
+                depth -= 1
+                if depth == 0:
+                    break
             else:
-                return token_id
+                assigned.add(found.group(3))
+        return assigned
+
+    # Return the next token value (see Tokens() for the full token tuples)
+    def GetNext(self) -> int:
+        kind, value, self.line, self.column = next(self.stream)
+        return kind
 
-    def number(self):
-        self.val = int(self.inputSym)
-        self.next()
-        while (self.inputSym.isnumeric()):
-            if (int(self.inputSym) <= 9 and int(self.inputSym) >= 0):
-                self.val = (10 * self.val) + int(self.inputSym)
-                self.next()
-            else:
-                break
-        
-    def identifier(self) -> str:
-        id_str = self.inputSym
-        while(True):
-            self.next()
-            if (self.inputSym.isalpha() or self.inputSym.isnumeric()):
-                id_str = id_str + self.inputSym
-            else:
-                return id_str
-            
     def Id2String(self, id) -> str:
         if (id == Tokenizer.TOKEN_ID):
             return self.tokens[self.id]
         return self.tokens[id]
 
     def String2Id(self, name) -> int:
-        # print("String2Id")
-        for i, token in enumerate(self.tokens):
-            if token == name:
-                return i
-        return -1
+        return self.token_ids.get(name, -1)
     
     # Insert a variable name into the list of tokens
-    def InsertVar(self, var) -> None:
-        self.tokens[self.id_last_index] = var
+    #   Return: The new token value of the variable
+    def InsertVar(self, var) -> int:
+        id = self.id_last_index
+        self.tokens.append(var)
+        self.token_ids[var] = id
         self.id_last_index += 1
+        return id
 
 
     def Error(self, errorMsg) -> None:
@@ -0,0 +1,132 @@
+# Author: Brandon Wang
+#
+# ValueTable is a scoped hash table used for common subexpression elimination
+#   - Instructions are hashed on (op, a, b), so a CSE probe does not scan earlier instructions
+#   - Every block is a scope. A block sees its own instructions, plus the instructions its parent
+#     scope (the block it was created from) could see at the time the block was created
+#   - Array kills are a barrier: a load / store / adda older than a visible kill is not reused
+
+import bisect
+import logging
+import sys
+
+from op_codes import OP
+
+log = logging.getLogger("smpl.blocks")
+
+
+class ValueTable:
+    # Visible limit of the current scope (everything inserted so far is visible)
+    UNLIMITED = sys.maxsize
+
+    def __init__(self):
+        self.seq = 0  # Insertion counter, orders entries across all scopes
+        self.table = {}  # (op, a, b) -> list of (seq, block idx, instr id), oldest first
+        self.keys = {}  # instr id -> (op, a, b) it is filed under
+        self.seqs = {}  # instr id -> seq of its entry (entries are found by bisecting on it)
+        self.kills = []  # Array kills as (seq, block idx, instr id), oldest first
+        # Scopes, by block idx
+        self.parent = {}  # Parent scope (None for the root)
+        self.start = {}  # seq when the scope was created (parent entries before this are visible)
+        # Active scope path from the root to the block last probed: block idx -> visible seq limit
+        self.path = []
+        self.limit = {}
+
+    # Open a scope for a new { block }, nested in { parent } (None for the root)
+    def AddScope(self, block, parent=None) -> None:
+        self.parent[block.idx] = parent.idx if parent else None
+        self.start[block.idx] = self.seq
+
+    # Make { idx } the active scope, popping / pushing scopes up to the common ancestor
+    def Enter(self, idx) -> None:
+        path = self.path
+        if path and path[-1] == idx:
+            return
+        # Blocks between idx and the first ancestor already on the path
+        chain = []
+        while idx is not None and idx not in self.limit:
+            chain.append(idx)
+            idx = self.parent[idx]
+        while path and path[-1] != idx:
+            del self.limit[path.pop()]
+        # Push the new scopes, each one limits what it sees of its parent
+        for child in reversed(chain):
+            if path:
+                self.limit[path[-1]] = self.start[child]
+            path.append(child)
+            self.limit[child] = ValueTable.UNLIMITED
+        if not chain:
+            self.limit[idx] = ValueTable.UNLIMITED
+
+    def Visible(self, seq, idx) -> bool:
+        limit = self.limit.get(idx)
+        return limit is not None and seq < limit
+
+    # Find an instruction computing (op, a, b) that is visible from { block }
+    #   Return: Instruction id, or 0 if there is none
+    def Find(self, block, op, a, b) -> int:
+        if not OP.IS_CSE[op]:
+            return 0
+        entries = self.table.get((op, a, b))
+        if not entries:
+            return 0
+        self.Enter(block.idx)
+        for seq, idx, id in reversed(entries):
+            if self.Visible(seq, idx):
+                break
+        else:
+            return 0
+        # Memory instructions are only reused if no array kill came after them
+        if OP.IS_MEMORY[op]:
+            for kill_seq, kill_idx, kill_id in reversed(self.kills):
+                if kill_seq < seq:
+                    break
+                if self.Visible(kill_seq, kill_idx):
+                    log.debug("Found kill %d", kill_id)
+                    return 0
+        return id
+
+    # Record instruction { instr } (in { block }) for CSE, if its op can be eliminated
+    def Insert(self, block, instr) -> None:
+        if not OP.IS_CSE[instr.op]:
+            return
+        key = (instr.op, instr.a, instr.b)
+        self.table.setdefault(key, []).append((self.seq, block.idx, instr.instr_id))
+        self.keys[instr.instr_id] = key
+        self.seqs[instr.instr_id] = self.seq
+        self.seq += 1
+
+    # Record an array kill instruction { id } in { block }
+    def Kill(self, block, id) -> None:
+        self.kills.append((self.seq, block.idx, id))
+        self.seq += 1
+
+    # Forget instruction { id }, removed from the IR
+    def Remove(self, id) -> None:
+        key = self.keys.pop(id, None)
+        if key is None:
+            return
+        self.Unfile(key, id)
+        del self.seqs[id]
+
+    # Take the entry of { id } out of the entries of { key }
+    #   Return: The entry
+    def Unfile(self, key, id) -> tuple:
+        entries = self.table[key]
+        i = bisect.bisect_left(entries, (self.seqs[id],))
+        if i == len(entries) or entries[i][2] != id:  # Not where its seq says, look it up
+            i = next(i for i, entry in enumerate(entries) if entry[2] == id)
+        entry = entries.pop(i)
+        if not entries:
+            del self.table[key]
+        return entry
+
+    # Re-file { instr } after its operands were changed in place
+    def Rekey(self, instr) -> None:
+        old_key = self.keys.get(instr.instr_id)
+        key = (instr.op, instr.a, instr.b)
+        if old_key is None or old_key == key:
+            return
+        entry = self.Unfile(old_key, instr.instr_id)
+        bisect.insort(self.table.setdefault(key, []), entry)
+        self.keys[instr.instr_id] = key